@@ -0,0 +1,142 @@
+"""Ingest benchmark against a local postgres (app.config['SQLALCHEMY_DATABASE_URI']).
+
+    python -m bench.ingest_benchmark --rows 10000 100000 1000000 --dirty-key-rate 0.05
+
+For each row count a synthetic roster (see bench.roster) is written to data/ and
+ingested the way /processUpload does it, phase by phase. Each ingest runs in a
+fresh process so its peak RSS is its own. One json object per run is appended to
+the results file, tagged with the git commit, so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing import get_context
+
+from bench.roster import write_roster_csv
+
+DEFAULT_ROW_COUNTS = (10_000, 100_000, 1_000_000, 10_000_000)
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results.jsonl")
+ROSTER_DIR = "data"
+
+
+@contextmanager
+def _timed(phases: dict, phase: str):
+    start = time.perf_counter()
+    yield
+    phases[phase] = time.perf_counter() - start
+
+
+def _peak_rss_bytes() -> int:
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_ingest(roster_path: str, keep: bool = False) -> dict:
+    """Ingest the roster at `roster_path` as an upload would be; timings per phase."""
+    from app import (
+        app,
+        MIME_SNIFF_BYTES,
+        _remove_upload_file,
+        _save_file_contents,
+        _store_upload,
+        get_buffer_mime_type,
+        get_storage_path,
+    )
+    from ingest.upload_stream import UploadStream
+    from instrumentation.timing import collect_upload_timings
+
+    phases = {}
+    with app.app_context(), open(roster_path, "rb") as stream, collect_upload_timings() as timings:
+        upload = UploadStream(stream, get_storage_path("data/processed"))
+        with _timed(phases, "sniff_mime_type"):
+            mime_type = get_buffer_mime_type(upload.peek(MIME_SNIFF_BYTES))
+        with _timed(phases, "store_upload"):
+            upload_file, duplicate = _store_upload(upload, os.path.basename(roster_path), mime_type)
+        if duplicate:
+            # nothing is parsed for bytes that were uploaded before, so there'd be nothing to time
+            raise RuntimeError(f"{roster_path} is already uploaded, e.g. kept by an earlier run with --keep")
+        with _timed(phases, "save_file_contents"), open(upload_file.stored_file_path, "rb") as stored_file:
+            file_content = _save_file_contents(stored_file, upload_file)
+
+        content_load = file_content.last_content_load
+        result = {
+            "rows": file_content.record_count,
+            "phases": phases,
+            "bulk_load_method": content_load.method if content_load else None,
+            "bulk_load_seconds": content_load.seconds if content_load else None,
+            "peak_rss_bytes": _peak_rss_bytes(),
+            # the finer phases inside the ones above, and sql totals
+            "upload_timings": timings.to_dict(),
+        }
+        if not keep:
+            _remove_upload_file(upload_file)
+    return result
+
+
+def benchmark(rows: int, dirty_key_rate: float, seed: int, keep: bool) -> dict:
+    roster_path = os.path.join(ROSTER_DIR, f"bench-roster-{rows}-{dirty_key_rate}-{seed}.csv")
+    generate_seconds = None
+    if not os.path.exists(roster_path):
+        start = time.perf_counter()
+        write_roster_csv(roster_path, rows, dirty_key_rate, seed)
+        generate_seconds = time.perf_counter() - start
+
+    # a fresh process per run, so peak RSS isn't the high-water mark of an earlier one
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        result = executor.submit(run_ingest, roster_path, keep).result()
+
+    ingest_seconds = sum(result["phases"].values())
+    result.update(
+        commit=_git_commit(),
+        run_utc=datetime.utcnow().isoformat(),
+        dirty_key_rate=dirty_key_rate,
+        seed=seed,
+        file_size_bytes=os.path.getsize(roster_path),
+        generate_seconds=generate_seconds,
+        ingest_seconds=ingest_seconds,
+        rows_per_second=result["rows"] / ingest_seconds if ingest_seconds else None,
+    )
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROW_COUNTS)
+    parser.add_argument("--dirty-key-rate", type=float, default=0.05,
+                        help="share of key values padded with whitespace or lowercased")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH,
+                        help="json lines file results are appended to")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the ingested uploads instead of deleting them after each run")
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        result = benchmark(rows, args.dirty_key_rate, args.seed, args.keep)
+        with open(args.results, "a") as results_file:
+            results_file.write(json.dumps(result) + "\n")
+        print(
+            f"{rows:>10} rows  {result['ingest_seconds']:8.2f}s  {result['rows_per_second']:10.0f} rows/s"
+            f"  peak rss {result['peak_rss_bytes'] / 2 ** 20:8.1f} MiB",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Synthetic employee rosters for ingest benchmarks.
+
+Rows are drawn from the rows of data/processed/employee-test.csv, so a roster has
+the same 62 columns and realistic values, and then given unique Employee IDs and
+Manager Employee IDs that point at earlier employees. A `dirty_key_rate` share of
+each key column is made dirty the way real uploads are: padded with whitespace or
+lowercased, which KeyNormalizer has to undo.
+"""
+import os
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from models.FileContent import KEY_COLUMNS
+
+TEMPLATE_ROSTER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "processed", "employee-test.csv"
+)
+# rows generated and written at a time, so 10M row rosters don't need 10M rows in memory
+ROSTER_CHUNK_ROWS = 100_000
+
+
+def read_template_roster(path: str = TEMPLATE_ROSTER_PATH) -> pd.DataFrame:
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def _employee_ids(positions: np.ndarray) -> pd.Series:
+    # letters in the ids so that lowercasing dirties them
+    return "E" + pd.Series(positions).astype(str).str.zfill(7)
+
+
+def _dirty_keys(values: pd.Series, rng: np.random.Generator, dirty_key_rate: float) -> pd.Series:
+    dirty = (rng.random(values.shape[0]) < dirty_key_rate) & (values != "").to_numpy()
+    padded = dirty & (rng.random(values.shape[0]) < 0.5)
+    lowered = dirty & ~padded
+    values = values.copy()
+    values[padded] = "  " + values[padded] + " "
+    values[lowered] = values[lowered].str.lower()
+    return values
+
+
+def generate_roster(
+    rows: int,
+    start: int = 0,
+    dirty_key_rate: float = 0.0,
+    seed: int = 0,
+    template: pd.DataFrame = None,
+) -> pd.DataFrame:
+    """Rows `start` to `start + rows - 1` of a synthetic roster, as text like read_csv(dtype=str).
+
+    The same `start`, `seed` and template always give the same rows, so a roster can
+    be generated chunk by chunk.
+    """
+    template = read_template_roster() if template is None else template
+    rng = np.random.default_rng([seed, start])
+    roster = template.iloc[rng.integers(0, template.shape[0], rows)].reset_index(drop=True)
+
+    positions = np.arange(start, start + rows)
+    roster["Employee ID"] = _employee_ids(positions)
+    # everyone but the first employee reports to someone listed before them
+    manager_positions = (rng.random(rows) * positions).astype(np.int64)
+    roster["Manager Employee ID"] = _employee_ids(manager_positions).where(positions > 0, "")
+
+    for column in KEY_COLUMNS:
+        roster[column] = _dirty_keys(roster[column], rng, dirty_key_rate)
+    return roster
+
+
+def iter_roster_chunks(
+    rows: int,
+    dirty_key_rate: float = 0.0,
+    seed: int = 0,
+    chunk_rows: int = ROSTER_CHUNK_ROWS,
+) -> Iterator[pd.DataFrame]:
+    template = read_template_roster()
+    for start in range(0, rows, chunk_rows):
+        yield generate_roster(min(chunk_rows, rows - start), start, dirty_key_rate, seed, template)
+
+
+def write_roster_csv(path: str, rows: int, dirty_key_rate: float = 0.0, seed: int = 0) -> None:
+    with open(path, "w", newline="") as roster_file:
+        for position, chunk in enumerate(iter_roster_chunks(rows, dirty_key_rate, seed)):
+            chunk.to_csv(roster_file, header=position == 0, index=False)
@@ -0,0 +1,120 @@
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from instrumentation.timing import time_phase
+
+# transforms a KeyRule can apply to a column
+STRIP = "strip"
+UPPER = "upper"
+COLLAPSE_WHITESPACE = "collapse_whitespace"
+ZERO_PAD = "zero_pad"
+MAP = "map"
+
+
+class KeyRule(NamedTuple):
+    """A single cleaning step: apply `transform` to every value of `column`."""
+    column: str
+    transform: str
+    # only used by ZERO_PAD: the width to left-pad values to with zeros
+    width: Optional[int] = None
+    # only used by MAP: value -> replacement; values not in it are kept
+    mapping: Optional[Mapping[str, str]] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.column}:{self.transform}"
+
+
+def _zero_pad(values: pd.Series, rule: KeyRule) -> pd.Series:
+    if rule.width is None:
+        raise ValueError(f"Rule {rule.name} needs a width to zero pad to.")
+    # leave blank keys blank rather than turning them into all zeros
+    return values.where(values == "", values.str.pad(rule.width, side="left", fillchar="0"))
+
+
+def _map(values: pd.Series, rule: KeyRule) -> pd.Series:
+    if rule.mapping is None:
+        raise ValueError(f"Rule {rule.name} needs a mapping to map values with.")
+    mapped = values.map(rule.mapping)
+    return mapped.where(mapped.notna(), values)
+
+
+_TRANSFORMS: Dict[str, Callable[[pd.Series, KeyRule], pd.Series]] = {
+    STRIP: lambda values, rule: values.str.strip(),
+    UPPER: lambda values, rule: values.str.upper(),
+    COLLAPSE_WHITESPACE: lambda values, rule: values.str.replace(r"\s+", " ", regex=True),
+    ZERO_PAD: _zero_pad,
+    MAP: _map,
+}
+
+
+# Employee ID is the employees' primary key; Job Code and Manager Employee ID are
+# foreign keys into job codes and employees respectively.
+DEFAULT_KEY_RULES = (
+    KeyRule("Employee ID", STRIP),
+    KeyRule("Employee ID", UPPER),
+    KeyRule("Job Code", STRIP),
+    KeyRule("Job Code", UPPER),
+    KeyRule("Manager Employee ID", STRIP),
+    KeyRule("Manager Employee ID", UPPER),
+)
+
+
+class KeyNormalizer:
+    """Applies a set of KeyRules to data frames, column by column.
+
+    Rules are grouped by column and applied in the order given. Each column is
+    factorized first, so the string transforms only run over its distinct values
+    (keys repeat a lot: every employee of a job shares its Job Code) and the
+    cleaned values are mapped back onto the rows with a single take.
+
+    `change_counts` accumulates, per rule name, the number of rows that rule changed
+    across every frame passed through the normalizer, so one instance can be used
+    for all the chunks of a streamed upload.
+    """
+
+    def __init__(self, rules: Iterable[KeyRule] = DEFAULT_KEY_RULES):
+        self.rules = list(rules)
+        for rule in self.rules:
+            if rule.transform not in _TRANSFORMS:
+                raise ValueError(f"Unknown key normalization transform: {rule.transform}")
+
+        self._rules_by_column: Dict[str, List[KeyRule]] = {}
+        for rule in self.rules:
+            self._rules_by_column.setdefault(rule.column, []).append(rule)
+
+        self.change_counts = Counter({rule.name: 0 for rule in self.rules})
+
+    def __call__(self, frame: pd.DataFrame) -> pd.DataFrame:
+        columns_to_clean = [c for c in self._rules_by_column if c in frame.columns]
+        if not columns_to_clean:
+            return frame
+
+        frame = frame.copy(deep=False)
+        with time_phase("normalize_keys"):
+            for column in columns_to_clean:
+                frame[column] = self._normalize_column(frame[column], self._rules_by_column[column])
+        return frame
+
+    def _normalize_column(self, values: pd.Series, rules: List[KeyRule]) -> pd.Series:
+        codes, uniques = pd.factorize(values)
+        if len(uniques) == 0:
+            return values
+        uniques = pd.Series(uniques, dtype=object).astype(str)
+        # rows per distinct value, to turn "distinct values changed" into "rows changed"
+        row_counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+        for rule in rules:
+            transformed = _TRANSFORMS[rule.transform](uniques, rule)
+            changed = (transformed != uniques).to_numpy()
+            self.change_counts[rule.name] += int(row_counts[changed].sum())
+            uniques = transformed
+
+        cleaned = uniques.to_numpy().take(codes)
+        if (codes < 0).any():
+            # factorize codes missing values as -1; keep them missing
+            cleaned = np.where(codes < 0, None, cleaned)
+        return pd.Series(cleaned, index=values.index, name=values.name)
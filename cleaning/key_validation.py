@@ -0,0 +1,81 @@
+import logging
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from extensions import db
+from models.FileContent import FileContent, RECORD_IDS_HEADER, quote_in_text
+from models.KeyViolation import KeyViolation
+
+logger = logging.getLogger(__name__)
+
+
+class KeyCheck(NamedTuple):
+    """Every non-blank value of `column` must appear in `reference_column`.
+
+    `reference_column` is a column of `reference_table` ("schema.table" or "table")
+    when one is given, and a column of the same file's content otherwise.
+    """
+    column: str
+    reference_column: str
+    reference_table: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.column}->{self.reference_table or 'content'}.{self.reference_column}"
+
+
+# a manager has to be an employee of the same roster; blank means no manager
+DEFAULT_KEY_CHECKS = (
+    KeyCheck("Manager Employee ID", "Employee ID"),
+)
+
+
+def _reference_relation(file_content: FileContent, check: KeyCheck) -> str:
+    if check.reference_table is None:
+        return file_content.content_relation("reference")
+    quote = quote_in_text
+    table_name = ".".join(quote(part) for part in check.reference_table.split("."))
+    return f"{table_name} AS reference"
+
+
+def validate_keys(file_content: FileContent, checks: Iterable[KeyCheck] = DEFAULT_KEY_CHECKS) -> Dict[str, int]:
+    """Record every key of `file_content` without a match in its reference as a KeyViolation.
+
+    Each check is one anti-join inside the database (INSERT ... SELECT ... WHERE NOT
+    EXISTS), which postgres runs as a hash or index anti-join over the whole column;
+    no rows come back to python. Violations from an earlier run are replaced.
+    Checks on columns the content doesn't have are skipped. Returns the number of
+    violations per check name.
+    """
+    quote = quote_in_text
+    violation_counts = {}
+    with db.engine.begin() as connection:
+        connection.execute(
+            KeyViolation.__table__.delete().where(KeyViolation.file_content_id == file_content.id)
+        )
+        for check in checks:
+            if check.column not in file_content.content_headers:
+                continue
+            if check.reference_table is None and check.reference_column not in file_content.content_headers:
+                continue
+            column = f"content.{quote(check.column)}"
+            result = connection.execute(
+                text(
+                    "INSERT INTO key_violation (file_content_id, check_name, column_name, record_id, value)"
+                    f" SELECT :file_content_id, :check_name, :column_name, content.{quote(RECORD_IDS_HEADER)}, {column}"
+                    f" FROM {file_content.content_relation('content')}"
+                    f" WHERE {column} IS NOT NULL AND {column} <> ''"
+                    f" AND NOT EXISTS (SELECT 1 FROM {_reference_relation(file_content, check)}"
+                    f" WHERE reference.{quote(check.reference_column)} = {column})"
+                ),
+                file_content_id=file_content.id,
+                check_name=check.name,
+                column_name=check.column,
+            )
+            violation_counts[check.name] = result.rowcount
+            if result.rowcount:
+                logger.info(
+                    "%d values of %s of %s have no match", result.rowcount, check.column, file_content.id
+                )
+    return violation_counts
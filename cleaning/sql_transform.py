@@ -0,0 +1,116 @@
+"""KeyRules applied to content already in the database, as set-based UPDATEs.
+
+KeyNormalizer cleans frames in pandas on their way in. For content that is already
+loaded, the same rules compile to sql instead, e.g. STRIP then UPPER on Job Code is
+
+    UPDATE ... SET "Job Code" = upper(btrim(content."Job Code", :whitespace))
+
+with every rule of a column nested into one expression and every column of a
+content table set by one UPDATE, so nothing is read back into python.
+"""
+import json
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+from extensions import db
+from models.FileContent import FileContent
+from cleaning.key_normalization import (
+    COLLAPSE_WHITESPACE,
+    DEFAULT_KEY_RULES,
+    MAP,
+    STRIP,
+    UPPER,
+    ZERO_PAD,
+    KeyRule,
+)
+
+logger = logging.getLogger(__name__)
+
+# what STRIP removes; str.strip() also strips non-ascii whitespace, which uploads don't have in keys
+WHITESPACE = " \t\n\r\x0b\x0c"
+
+
+def _rule_sql(rule: KeyRule, value: str, parameter: str) -> Tuple[str, dict]:
+    """sql for `rule` applied to the sql `value`, and the bind parameters it uses."""
+    if rule.transform == STRIP:
+        return f"btrim({value}, :whitespace)", {"whitespace": WHITESPACE}
+    if rule.transform == UPPER:
+        return f"upper({value})", {}
+    if rule.transform == COLLAPSE_WHITESPACE:
+        return f"regexp_replace({value}, '\\s+', ' ', 'g')", {}
+    if rule.transform == ZERO_PAD:
+        if rule.width is None:
+            raise ValueError(f"Rule {rule.name} needs a width to zero pad to.")
+        # lpad also truncates; like the pandas transform, leave blank and long enough values be
+        return (
+            f"CASE WHEN {value} = '' OR length({value}) >= {int(rule.width)}"
+            f" THEN {value} ELSE lpad({value}, {int(rule.width)}, '0') END"
+        ), {}
+    if rule.transform == MAP:
+        if rule.mapping is None:
+            raise ValueError(f"Rule {rule.name} needs a mapping to map values with.")
+        # the mapping is bound as one jsonb object, however many values it has
+        return (
+            f"coalesce(CAST(:{parameter} AS jsonb) ->> {value}, {value})",
+            {parameter: json.dumps(dict(rule.mapping))},
+        )
+    raise ValueError(f"Unknown key normalization transform: {rule.transform}")
+
+
+def compile_rules(rules: Iterable[KeyRule]) -> Tuple[Dict[str, str], dict]:
+    """Column -> sql expression over {value} applying the column's rules in order, and their bind parameters."""
+    expressions = {}
+    parameters = {}
+    for position, rule in enumerate(rules):
+        expression = expressions.get(rule.column, "{value}")
+        # ZERO_PAD and MAP repeat their input, which is cheap next to writing the row
+        expression, rule_parameters = _rule_sql(rule, expression, f"mapping_{position}")
+        expressions[rule.column] = expression
+        parameters.update(rule_parameters)
+    return expressions, parameters
+
+
+def transform_contents(
+    file_contents: Iterable[FileContent], rules: Iterable[KeyRule] = DEFAULT_KEY_RULES
+) -> Dict[str, int]:
+    """Apply `rules` to the content of every FileContent of `file_contents`, inside the database.
+
+    All the UPDATEs run in one transaction, so either every content is transformed
+    or none is. Before it, contents stored as deltas, or with versions stored as
+    deltas of them, are stored in full (see FileContent.prepare_sql_update), each
+    committed on its own; that changes how they're stored, not their values.
+    Rules on columns a content doesn't have, or doesn't store as text, are skipped
+    for it. Cached content and sidecars are refreshed only in the columns
+    that were transformed, and only for contents where some row changed. Returns the
+    number of rows changed per FileContent id.
+    """
+    rules = list(rules)
+    file_contents = list(file_contents)
+    content_rules = {
+        file_content: [
+            rule for rule in rules
+            if rule.column in file_content.content_headers and file_content.is_text_column(rule.column)
+        ]
+        for file_content in file_contents
+    }
+    for file_content in file_contents:
+        if content_rules[file_content]:
+            file_content.prepare_sql_update()
+
+    updated_columns: Dict[FileContent, List[str]] = {}
+    row_counts = {}
+    with db.engine.begin() as connection:
+        for file_content in file_contents:
+            if not content_rules[file_content]:
+                row_counts[str(file_content.id)] = 0
+                continue
+            expressions, parameters = compile_rules(content_rules[file_content])
+            result = connection.execute(file_content.sql_column_update(expressions), **parameters)
+            row_counts[str(file_content.id)] = result.rowcount
+            if result.rowcount:
+                updated_columns[file_content] = list(expressions)
+                logger.info("transformed %d rows of %s", result.rowcount, file_content.id)
+
+    for file_content, columns in updated_columns.items():
+        file_content.refresh_cached_columns(columns)
+    return row_counts
@@ -0,0 +1,25 @@
+"""Add upload_file phase_timings
+
+Revision ID: 2b8d6e0f5a17
+Revises: d41f07a9c3e2
+Create Date: 2026-10-18 18:40:52.661307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '2b8d6e0f5a17'
+down_revision = 'd41f07a9c3e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('upload_file', sa.Column('phase_timings', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade():
+    op.drop_column('upload_file', 'phase_timings')
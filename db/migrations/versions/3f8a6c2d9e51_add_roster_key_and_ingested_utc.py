@@ -0,0 +1,30 @@
+"""Add upload_file roster_key and file_content ingested_utc
+
+Revision ID: 3f8a6c2d9e51
+Revises: b9e3f1a7c5d2
+Create Date: 2026-10-19 10:12:44.903118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a6c2d9e51'
+down_revision = 'b9e3f1a7c5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('upload_file', sa.Column('roster_key', sa.String(), nullable=True))
+    op.create_index('ix_upload_file_roster_key', 'upload_file', ['roster_key'])
+    op.add_column('file_content', sa.Column('ingested_utc', sa.TIMESTAMP(timezone=True), nullable=True))
+    # content already in the database was loaded in full; a failed ingest removes its content
+    op.execute("UPDATE file_content SET ingested_utc = modified_utc")
+
+
+def downgrade():
+    op.drop_column('file_content', 'ingested_utc')
+    op.drop_index('ix_upload_file_roster_key', table_name='upload_file')
+    op.drop_column('upload_file', 'roster_key')
@@ -0,0 +1,24 @@
+"""Add file_content sidecar_path
+
+Revision ID: 45b1e56f33fa
+Revises: beba4916d220
+Create Date: 2026-10-18 15:05:31.274420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '45b1e56f33fa'
+down_revision = 'beba4916d220'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('file_content', sa.Column('sidecar_path', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('file_content', 'sidecar_path')
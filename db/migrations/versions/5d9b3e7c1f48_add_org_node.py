@@ -0,0 +1,46 @@
+"""Add org_node table
+
+Revision ID: 5d9b3e7c1f48
+Revises: c83f5d2e6a41
+Create Date: 2026-10-18 21:12:07.318524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9b3e7c1f48'
+down_revision = 'c83f5d2e6a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('org_node',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('file_content_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('employee_id', sa.String(), nullable=False),
+        sa.Column('manager_employee_id', sa.String(), nullable=True),
+        sa.Column('record_id', sa.String(), nullable=False),
+        sa.Column('preorder', sa.INTEGER(), nullable=True),
+        sa.Column('subtree_end', sa.INTEGER(), nullable=True),
+        sa.Column('depth', sa.INTEGER(), nullable=True),
+        sa.Column('path', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('issue', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['file_content_id'], ['file_content.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_org_node_file_content_id_employee_id', 'org_node', ['file_content_id', 'employee_id']
+    )
+    op.create_index(
+        'ix_org_node_file_content_id_preorder', 'org_node', ['file_content_id', 'preorder']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_org_node_file_content_id_preorder', table_name='org_node')
+    op.drop_index('ix_org_node_file_content_id_employee_id', table_name='org_node')
+    op.drop_table('org_node')
@@ -0,0 +1,41 @@
+"""Add upload_job table
+
+Revision ID: 6a3539bfa860
+Revises: bf654c9723b5
+Create Date: 2026-10-18 11:02:17.503911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '6a3539bfa860'
+down_revision = 'bf654c9723b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload_job',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('upload_file_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('file_content_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('created_utc', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('modified_utc', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('started_utc', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('finished_utc', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('state', sa.String(), nullable=False),
+        sa.Column('rows_processed', sa.INTEGER(), nullable=False),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['upload_file_id'], ['upload_file.id'], ),
+        sa.ForeignKeyConstraint(['file_content_id'], ['file_content.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_upload_job_state', 'upload_job', ['state'])
+
+
+def downgrade():
+    op.drop_index('ix_upload_job_state', table_name='upload_job')
+    op.drop_table('upload_job')
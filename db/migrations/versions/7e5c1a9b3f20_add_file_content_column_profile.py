@@ -0,0 +1,25 @@
+"""Add file_content column_profile
+
+Revision ID: 7e5c1a9b3f20
+Revises: 2b8d6e0f5a17
+Create Date: 2026-10-18 19:22:07.318054
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7e5c1a9b3f20'
+down_revision = '2b8d6e0f5a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('file_content', sa.Column('column_profile', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade():
+    op.drop_column('file_content', 'column_profile')
@@ -0,0 +1,37 @@
+"""Add shared partitioned content table
+
+Revision ID: 9c2e71d4a0b8
+Revises: 45b1e56f33fa
+Create Date: 2026-10-18 16:12:47.530118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2e71d4a0b8'
+down_revision = '45b1e56f33fa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('file_content', sa.Column('storage_layout', sa.String(), server_default='table', nullable=False))
+    # monthly partitions are created by the app as uploads arrive; existing
+    # content tables are moved over with `flask move-content-to-shared-layout`
+    op.execute(
+        'CREATE TABLE data_frame_content.shared_content ('
+        ' file_content_id uuid NOT NULL,'
+        ' upload_month date NOT NULL,'
+        ' "__index__" bigint NOT NULL,'
+        ' "__record_ids__" text NOT NULL,'
+        ' "__metadata__" jsonb NOT NULL DEFAULT \'{}\','
+        ' payload jsonb NOT NULL'
+        ') PARTITION BY RANGE (upload_month)'
+    )
+
+
+def downgrade():
+    op.execute('DROP TABLE data_frame_content.shared_content')
+    op.drop_column('file_content', 'storage_layout')
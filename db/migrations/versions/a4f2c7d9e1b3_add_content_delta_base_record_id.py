@@ -0,0 +1,32 @@
+"""Add content_delta base_record_id and position lookups
+
+Revision ID: a4f2c7d9e1b3
+Revises: 5d9b3e7c1f48
+Create Date: 2026-10-18 22:41:19.560214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f2c7d9e1b3'
+down_revision = '5d9b3e7c1f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('content_delta', sa.Column('base_record_id', sa.String(), nullable=True))
+    op.create_index(
+        'ix_content_delta_file_content_id_position', 'content_delta', ['file_content_id', 'position']
+    )
+    op.create_index(
+        'ix_content_delta_file_content_id_record_id', 'content_delta', ['file_content_id', 'record_id']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_content_delta_file_content_id_record_id', table_name='content_delta')
+    op.drop_index('ix_content_delta_file_content_id_position', table_name='content_delta')
+    op.drop_column('content_delta', 'base_record_id')
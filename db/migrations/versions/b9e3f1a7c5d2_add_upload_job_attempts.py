@@ -0,0 +1,24 @@
+"""Add upload_job attempts
+
+Revision ID: b9e3f1a7c5d2
+Revises: e7b1d4a9c2f6
+Create Date: 2026-10-18 23:31:08.472915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e3f1a7c5d2'
+down_revision = 'e7b1d4a9c2f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('upload_job', sa.Column('attempts', sa.INTEGER(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('upload_job', 'attempts')
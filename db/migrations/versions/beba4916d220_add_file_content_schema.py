@@ -0,0 +1,25 @@
+"""Add file_content content_schema
+
+Revision ID: beba4916d220
+Revises: 6a3539bfa860
+Create Date: 2026-10-18 13:40:52.661207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'beba4916d220'
+down_revision = '6a3539bfa860'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('file_content', sa.Column('content_schema', postgresql.JSONB(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('file_content', 'content_schema')
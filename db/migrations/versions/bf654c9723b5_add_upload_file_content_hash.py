@@ -0,0 +1,26 @@
+"""Add upload_file content_hash
+
+Revision ID: bf654c9723b5
+Revises: eaf797bc8417
+Create Date: 2026-10-18 09:12:40.118374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bf654c9723b5'
+down_revision = 'eaf797bc8417'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('upload_file', sa.Column('content_hash', sa.String(), nullable=True))
+    op.create_index('ix_upload_file_content_hash', 'upload_file', ['content_hash'])
+
+
+def downgrade():
+    op.drop_index('ix_upload_file_content_hash', table_name='upload_file')
+    op.drop_column('upload_file', 'content_hash')
@@ -0,0 +1,49 @@
+"""Add content_delta table and file_content base_file_content_id
+
+Revision ID: c83f5d2e6a41
+Revises: 7e5c1a9b3f20
+Create Date: 2026-10-18 20:05:43.902716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c83f5d2e6a41'
+down_revision = '7e5c1a9b3f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('file_content', sa.Column('base_file_content_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_foreign_key(
+        'file_content_base_file_content_id_fkey', 'file_content', 'file_content',
+        ['base_file_content_id'], ['id']
+    )
+    op.create_index('ix_file_content_base_file_content_id', 'file_content', ['base_file_content_id'])
+    op.create_table('content_delta',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('file_content_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('change', sa.String(), nullable=False),
+        sa.Column('key_value', sa.String(), nullable=False),
+        sa.Column('record_id', sa.String(), nullable=False),
+        sa.Column('position', sa.INTEGER(), nullable=True),
+        sa.Column('row_metadata', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.ForeignKeyConstraint(['file_content_id'], ['file_content.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_content_delta_file_content_id_key_value', 'content_delta', ['file_content_id', 'key_value']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_content_delta_file_content_id_key_value', table_name='content_delta')
+    op.drop_table('content_delta')
+    op.drop_index('ix_file_content_base_file_content_id', table_name='file_content')
+    op.drop_constraint('file_content_base_file_content_id_fkey', 'file_content', type_='foreignkey')
+    op.drop_column('file_content', 'base_file_content_id')
@@ -0,0 +1,37 @@
+"""Add key_violation table
+
+Revision ID: d41f07a9c3e2
+Revises: 9c2e71d4a0b8
+Create Date: 2026-10-18 17:26:09.118452
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f07a9c3e2'
+down_revision = '9c2e71d4a0b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('key_violation',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('file_content_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('created_utc', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('check_name', sa.String(), nullable=False),
+        sa.Column('column_name', sa.String(), nullable=False),
+        sa.Column('record_id', sa.String(), nullable=False),
+        sa.Column('value', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['file_content_id'], ['file_content.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_key_violation_file_content_id', 'key_violation', ['file_content_id'])
+
+
+def downgrade():
+    op.drop_index('ix_key_violation_file_content_id', table_name='key_violation')
+    op.drop_table('key_violation')
@@ -0,0 +1,25 @@
+"""Make upload_file content_hash unique
+
+Revision ID: e7b1d4a9c2f6
+Revises: a4f2c7d9e1b3
+Create Date: 2026-10-18 23:05:52.184730
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b1d4a9c2f6'
+down_revision = 'a4f2c7d9e1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_upload_file_content_hash', table_name='upload_file')
+    op.create_index('ix_upload_file_content_hash', 'upload_file', ['content_hash'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_upload_file_content_hash', table_name='upload_file')
+    op.create_index('ix_upload_file_content_hash', 'upload_file', ['content_hash'])
@@ -1,16 +1,30 @@
-from typing import List, Union
+import copy
+from typing import List, Optional, Union
 from uuid import UUID
 
-from sqlalchemy import cast, func, String
+from sqlalchemy import any_, bindparam, inspect
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
 from sqlalchemy.exc import DataError, IntegrityError, ProgrammingError
-from sqlalchemy.orm import selectinload
-from sqlalchemy.sql import select
+from sqlalchemy.orm import make_transient_to_detached, selectinload
 
 from extensions import db
+from db.read_cache import MISS, read_cache
+
+# primary keys bound per query by get_many_by_primary_keys
+PRIMARY_KEY_CHUNK_SIZE = 10000
+
+
+def _same_value(value, filter_value) -> bool:
+    # filters may give ids as strings
+    return value == filter_value or str(value) == str(filter_value)
 
 
 class BasicCrudMixin:
+    # models that set this have get_one/get_many served from read_cache when it's enabled
+    cache_reads = False
+
     def save(self):
+        written = self._written_values()
         try:
             db.session.add(self)
             db.session.commit()
@@ -19,6 +33,8 @@ class BasicCrudMixin:
             # as that of commit proceeds.
             db.session.rollback()
             raise
+        finally:
+            self.invalidate_cached_reads(written)
 
     def delete(self):
         try:
@@ -29,9 +45,89 @@ class BasicCrudMixin:
             # as that of commit proceeds.
             db.session.rollback()
             raise
+        finally:
+            self.invalidate_cached_reads(deleted=True)
+
+    def _written_values(self) -> Optional[dict]:
+        # taken before the commit expires them, to tell which cached reads the row now matches
+        if self.cache_reads and read_cache.enabled:
+            return dict(inspect(self).dict)
+        return None
+
+    def invalidate_cached_reads(self, values: Optional[dict] = None, deleted: bool = False):
+        """Drop the cached reads this row is in, and those whose filter `values` may match.
+
+        `values` default to the row's loaded attributes; a filter on one that isn't
+        loaded is taken to match. A deleted row matches no filter.
+        """
+        if not self.cache_reads:
+            return
+        state = inspect(self)
+        identity = state.identity
+        primary_key = [column.key for column in inspect(type(self)).primary_key]
+        values = dict(state.dict if values is None else values)
+        if identity is not None:
+            # known even once the commit has expired the rest
+            values.update(zip(primary_key, identity))
+
+        def is_stale(key, cached):
+            _, kind, filter = key
+            snapshots = [cached] if kind == "one" else cached
+            if identity is not None and any(
+                tuple(snapshot[name] for name in primary_key) == identity for snapshot in snapshots
+            ):
+                return True
+            return not deleted and all(
+                name not in values or _same_value(values[name], value) for name, value in filter
+            )
+
+        read_cache.invalidate(type(self).__name__, is_stale)
+
+    @classmethod
+    def _snapshot(cls, rec):
+        return {attr.key: copy.deepcopy(getattr(rec, attr.key)) for attr in inspect(cls).column_attrs}
+
+    @classmethod
+    def _from_snapshot(cls, snapshot):
+        """The instance of `snapshot`'s row in the current session, without a query."""
+        mapper = inspect(cls)
+        identity_key = mapper.identity_key_from_primary_key(
+            [snapshot[column.key] for column in mapper.primary_key]
+        )
+        existing = db.session.identity_map.get(identity_key)
+        if existing is not None:
+            return existing
+        rec = mapper.class_manager.new_instance()
+        for key, value in snapshot.items():
+            setattr(rec, key, copy.deepcopy(value))
+        make_transient_to_detached(rec)
+        # merging runs the model's reconstructor, as loading it would
+        return db.session.merge(rec, load=False)
+
+    @classmethod
+    def _cached_read(cls, kind, eager, filter, read):
+        if not (cls.cache_reads and read_cache.enabled) or eager:
+            return read()
+        key = (cls.__name__, kind, frozenset(filter.items()))
+        cached = read_cache.get(key)
+        if cached is not MISS:
+            if kind == "one":
+                return cls._from_snapshot(cached)
+            return [cls._from_snapshot(snapshot) for snapshot in cached]
+        rec = read()
+        # misses aren't cached: the row may be about to be written by another process
+        if kind == "one" and rec is not None:
+            read_cache.put(key, cls._snapshot(rec))
+        elif kind == "many" and rec:
+            read_cache.put(key, [cls._snapshot(r) for r in rec])
+        return rec
 
     @classmethod
     def get_one(cls, eager=False, **filter):
+        return cls._cached_read("one", eager, filter, lambda: cls._get_one(eager, **filter))
+
+    @classmethod
+    def _get_one(cls, eager=False, **filter):
         if id is None:
             raise TypeError
         try:
@@ -48,6 +144,10 @@ class BasicCrudMixin:
 
     @classmethod
     def get_many(cls, eager=False, **filter):
+        return cls._cached_read("many", eager, filter, lambda: cls._get_many(eager, **filter))
+
+    @classmethod
+    def _get_many(cls, eager=False, **filter):
         if id is None:
             raise TypeError
         try:
@@ -62,18 +162,22 @@ class BasicCrudMixin:
         except ProgrammingError:
             raise
 
+    @classmethod
+    def _primary_keys_clause(cls, primary_keys: List[UUID]):
+        # id = ANY(:primary_keys::UUID[]) compares uuids with uuids, so the primary
+        # key index is used; casting the id to text would defeat it
+        return cls.id == any_(bindparam("primary_keys", primary_keys, type_=ARRAY(PG_UUID(as_uuid=True))))
+
     @classmethod
     def get_many_by_primary_keys(cls, primary_keys: List[Union[UUID, str]]):
         try:
-            primary_keys_as_strings = [str(pk) for pk in primary_keys]
-            primary_keys_as_column = func.unnest(primary_keys_as_strings).label("pk")
-            primary_keys_as_cte = select([primary_keys_as_column]).cte("primary_keys")
-
-            rec = (
-                cls.query
-                .join(primary_keys_as_cte, cast(cls.id, String) == primary_keys_as_cte.c.pk)
-                .all()
-            )
+            unique_primary_keys = list(dict.fromkeys(
+                pk if isinstance(pk, UUID) else UUID(str(pk)) for pk in primary_keys
+            ))
+            rec = []
+            for start in range(0, len(unique_primary_keys), PRIMARY_KEY_CHUNK_SIZE):
+                chunk = unique_primary_keys[start:start + PRIMARY_KEY_CHUNK_SIZE]
+                rec.extend(cls.query.filter(cls._primary_keys_clause(chunk)).all())
             return rec
         except DataError:
             db.session.rollback()
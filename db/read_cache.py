@@ -0,0 +1,84 @@
+"""In-process cache of metadata reads (BasicCrudMixin.get_one/get_many).
+
+Entries are snapshots of column values, not ORM instances, so a cached read can
+be turned back into an instance of whichever session asks for it. The cache is
+bounded in size (least recently used entries go first) and in age (entries
+expire after `ttl_seconds`). When a row is saved or deleted through the mixin,
+the reads it is in, or whose filter it may now match, are dropped, so reads of a
+model's other rows stay cached. The ttl bounds how stale a read can be when
+another process wrote the row.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# sentinel for a miss, since None can't be told apart from a cached value otherwise
+MISS = object()
+
+
+class ReadCache:
+    def __init__(self, max_size: int = 0, ttl_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        # key -> (expires at, value), least recently used first
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def configure(self, max_size: int, ttl_seconds: float) -> None:
+        with self._lock:
+            self.max_size = max_size
+            self.ttl_seconds = ttl_seconds
+            self._entries.clear()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(
+        self, namespace: Optional[Hashable] = None, is_stale: Optional[Callable[[Hashable, Any], bool]] = None
+    ) -> None:
+        """Drop the entries whose key starts with `namespace`, or every entry.
+
+        With `is_stale`, only those of them it returns True for, given the key and value.
+        """
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                return
+            stale = [
+                key for key, (_, value) in self._entries.items()
+                if key[0] == namespace and (is_stale is None or is_stale(key, value))
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+read_cache = ReadCache()
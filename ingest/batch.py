@@ -0,0 +1,89 @@
+"""Parsing side of batch uploads, run in worker processes.
+
+Everything here is importable without the Flask app or a database, so a process
+pool can parse and normalize files on separate cores and hand the normalized
+frames back to the app, which loads them into the database.
+"""
+from collections import Counter
+from typing import Dict, Tuple
+
+import pandas as pd
+
+from cleaning.key_normalization import KeyNormalizer
+from ingest.spreadsheet import XLSX_MIME_TYPES, read_xlsx_chunks
+from instrumentation.timing import collect_upload_timings, time_phase
+
+
+def parse_and_normalize(
+    path: str, mime_type: str, chunk_size: int
+) -> Tuple[pd.DataFrame, Counter, Dict[str, float]]:
+    """Read the stored upload at `path` as text and normalize its keys.
+
+    Returns the normalized frame, the rows each key rule changed, and the seconds
+    spent per phase, for the app to add to the upload's timings; the worker
+    process's own metrics are never scraped.
+    """
+    key_normalizer = KeyNormalizer()
+    with collect_upload_timings() as timings:
+        with time_phase("parse"), open(path, "rb") as stored_file:
+            # keys are read as text so leading zeros and stray whitespace survive to be cleaned
+            if mime_type in XLSX_MIME_TYPES:
+                data_frame = pd.concat(read_xlsx_chunks(stored_file, chunk_size), ignore_index=True)
+            else:
+                data_frame = pd.read_csv(stored_file, dtype=str, keep_default_na=False)
+        data_frame = key_normalizer(data_frame)
+    return data_frame, key_normalizer.change_counts, timings.phases
+
+
+# what happened to each file of a batch upload
+BATCH_PENDING = "pending"
+BATCH_INGESTED = "ingested"
+BATCH_DUPLICATE = "duplicate"
+BATCH_REJECTED = "rejected"
+BATCH_FAILED = "failed"
+# ingested, or would have been, but undone because another file of an atomic batch failed
+BATCH_ROLLED_BACK = "rolled_back"
+
+
+class BatchFile:
+    """One file of a batch upload, and how far it got."""
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.status = BATCH_PENDING
+        self.error = None
+        self.mime_type = None
+        self.content_hash = None
+        self.upload_file_id = None
+        self.file_content_id = None
+
+    @property
+    def is_pending(self) -> bool:
+        return self.status == BATCH_PENDING
+
+    @property
+    def has_failed(self) -> bool:
+        return self.status in (BATCH_REJECTED, BATCH_FAILED)
+
+    def fail(self, status: str, error: str) -> None:
+        self.status = status
+        self.error = error
+
+    def roll_back(self) -> None:
+        """Forget what this batch stored for the file; duplicates point at earlier uploads and stay."""
+        if self.status == BATCH_DUPLICATE:
+            return
+        if not self.has_failed:
+            self.status = BATCH_ROLLED_BACK
+        self.upload_file_id = None
+        self.file_content_id = None
+
+    def to_dict(self) -> dict:
+        return {
+            "file_name": self.file_name,
+            "status": self.status,
+            "error": self.error,
+            "content_hash": self.content_hash,
+            "upload_file_id": str(self.upload_file_id) if self.upload_file_id else None,
+            "file_content_id": str(self.file_content_id) if self.file_content_id else None,
+        }
@@ -0,0 +1,70 @@
+"""Chunked reading of Excel (.xlsx) uploads.
+
+Worksheets are read with openpyxl in read-only mode, which streams rows out of the
+sheet XML instead of building the whole workbook in memory. Rows are grouped into
+data frames of text values, the same shape pd.read_csv(..., dtype=str,
+keep_default_na=False) produces, so they can go through the same loader as CSVs.
+"""
+from datetime import date, datetime, time
+from itertools import islice
+from typing import Iterator, Optional
+
+import pandas as pd
+from openpyxl import load_workbook
+
+XLSX_MIME_TYPES = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/xlsx",
+)
+
+
+def _cell_to_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        # excel keeps every number as a float; ids and whole amounts shouldn't grow a ".0"
+        return str(int(value))
+    if isinstance(value, datetime):
+        if value.time() == time(0):
+            return value.date().isoformat()
+        return value.isoformat()
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def read_xlsx_chunks(
+    xlsx_file, chunk_size: int, sheet_name: Optional[str] = None
+) -> Iterator[pd.DataFrame]:
+    """Yield the rows of a worksheet as data frames of at most `chunk_size` rows.
+
+    The first row of the sheet is the header; a sheet with only a header yields one
+    empty frame with its columns, and an empty sheet raises EmptyDataError, as
+    pd.read_csv(..., chunksize=...) does. Reads the active sheet unless `sheet_name`
+    is given. `xlsx_file` must be a path or a seekable binary file.
+    """
+    workbook = load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name is not None else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise pd.errors.EmptyDataError("No columns to parse from file")
+        columns = [_cell_to_text(name) for name in header]
+
+        chunk_rows = list(islice(rows, chunk_size))
+        if not chunk_rows:
+            yield pd.DataFrame(columns=columns, dtype=object)
+        while chunk_rows:
+            chunk = pd.DataFrame(
+                # read-only sheets can return short rows when trailing cells are empty
+                [row + (None,) * (len(columns) - len(row)) for row in chunk_rows],
+                columns=columns,
+                dtype=object,
+            )
+            yield chunk.apply(lambda values: values.map(_cell_to_text))
+            chunk_rows = list(islice(rows, chunk_size))
+    finally:
+        workbook.close()
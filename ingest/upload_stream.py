@@ -0,0 +1,72 @@
+"""Storing an incoming upload stream while it's hashed.
+
+UploadStream pulls the request stream in large blocks, and every block is written
+to a temporary file in storage, hashed and counted as it goes by, so the request
+stream is read once. The start of it can be peeked at first, e.g. to sniff the
+mime type. Once the stream is finished the temporary file is moved into place
+under its final name, which depends on the hash; the upload is parsed from there.
+"""
+import hashlib
+import os
+import tempfile
+
+# block size for reading upload streams and writing them to storage
+UPLOAD_READ_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadStream:
+    def __init__(self, source, storage_dir: str, block_size: int = UPLOAD_READ_BLOCK_SIZE):
+        self._source = source
+        self._block_size = block_size
+        self._digest = hashlib.sha256()
+        # the start of the stream, pulled through to storage early by peek
+        self._head = b""
+        self._exhausted = False
+        self.size = 0
+        self.content_hash = None
+        storage_file = tempfile.NamedTemporaryFile(dir=storage_dir, prefix=".upload-", delete=False)
+        self._storage_file = storage_file
+        self.temp_path = storage_file.name
+
+    @property
+    def finished(self) -> bool:
+        return self.content_hash is not None
+
+    def _pull_block(self) -> bytes:
+        block = self._source.read(self._block_size)
+        if not block:
+            self._exhausted = True
+            return block
+        self._storage_file.write(block)
+        self._digest.update(block)
+        self.size += len(block)
+        return block
+
+    def peek(self, size: int) -> bytes:
+        """Up to the first `size` bytes of the stream."""
+        while len(self._head) < size and not self._exhausted:
+            self._head += self._pull_block()
+        return self._head[:size]
+
+    def finish(self) -> None:
+        """Pull the rest of the stream through to storage and settle size and hash."""
+        if self.finished:
+            return
+        self._head = b""
+        while not self._exhausted:
+            self._pull_block()
+        self._storage_file.close()
+        self.content_hash = self._digest.hexdigest()
+
+    def store(self, path: str) -> None:
+        """Move the finished upload to `path`; a rename, since it's already in storage."""
+        self.finish()
+        os.replace(self.temp_path, path)
+        self.temp_path = None
+
+    def discard(self) -> None:
+        if not self._storage_file.closed:
+            self._storage_file.close()
+        if self.temp_path is not None and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.temp_path = None
@@ -0,0 +1,139 @@
+"""Ingest phase timing and sql query instrumentation.
+
+Code marks its phases with `time_phase("parse")`. While `collect_upload_timings()`
+is active on a thread, the phases run on that thread (and the sql queries they
+issue) are summed into its UploadTimings, which is how per-upload timings reach
+upload_file, and each phase's total is observed once in the ingest_phase_seconds
+histogram when the block exits. A phase that runs once per chunk is so still one
+sample per upload. Phases run outside any upload are observed as they end.
+
+Queries are timed with SQLAlchemy's before/after_cursor_execute events, so they
+cover everything that goes through an Engine. COPY runs on raw psycopg2 cursors
+and is only seen as part of the phase around it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from instrumentation.metrics import REGISTRY
+
+T = TypeVar("T")
+
+INGEST_PHASE_SECONDS = REGISTRY.histogram(
+    "ingest_phase_seconds", "Time spent in each phase of ingesting an upload.", ["phase"]
+)
+SQL_QUERIES = REGISTRY.counter(
+    "sql_queries_total", "SQL statements executed, by statement type.", ["statement"]
+)
+SQL_QUERY_SECONDS = REGISTRY.histogram(
+    "sql_query_seconds", "SQL statement latency, by statement type.", ["statement"]
+)
+
+# statement types given their own label; anything else is counted as OTHER
+_STATEMENT_TYPES = frozenset([
+    "SELECT", "INSERT", "UPDATE", "DELETE", "CREATE", "ALTER", "DROP", "WITH", "COPY", "BEGIN", "COMMIT",
+])
+_QUERY_START_TIMES = "instrumentation_query_start_times"
+
+_active = threading.local()
+
+
+class UploadTimings:
+    """Seconds per phase, plus sql query count and time, for one upload."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+
+    def add_phase(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            "sql_queries": self.sql_queries,
+            "sql_seconds": round(self.sql_seconds, 6),
+        }
+
+
+def _active_timings() -> Optional[UploadTimings]:
+    return getattr(_active, "timings", None)
+
+
+@contextmanager
+def collect_upload_timings() -> Iterator[UploadTimings]:
+    """Collect the timings of phases and queries run on this thread until the block exits.
+
+    On exit, each phase's total is observed in ingest_phase_seconds.
+    """
+    previous = _active_timings()
+    timings = UploadTimings()
+    _active.timings = timings
+    try:
+        yield timings
+    finally:
+        _active.timings = previous
+        for phase, seconds in timings.phases.items():
+            INGEST_PHASE_SECONDS.observe(seconds, phase=phase)
+
+
+@contextmanager
+def time_phase(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        timings = _active_timings()
+        if timings is None:
+            INGEST_PHASE_SECONDS.observe(seconds, phase=phase)
+        else:
+            timings.add_phase(phase, seconds)
+
+
+def timed_iter(iterable: Iterable[T], phase: str) -> Iterator[T]:
+    """Iterate `iterable`, timing the production of each item as `phase`, e.g. lazy csv parsing."""
+    iterator = iter(iterable)
+    while True:
+        with time_phase(phase):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _statement_type(statement: str) -> str:
+    words = statement.lstrip(" (\n\t").split(None, 1)
+    statement_type = words[0].upper() if words else ""
+    return statement_type if statement_type in _STATEMENT_TYPES else "OTHER"
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault(_QUERY_START_TIMES, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    start_times = connection.info.get(_QUERY_START_TIMES)
+    if not start_times:
+        return
+    seconds = time.perf_counter() - start_times.pop()
+    statement_type = _statement_type(statement)
+    SQL_QUERIES.inc(statement=statement_type)
+    SQL_QUERY_SECONDS.observe(seconds, statement=statement_type)
+    timings = _active_timings()
+    if timings is not None:
+        timings.sql_queries += 1
+        timings.sql_seconds += seconds
+
+
+def install_sql_instrumentation() -> None:
+    """Time every statement run through any SQLAlchemy Engine; safe to call more than once."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,106 @@
+import logging
+import threading
+from typing import Callable, List
+
+from flask import Flask
+
+from models.UploadJob import DEFAULT_JOB_LEASE_SECONDS, UploadJob
+
+logger = logging.getLogger(__name__)
+
+
+class UploadWorkerPool:
+    """Background threads that run queued UploadJobs with `process_job`.
+
+    Each worker polls the upload_job queue table; when it claims a job it calls
+    `process_job(job)` inside an app context, which should ingest the job's upload
+    and return the id of the resulting FileContent, and clean up after itself if it
+    fails. Failures are recorded on the job. While a job runs its lease is renewed
+    from another thread every third of `lease_seconds`, so a job is only claimed
+    again once the process running it is gone.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        process_job: Callable[[UploadJob], object],
+        worker_count: int = 2,
+        poll_interval_seconds: float = 1.0,
+        lease_seconds: float = DEFAULT_JOB_LEASE_SECONDS,
+    ):
+        self._app = app
+        self._process_job = process_job
+        self._worker_count = worker_count
+        self._poll_interval_seconds = poll_interval_seconds
+        self._lease_seconds = lease_seconds
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        # set when a job is queued so idle workers pick it up without waiting out a poll
+        self._job_queued = threading.Event()
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self._worker_count):
+                thread = threading.Thread(
+                    target=self._run, name=f"upload-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        self._job_queued.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._stopping.clear()
+
+    def notify_job_queued(self):
+        self.start()
+        self._job_queued.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                with self._app.app_context():
+                    ran_job = self.run_next_job()
+            except Exception:
+                # e.g. the database is unreachable; the worker carries on polling
+                logger.exception("Upload worker failed to claim a job")
+                ran_job = False
+            if not ran_job:
+                self._job_queued.wait(self._poll_interval_seconds)
+                self._job_queued.clear()
+
+    def _renew_lease(self, job_id, finished: threading.Event):
+        while not finished.wait(self._lease_seconds / 3):
+            try:
+                with self._app.app_context():
+                    UploadJob.renew_lease(job_id)
+            except Exception:
+                logger.exception("Failed to renew the lease of upload job %s", job_id)
+
+    def run_next_job(self) -> bool:
+        """Claim and run one queued job. Returns False if there was nothing to run."""
+        job = UploadJob.claim_next(self._lease_seconds)
+        if job is None:
+            return False
+        finished = threading.Event()
+        lease_keeper = threading.Thread(
+            target=self._renew_lease, args=(job.id, finished), name=f"upload-job-lease-{job.id}", daemon=True
+        )
+        lease_keeper.start()
+        try:
+            file_content_id = self._process_job(job)
+        except Exception as e:
+            logger.exception("Upload job %s failed", job.id)
+            job.fail(e)
+        else:
+            job.succeed(file_content_id)
+        finally:
+            finished.set()
+            lease_keeper.join()
+        return True
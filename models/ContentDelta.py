@@ -0,0 +1,59 @@
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import BigInteger, ForeignKey, INTEGER, String
+
+
+from extensions import db
+from db.mixins.basic_crud_mixin import BasicCrudMixin
+
+# how a row of a roster version differs from the version before
+DELTA_ADDED = "added"
+DELTA_CHANGED = "changed"
+DELTA_REMOVED = "removed"
+# a row read from the base version, at its place in the new version
+DELTA_UNCHANGED = "unchanged"
+
+
+class ContentDelta(db.Model, BasicCrudMixin):
+    """A row of a FileContent stored as a delta of its base version.
+
+    Every row of the new version has one, with its position and record id in the
+    new version. Added and changed rows carry the row as it is in the new version,
+    unchanged rows only the record id of the base row their values are read from;
+    removed rows have no position, and the key and record id they had in the base.
+    Rows are written in bulk by FileContent.store_as_delta, so ids are generated by
+    the database.
+    """
+    __tablename__ = "content_delta"
+
+    id = db.Column("id", BigInteger, primary_key=True, autoincrement=True)
+    file_content_id = db.Column(
+        "file_content_id",
+        UUID(as_uuid=True),
+        ForeignKey("file_content.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    change = db.Column("change", String, nullable=False)
+    # the normalized value of the roster key, see FileContent.SNAPSHOT_KEY_COLUMN
+    key_value = db.Column("key_value", String, nullable=False)
+    record_id = db.Column("record_id", String, nullable=False)
+    # __index__ of the row in the rebuilt version; None for removed rows
+    position = db.Column("position", INTEGER, nullable=True)
+    # the base row holding the values of an unchanged row; None for other changes
+    base_record_id = db.Column("base_record_id", String, nullable=True)
+    row_metadata = db.Column("row_metadata", JSONB, nullable=True)
+    # the row's content values; None for removed rows
+    payload = db.Column("payload", JSONB, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_content_delta_file_content_id_key_value", "file_content_id", "key_value"),
+        db.Index("ix_content_delta_file_content_id_position", "file_content_id", "position"),
+        db.Index("ix_content_delta_file_content_id_record_id", "file_content_id", "record_id"),
+    )
+
+    def to_dict(self):
+        return {
+            "change": self.change,
+            "key": self.key_value,
+            "record_id": self.record_id,
+            "values": self.payload,
+        }
@@ -1,26 +1,62 @@
+import json
+import logging
+import os
 import uuid
 import time
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
 
+import numpy as np
 import pandas as pd
 from pandas.io.sql import SQLDatabase, SQLTable
 from sqlalchemy import (
+    bindparam,
+    inspect,
     Boolean,
     Column,
     ForeignKey,
     INTEGER,
     JSON,
     String,
+    Table,
+    Text,
     TIMESTAMP,
 )
 
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
+from sqlalchemy.engine import Dialect
 from sqlalchemy.exc import DataError, ProgrammingError
-from sqlalchemy.sql import func, text
-from sqlalchemy.sql.expression import TextClause
+from sqlalchemy.orm import reconstructor
+from sqlalchemy.sql import and_, case, cast, column, func, literal_column, select, table, text
+from sqlalchemy.sql.expression import ClauseElement, ColumnElement, FromClause, Select, TextClause
 
 from extensions import db
 from db.mixins.basic_crud_mixin import BasicCrudMixin
+from db.read_cache import MISS, ReadCache
+from models.UploadFile import UploadFile
+from models.ContentDelta import DELTA_ADDED, DELTA_CHANGED, DELTA_REMOVED, DELTA_UNCHANGED
+from models.record_ids import generate_record_ids, record_ids_to_text
+from models.content_types import (
+    TEXT,
+    infer_content_schema,
+    sql_types,
+    to_analytics_dtypes,
+    to_db_values,
+    widen_content_schema,
+)
+from models.content_profile import ContentProfiler
+from models.content_sidecar import (
+    SIDECAR_EXTENSION,
+    ContentSidecarWriter,
+    SidecarSchemaError,
+    read_sidecar,
+    remove_sidecar,
+    sidecars_supported,
+    write_sidecar,
+)
+from cleaning.key_normalization import DEFAULT_KEY_RULES
+from instrumentation.timing import time_phase
 
 # max number of rows to query to/from db at a time, recommended ~10000
 CHUNK_SIZE = 8192  # 1024 * 8
@@ -29,6 +65,67 @@ DATA_FRAME_CONTENT_INDEX_HEADER = "__index__"
 METADATA_HEADER = "__metadata__"
 RECORD_IDS_HEADER = "__record_ids__"
 
+# methods for bulk loading content rows into a content table
+BULK_LOAD_COPY = "copy"  # postgres COPY FROM STDIN, via psycopg2
+BULK_LOAD_INSERT = "insert"  # pandas SQLTable multi-row INSERTs
+DEFAULT_BULK_LOAD_METHOD = BULK_LOAD_COPY
+
+# written to COPY streams for missing values so that empty strings stay empty strings;
+# lengthened for a frame that has it as a value, see DataFrameCsvStream.null_marker
+COPY_NULL_MARKER = "\\N"
+
+# where content rows are stored: a table per FileContent ("table"), or the rows of
+# every FileContent in one table partitioned by upload month ("shared")
+STORAGE_LAYOUT_TABLE = "table"
+STORAGE_LAYOUT_SHARED = "shared"
+DEFAULT_STORAGE_LAYOUT = STORAGE_LAYOUT_TABLE
+SHARED_CONTENT_TABLE = "shared_content"
+SHARED_CONTENT_TABLE_NAME = f'{DATA_FRAME_CONTENT_SCHEMA}."{SHARED_CONTENT_TABLE}"'
+SHARED_PAYLOAD_HEADER = "payload"
+# a version of a roster stored as the rows that differ from an earlier version ("base")
+STORAGE_LAYOUT_DELTA = "delta"
+CONTENT_DELTA_TABLE_NAME = "content_delta"
+# rosters are versioned by employee; keys are normalized on ingest
+SNAPSHOT_KEY_COLUMN = "Employee ID"
+# store a delta only when at most this share of rows differs from the base
+DEFAULT_MAX_DELTA_RATIO = 0.5
+# deltas on deltas nest their reads; past this many a new version is stored in full
+MAX_DELTA_DEPTH = 8
+
+# store content in natively typed columns where every value of a column parses
+DEFAULT_TYPED_COLUMNS = True
+# keys stay text whatever they look like, so leading zeros and case survive
+KEY_COLUMNS = tuple(dict.fromkeys(rule.column for rule in DEFAULT_KEY_RULES))
+
+logger = logging.getLogger(__name__)
+
+
+class ContentTableMetadata:
+    """What is known about one content table, shared by every FileContent with its id.
+
+    Keeps SQLAlchemy table definitions and catalog lookups from being redone on every
+    save and read. Anything not known yet is None and is looked up on first use.
+    Nothing in here refers to the content itself, which can be large.
+    """
+
+    def __init__(self):
+        # SQLAlchemy Table defining the table, and the (columns, schema) it was built for
+        self.table = None
+        self.definition_key = None
+        # content columns of the table in the db, excluding the bookkeeping columns
+        self.db_columns = None
+        self.exists = None
+
+
+# content tables whose metadata is kept, least recently used first out
+CONTENT_TABLE_METADATA_CACHE_SIZE = 1024
+# (FileContent.id,) -> ContentTableMetadata; entries don't expire, they're dropped when out of date
+_content_table_metadata = ReadCache(max_size=CONTENT_TABLE_METADATA_CACHE_SIZE, ttl_seconds=float("inf"))
+# pandas wrappers of SQLAlchemy engines, by engine
+_sql_databases: Dict[object, SQLDatabase] = {}
+# months known to have a partition of the shared content table
+_shared_content_partitions = set()
+
 
 class DataFrameSaveError(Exception):
     """Base exception for errors arising from saving data frame metadata and content."""
@@ -44,8 +141,76 @@ class DataFrameMutableContentSaveError(DataFrameSaveError):
     pass
 
 
+class DataFrameStorageLayoutError(DataFrameSaveError):
+    """Error while attempting a write the content's storage layout doesn't support."""
+    pass
+
+
+class ContentLoadStats(NamedTuple):
+    """Timing of a single bulk load of content rows into a content table."""
+    method: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float("inf")
+
+
+class DataFrameCsvStream:
+    """Read-only file-like object rendering a data frame as CSV, one chunk at a time.
+
+    Used as the source of a COPY FROM STDIN so that the CSV text for the whole
+    frame never has to be held in memory at once. Given `record_ids` (bytes, as
+    made by generate_record_ids), they're written as the index instead, and
+    formatted as text one chunk at a time. Missing values are written as
+    `null_marker`, which no value of the frame is equal to.
+    """
+
+    def __init__(
+        self,
+        frame: pd.DataFrame,
+        chunk_size: int = CHUNK_SIZE,
+        index: bool = True,
+        record_ids: np.ndarray = None,
+    ):
+        self._frame = frame
+        self._chunk_size = chunk_size
+        self._index = index
+        self._record_ids = record_ids
+        self._next_row = 0
+        # rendered text not read yet starts at _buffer_position; reads move the
+        # position rather than copying what's left of a chunk each time
+        self._buffer = ""
+        self._buffer_position = 0
+        self.null_marker = _unused_null_marker(frame)
+
+    def _render_next_chunk(self) -> str:
+        rows = slice(self._next_row, self._next_row + self._chunk_size)
+        chunk = self._frame.iloc[rows]
+        if self._record_ids is not None:
+            chunk = _index_by_record_ids(chunk, self._record_ids[rows])
+        self._next_row += self._chunk_size
+        return chunk.to_csv(header=False, index=self._index, na_rep=self.null_marker)
+
+    def read(self, size: int = -1) -> str:
+        available = len(self._buffer) - self._buffer_position
+        if (size < 0 or available < size) and self._next_row < len(self._frame):
+            rendered = [self._buffer[self._buffer_position:]]
+            while (size < 0 or available < size) and self._next_row < len(self._frame):
+                rendered.append(self._render_next_chunk())
+                available += len(rendered[-1])
+            self._buffer, self._buffer_position = "".join(rendered), 0
+        if size < 0:
+            size = available
+        data = self._buffer[self._buffer_position:self._buffer_position + size]
+        self._buffer_position += len(data)
+        return data
+
+
 class FileContent(db.Model, BasicCrudMixin):
     __tablename__ = "file_content"
+    cache_reads = True
 
     id = db.Column("id", UUID(as_uuid=True), primary_key=True)
     upload_file_id = db.Column(
@@ -67,6 +232,22 @@ class FileContent(db.Model, BasicCrudMixin):
     number_of_columns = db.Column("number_of_columns", INTEGER, nullable=False)
     record_count = db.Column("record_count", INTEGER, nullable=False)
     content_headers = db.Column("content_headers", ARRAY(String), nullable=False)
+    # column name -> inferred type, see models.content_types; None when all columns are text
+    content_schema = db.Column("content_schema", JSONB, nullable=True)
+    # columnar copy of the content table, see models.content_sidecar; None when not kept
+    sidecar_path = db.Column("sidecar_path", String, nullable=True)
+    storage_layout = db.Column(
+        "storage_layout", String, nullable=False, server_default=STORAGE_LAYOUT_TABLE
+    )
+    # column name -> statistics, see models.content_profile; columns whose content
+    # changed since are left out until profile_columns recomputes them
+    column_profile = db.Column("column_profile", JSONB, nullable=True)
+    # when ingest finished loading the content; None until then, so it isn't a delta base early
+    ingested_utc = db.Column("ingested_utc", TIMESTAMP(timezone=True), nullable=True)
+    # the earlier version this one is stored as a delta of, see store_as_delta
+    base_file_content_id = db.Column(
+        "base_file_content_id", UUID(as_uuid=True), ForeignKey("file_content.id"), nullable=True, index=True
+    )
 
 
     def __init__(
@@ -82,39 +263,173 @@ class FileContent(db.Model, BasicCrudMixin):
 
         self.id = kwargs.get("id", uuid.uuid4())
 
-        # Cast all columns in content to string type.
-        if not content.dtypes.eq(object).all():
-            content = content.fillna("").astype(str)
+        content = self._normalize_content(content)
 
         # Internal cache of content. On init this won't be None, but it can be
         # invalidated, and in general will be lost when the data_frame instance
         # goes out of scope.
         self._content = self._add_record_ids(content)
 
-        print(self._content)
         self.content_headers = list(self._content.columns)
         self.record_count = kwargs.get("record_count") or content.shape[0]
+        # profiled in the same pass as the content is loaded; from_chunks feeds it the other chunks
+        self._profiler = ContentProfiler()
+        self._profiler.update(content)
+        self.column_profile = self._profiler.to_dict()
         self.number_of_columns = kwargs.get("number_of_columns") or content.shape[1]
+        # The content cache keeps the uploaded text; typed columns are converted on
+        # their way into the content table, and content read back is typed.
+        if kwargs.get("typed_columns", DEFAULT_TYPED_COLUMNS):
+            with time_phase("infer_schema"):
+                self.content_schema = infer_content_schema(
+                    self._content, text_columns=kwargs.get("text_columns", KEY_COLUMNS)
+                )
+        else:
+            self.content_schema = None
 
         self.created_utc = kwargs.get("created_utc", datetime.utcnow())
         self.modified_utc = kwargs.get("modified_utc", datetime.utcnow())
 
         self.category = kwargs.get("category", "employee")
+        self.storage_layout = kwargs.get("storage_layout", DEFAULT_STORAGE_LAYOUT)
 
         self._should_update_db_content = True
         self._saved_original_content = False
+        # record ids of rows changed since the content table was last written;
+        # None means the table needs a full rewrite
+        self._dirty_record_ids = None
+        self._defer_content_indexes = False
+        # rows written since the content was last (re)written from scratch
+        self._loaded_row_count = 0
+        # content columns indexed after the bulk load, for lookups and key validation
+        self.index_columns = tuple(kwargs.get("index_columns", KEY_COLUMNS))
 
+        self.bulk_load_method = kwargs.get("bulk_load_method", DEFAULT_BULK_LOAD_METHOD)
+        self.last_content_load = None
 
-    @property
-    def _content_table(self):
-        if self._content is not None:
+        sidecar_dir = kwargs.get("sidecar_dir")
+        if sidecar_dir is not None and sidecars_supported():
+            self.sidecar_path = os.path.join(sidecar_dir, f"{self.id}{SIDECAR_EXTENSION}")
+        else:
+            self.sidecar_path = None
+        self._sidecar_writer = None
+
+
+    @reconstructor
+    def _init_on_load(self):
+        # FileContents loaded from the db don't go through __init__; their content
+        # stays in the content table until it's read.
+        self._content = None
+        self._profiler = None
+        self._should_update_db_content = False
+        self._saved_original_content = True
+        self._dirty_record_ids = set()
+        self._defer_content_indexes = False
+        self._loaded_row_count = self.record_count
+        self.index_columns = KEY_COLUMNS
+        self.bulk_load_method = DEFAULT_BULK_LOAD_METHOD
+        self.last_content_load = None
+        self._sidecar_writer = None
+
+
+    @classmethod
+    def from_chunks(
+        cls,
+        chunks: Iterator[pd.DataFrame],
+        *,
+        upload_file_id: uuid.UUID,
+        name: str,
+        transform: Callable[[pd.DataFrame], pd.DataFrame] = None,
+        progress: Callable[[int], None] = None,
+        reread: Callable[[], Iterator[pd.DataFrame]] = None,
+        **kwargs,
+    ) -> "FileContent":
+        """Create and save a FileContent from consecutive chunks of rows of one file.
+
+        Each chunk is passed through `transform` (if given), normalized, given record
+        ids and appended to the content table before the next one is pulled, so only
+        one chunk is in memory at a time. `progress`, if given, is called with the
+        number of rows loaded so far after each chunk.
+
+        `reread`, if given, returns the chunks of the file from its start again. When
+        a chunk widens typed columns to text, the rows loaded before it get those
+        columns back from there as the text they were, rather than as postgres
+        prints their typed values (true for Y, 2020-01-02 for 1/2/20).
+        """
+        if transform is not None:
+            chunks = (transform(chunk) for chunk in chunks)
+        first_chunk = next(chunks)
+
+        file_content = cls(upload_file_id=upload_file_id, name=name, content=first_chunk, **kwargs)
+        file_content._defer_content_indexes = True
+        if file_content.sidecar_path is not None:
+            # chunks are appended to the sidecar as they're loaded
+            file_content._sidecar_writer = ContentSidecarWriter(file_content.sidecar_path)
+        file_content.save()
+        load_stats = [file_content.last_content_load]
+
+        record_count = first_chunk.shape[0]
+        if progress is not None:
+            progress(record_count)
+        for chunk in chunks:
+            chunk = cls._normalize_content(chunk)
+            file_content._profiler.update(chunk)
+            # chunks aren't kept, so their ids stay bytes until they're written
+            record_ids = file_content._generate_record_ids(record_count, chunk.shape[0])
+            schema = file_content.content_schema
+            load_stats.append(file_content._load_content_rows(chunk, record_ids))
+            widened_to_text = [
+                c for c in schema or {}
+                if schema[c]["type"] != TEXT and file_content.content_schema[c]["type"] == TEXT
+            ]
+            if widened_to_text and reread is not None:
+                source_chunks = (source_chunk[widened_to_text] for source_chunk in reread())
+                if transform is not None:
+                    source_chunks = (transform(source_chunk) for source_chunk in source_chunks)
+                file_content._reload_source_text(source_chunks, record_count)
+            record_count += chunk.shape[0]
+            if progress is not None:
+                progress(record_count)
+
+        file_content._defer_content_indexes = False
+        file_content._create_content_indexes()
+        file_content._finish_sidecar()
+
+        file_content.record_count = record_count
+        file_content.number_of_columns = first_chunk.shape[1]
+        file_content.column_profile = file_content._profiler.to_dict()
+        file_content._profiler = None
+        # the cache only ever held the first chunk; reload lazily from the db when needed
+        file_content._content = None
+        file_content.save()
+
+        file_content._record_content_load(ContentLoadStats(
+            method=load_stats[0].method,
+            rows=sum(stats.rows for stats in load_stats),
+            seconds=sum(stats.seconds for stats in load_stats),
+        ))
+        return file_content
+
+
+    @staticmethod
+    def _normalize_content(content: pd.DataFrame) -> pd.DataFrame:
+        # Cast all columns in content to string type.
+        if not content.dtypes.eq(object).all():
+            content = content.fillna("").astype(str)
+        return content
+
+
+    def _build_content_table(self, frame: pd.DataFrame = None):
+        if frame is not None:
             sql_table = SQLTable(
                 name=self.schema_table_name,
                 pandas_sql_engine=self._sql_engine,
-                frame=self._content,
+                frame=frame,
                 if_exists="replace",
-                index=False,
+                index=True,
+                index_label=RECORD_IDS_HEADER,
                 schema=DATA_FRAME_CONTENT_SCHEMA,
+                dtype=sql_types(self.content_schema) if self.content_schema else None,
             )
             index_col = Column(DATA_FRAME_CONTENT_INDEX_HEADER, INTEGER, primary_key=True, autoincrement=True)
             sql_table.table.append_column(index_col)
@@ -132,9 +447,49 @@ class FileContent(db.Model, BasicCrudMixin):
         return sql_table
 
 
+    @property
+    def _table_metadata(self) -> ContentTableMetadata:
+        metadata = _content_table_metadata.get((self.id,))
+        if metadata is MISS:
+            metadata = ContentTableMetadata()
+            _content_table_metadata.put((self.id,), metadata)
+        return metadata
+
+
+    def _forget_table_metadata(self) -> None:
+        """Invalidate cached metadata of the content table, after it was changed outside our control."""
+        _content_table_metadata.invalidate(self.id)
+
+
+    @property
+    def _content_table(self) -> Table:
+        metadata = self._table_metadata
+        definition_key = (
+            tuple(self._content.columns), json.dumps(self.content_schema, sort_keys=True)
+        )
+        if metadata.table is None or metadata.definition_key != definition_key:
+            # column types come from the dtypes and the schema, so no rows are needed;
+            # only the Table is kept, since a pandas SQLTable holds on to its frame
+            metadata.table = self._build_content_table(self._content.iloc[:0].copy()).table
+            metadata.definition_key = definition_key
+        return metadata.table
+
+
+    def _content_table_exists(self) -> bool:
+        metadata = self._table_metadata
+        if metadata.exists is None:
+            metadata.exists = db.engine.has_table(
+                self.schema_table_name, schema=DATA_FRAME_CONTENT_SCHEMA
+            )
+        return metadata.exists
+
+
     @property
     def _sql_engine(self):
-        return SQLDatabase(db.engine)
+        sql_database = _sql_databases.get(db.engine)
+        if sql_database is None:
+            sql_database = _sql_databases.setdefault(db.engine, SQLDatabase(db.engine))
+        return sql_database
 
 
     @property
@@ -144,30 +499,884 @@ class FileContent(db.Model, BasicCrudMixin):
 
     @property
     def content_table_name(self):
+        """The content as a relation to select from, e.g. in sql for `exec_sql_read`.
+
+        With the shared storage layout this is a subquery over the shared table,
+        aliased to the name the content's own table would have.
+        """
+        if self.uses_shared_layout or self.uses_delta_layout:
+            return self.content_relation(self.schema_table_name)
+        return self._own_table_name
+
+
+    def content_relation(self, alias: str) -> str:
+        """`content_table_name` under another name, e.g. to join the content with itself; sql for text()."""
+        return _escape_for_text(_compile_sql(self.content_selectable(alias), asfrom=True))
+
+
+    def content_selectable(self, alias: str) -> FromClause:
+        """The content as a sqlalchemy relation named `alias`, with the bookkeeping and content columns."""
+        if self.uses_shared_layout:
+            return self._shared_content_select().alias(alias)
+        if self.uses_delta_layout:
+            return self._delta_content_select(self._base_version).alias(alias)
+        return table(
+            self.schema_table_name,
+            *(column(c) for c in (DATA_FRAME_CONTENT_INDEX_HEADER, RECORD_IDS_HEADER, METADATA_HEADER)),
+            *(column(c) for c in self.content_headers),
+            schema=DATA_FRAME_CONTENT_SCHEMA,
+        ).alias(alias)
+
+
+    @property
+    def _own_table_name(self):
         return f'{DATA_FRAME_CONTENT_SCHEMA}."{self.schema_table_name}"'
 
 
-    def _add_record_ids(self, content: pd.DataFrame):
-        content = content.reset_index(drop=True)
-        data_frame_id = uuid.UUID(str(self.id))
-        record_ids = [str(uuid.uuid5(data_frame_id, str(idx))) for idx in content.index]
-        content.index = pd.Index(record_ids, name=RECORD_IDS_HEADER)
-        return content
+    @property
+    def uses_shared_layout(self) -> bool:
+        return self.storage_layout == STORAGE_LAYOUT_SHARED
+
+
+    @property
+    def uses_delta_layout(self) -> bool:
+        return self.storage_layout == STORAGE_LAYOUT_DELTA
+
+
+    @property
+    def _base_version(self) -> "FileContent":
+        return FileContent.get_one(id=self.base_file_content_id)
+
+
+    @property
+    def delta_depth(self) -> int:
+        """Number of deltas read through to rebuild this version."""
+        depth, version = 0, self
+        while version.uses_delta_layout:
+            depth += 1
+            version = version._base_version
+        return depth
+
+
+    @property
+    def _upload_month(self) -> date:
+        return self.created_utc.date().replace(day=1)
+
+
+    def _payload_values(self, payload: ColumnElement) -> Dict[str, ColumnElement]:
+        """Each content column's value in the json object `payload`, typed per the schema."""
+        column_types = sql_types(self.content_schema) if self.content_schema else {}
+
+        values = {}
+        for header in self.content_headers:
+            value = payload[header].astext
+            if header in column_types and not isinstance(column_types[header], Text):
+                value = cast(value, column_types[header])
+            values[header] = value
+        return values
+
+
+    def _shared_content_select(self) -> Select:
+        shared = table(
+            SHARED_CONTENT_TABLE,
+            column(DATA_FRAME_CONTENT_INDEX_HEADER),
+            column(RECORD_IDS_HEADER),
+            column(METADATA_HEADER),
+            column(SHARED_PAYLOAD_HEADER, JSONB),
+            column("upload_month"),
+            column("file_content_id"),
+            schema=DATA_FRAME_CONTENT_SCHEMA,
+        )
+        payload_values = self._payload_values(shared.c[SHARED_PAYLOAD_HEADER])
+        return select([
+            shared.c[DATA_FRAME_CONTENT_INDEX_HEADER],
+            shared.c[RECORD_IDS_HEADER],
+            shared.c[METADATA_HEADER],
+            *(value.label(header) for header, value in payload_values.items()),
+        ]).where(and_(
+            shared.c.upload_month == self._upload_month.isoformat(),
+            shared.c.file_content_id == str(self.id),
+        ))
+
+
+    def _delta_content_select(self, base: "FileContent") -> Select:
+        """Every row of the version at its own position; unchanged rows take their values from `base`."""
+        delta = table(
+            CONTENT_DELTA_TABLE_NAME,
+            column("file_content_id"),
+            column("position"),
+            column("record_id"),
+            column("base_record_id"),
+            column("row_metadata"),
+            column("payload", JSONB),
+        ).alias("delta")
+        base_rows = base.content_selectable("base")
+        payload_values = self._payload_values(delta.c.payload)
+        return select([
+            delta.c.position.label(DATA_FRAME_CONTENT_INDEX_HEADER),
+            delta.c.record_id.label(RECORD_IDS_HEADER),
+            delta.c.row_metadata.label(METADATA_HEADER),
+            *(
+                case([(delta.c.payload.is_(None), base_rows.c[header])], else_=value).label(header)
+                for header, value in payload_values.items()
+            ),
+        ]).select_from(
+            delta.outerjoin(base_rows, base_rows.c[RECORD_IDS_HEADER] == delta.c.base_record_id)
+        ).where(and_(
+            delta.c.file_content_id == str(self.id),
+            delta.c.position.isnot(None),
+        ))
+
+
+    def _add_record_ids(self, content: pd.DataFrame, start: int = 0):
+        """Index `content` by record ids derived from each row's position in the file.
+
+        `start` is the file position of the first row, for content read in chunks.
+        """
+        record_ids = self._generate_record_ids(start, content.shape[0])
+        return _index_by_record_ids(content.reset_index(drop=True), record_ids)
+
+
+    def _generate_record_ids(self, start: int, count: int) -> np.ndarray:
+        """Record ids of `count` rows from file position `start`, as bytes; see generate_record_ids."""
+        with time_phase("record_ids"):
+            return generate_record_ids(uuid.UUID(str(self.id)), start, count)
 
 
     def _refresh_db_content(self):
-        if self._content_table.exists() and self._content_columns_match_db_columns():
+        if self._dirty_record_ids is not None:
+            # content stored for the first time has no versions yet
+            self._prepare_write()
+        if self.uses_shared_layout:
+            self._refresh_shared_content()
+        elif not self._content_table_exists():
+            self._rewrite_db_content()
+        elif not self._content_columns_match_db_columns():
+            # the column set changed, so the table itself has to be rebuilt
+            self._drop_content_table()
+            self._rewrite_db_content()
+        elif self._dirty_record_ids is None:
             # drop content table instead of deleting content rows to
             # avoid auto-incrementing index from having weird values
             self._drop_content_table()
-            self._content_table.create()
+            self._rewrite_db_content()
         else:
-            self._content_table.create()
-        self._content_table.insert(chunksize=CHUNK_SIZE)
+            self._update_content_rows(self._content.loc[sorted(self._dirty_record_ids)])
+        self._dirty_record_ids = set()
         self._should_update_db_content = False
+        if self._sidecar_writer is None:
+            self._write_sidecar()
+
+
+    def _rewrite_db_content(self):
+        # settle column types before the table is created with them
+        self._widen_content_schema(self._content, alter_table=False)
+        with time_phase("create_table"):
+            self._content_table.create(bind=db.engine)
+        metadata = self._table_metadata
+        metadata.exists = True
+        metadata.db_columns = set(self._content.columns)
+        self._loaded_row_count = 0
+        self._record_content_load(self._load_content_rows(self._content))
+        if not self._defer_content_indexes:
+            self._create_content_indexes()
+
+
+    def _create_content_indexes(self):
+        if self.uses_shared_layout or self.uses_delta_layout:
+            # the shared table's partitions are indexed when they're created,
+            # and a delta's rows are looked up by key
+            return
+        # record ids are the key for incremental updates, key columns the usual lookups;
+        # built after the bulk load since maintaining them row by row during the load is slower
+        with time_phase("create_indexes"), db.engine.begin() as connection:
+            connection.execute(text(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS "ix_{self.id}_record_ids"'
+                f' ON {self._own_table_name} ("{RECORD_IDS_HEADER}")'
+            ))
+            indexed_columns = [c for c in self.index_columns if c in self.content_headers]
+            for position, column in enumerate(indexed_columns):
+                # positional names: column names can be longer than an identifier
+                connection.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS "ix_{self.id}_key_{position}"'
+                    f" ON {self._own_table_name} ({quote_in_text(column)})"
+                ))
+
+
+    def _content_columns_match_db_columns(self) -> bool:
+        metadata = self._table_metadata
+        if metadata.db_columns is None:
+            db_columns = {
+                column["name"]
+                for column in inspect(db.engine).get_columns(
+                    self.schema_table_name, schema=DATA_FRAME_CONTENT_SCHEMA
+                )
+            }
+            db_columns -= {DATA_FRAME_CONTENT_INDEX_HEADER, METADATA_HEADER, RECORD_IDS_HEADER}
+            metadata.db_columns = db_columns
+        return metadata.db_columns == set(self._content.columns)
+
+
+    def _widen_content_schema(self, frame: pd.DataFrame, alter_table: bool = True) -> None:
+        """Widen column types that can't hold the values in `frame`, e.g. a later chunk's.
+
+        With `alter_table`, the existing content table's columns are altered to match.
+        """
+        if not self.content_schema:
+            return
+        widened = widen_content_schema(self.content_schema, frame)
+        changed = [c for c in widened if widened[c] != self.content_schema[c]]
+        if not changed:
+            return
+
+        if alter_table and not self.uses_shared_layout:
+            quote = quote_in_text
+            type_compiler = db.engine.dialect.type_compiler
+            column_types = sql_types({c: widened[c] for c in changed})
+            alterations = ", ".join(
+                f"ALTER COLUMN {quote(c)} TYPE {type_compiler.process(column_types[c])}"
+                f" USING {quote(c)}::{type_compiler.process(column_types[c])}"
+                for c in changed
+            )
+            with db.engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {self._own_table_name} {alterations}"))
+
+        logger.info("Widened columns %s of %s", changed, self.id)
+        self.content_schema = widened
+        # not save(), which is what's writing the rows being widened for
+        db.session.add(self)
+        db.session.commit()
+        self.invalidate_cached_reads()
+
+
+    def _reload_source_text(self, chunks: Iterator[pd.DataFrame], row_count: int) -> None:
+        """Write the columns of `chunks`, the file's from its start, over the first `row_count` rows."""
+        with time_phase("reload_source_text"):
+            start = 0
+            for chunk in chunks:
+                if start >= row_count:
+                    break
+                chunk = self._normalize_content(chunk.iloc[:row_count - start])
+                record_ids = self._generate_record_ids(start, chunk.shape[0])
+                self._update_content_rows(_index_by_record_ids(chunk, record_ids))
+                start += chunk.shape[0]
+        if self._sidecar_writer is not None:
+            # it holds the typed values too; rebuilt from the content table once loading is done
+            self._sidecar_writer.abort()
+            self._sidecar_writer = None
+
+
+    def _prepare_rows_for_db(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if not self.content_schema:
+            return frame
+        self._widen_content_schema(frame)
+        return to_db_values(frame, self.content_schema)
+
+
+    def _drop_content_table(self):
+        with db.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {self._own_table_name}"))
+        metadata = self._table_metadata
+        metadata.exists = False
+        metadata.db_columns = None
+
+
+    def _load_content_rows(self, frame: pd.DataFrame, record_ids: np.ndarray = None) -> ContentLoadStats:
+        """Append the rows of `frame` to the content table, which must already exist.
+
+        Record ids are the index of `frame`, unless given as `record_ids` bytes.
+        """
+        method = self.bulk_load_method
+        if method == BULK_LOAD_COPY and not _engine_supports_copy():
+            method = BULK_LOAD_INSERT
+        if record_ids is not None and method != BULK_LOAD_COPY:
+            frame, record_ids = _index_by_record_ids(frame, record_ids), None
+
+        start = time.perf_counter()
+        with time_phase("load_rows"):
+            db_frame = self._prepare_rows_for_db(frame)
+            if self.uses_shared_layout:
+                self._insert_shared_rows(db_frame, use_copy=method == BULK_LOAD_COPY, record_ids=record_ids)
+            elif method == BULK_LOAD_COPY:
+                self._copy_content_rows(db_frame, record_ids)
+            else:
+                self._build_content_table(db_frame).insert(chunksize=CHUNK_SIZE)
+        self._loaded_row_count += frame.shape[0]
+        load_seconds = time.perf_counter() - start
+        if self._sidecar_writer is not None:
+            with time_phase("sidecar"):
+                if record_ids is not None:
+                    frame = _index_by_record_ids(frame, record_ids)
+                self._append_to_sidecar(frame)
+        return ContentLoadStats(
+            method=method,
+            rows=frame.shape[0],
+            seconds=load_seconds,
+        )
+
+
+    def _sidecar_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if not self.content_schema:
+            return frame
+        return self._analytics_frame(to_db_values(frame, self.content_schema))
+
+
+    def _analytics_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """`frame` with typed columns as pandas dtypes, so content reads the same from the sidecar and the db."""
+        if not self.content_schema:
+            return frame
+        return to_analytics_dtypes(frame, self.content_schema)
+
+
+    def _append_to_sidecar(self, frame: pd.DataFrame) -> None:
+        try:
+            self._sidecar_writer.write(self._sidecar_frame(frame))
+        except SidecarSchemaError:
+            # a column was widened part way through the load; the sidecar is
+            # rebuilt from the content table once loading is done instead
+            logger.info("Column types of %s changed mid-load, rebuilding sidecar", self.id)
+            self._sidecar_writer.abort()
+            self._sidecar_writer = None
+
+
+    def _finish_sidecar(self) -> None:
+        if self.sidecar_path is None:
+            return
+        with time_phase("sidecar"):
+            if self._sidecar_writer is not None:
+                self._sidecar_writer.close()
+                self._sidecar_writer = None
+            else:
+                self.rebuild_sidecar()
+
+
+    def _write_sidecar(self) -> None:
+        if self.sidecar_path is None or self._content is None:
+            return
+        try:
+            write_sidecar(self.sidecar_path, self._sidecar_frame(self._content))
+        except Exception:
+            # the sidecar is only a cache of the content table; reads fall back to the db
+            logger.exception("Failed to write content sidecar for %s", self.id)
+            remove_sidecar(self.sidecar_path)
+
+
+    def rebuild_sidecar(self) -> None:
+        """Rewrite the sidecar from the content table, one page at a time."""
+        if self.sidecar_path is None or not sidecars_supported():
+            return
+        writer = ContentSidecarWriter(self.sidecar_path)
+        try:
+            for page in self.iter_content():
+                writer.write(self._sidecar_frame(page))
+        except Exception:
+            writer.abort()
+            logger.exception("Failed to rebuild content sidecar for %s", self.id)
+            return
+        writer.close()
+
+
+    def _record_content_load(self, stats: ContentLoadStats) -> None:
+        logger.info(
+            "Loaded %d rows into %s with %s in %.3fs (%.0f rows/sec)",
+            stats.rows, self.id, stats.method, stats.seconds, stats.rows_per_second,
+        )
+        self.last_content_load = stats
+
+
+    @staticmethod
+    def _copy_rows(cursor, frame: pd.DataFrame, table_name: str, record_ids: np.ndarray = None) -> None:
+        quote = _quote_identifier
+        index_name = RECORD_IDS_HEADER if record_ids is not None else frame.index.name or RECORD_IDS_HEADER
+        column_names = [index_name] + list(frame.columns)
+        stream = DataFrameCsvStream(frame, record_ids=record_ids)
+        copy_sql = (
+            f"COPY {table_name} ({', '.join(quote(c) for c in column_names)})"
+            f" FROM STDIN WITH (FORMAT csv, NULL '{stream.null_marker}')"
+        )
+        cursor.copy_expert(copy_sql, stream)
+
+
+    def _copy_content_rows(self, frame: pd.DataFrame, record_ids: np.ndarray = None) -> None:
+        connection = db.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                self._copy_rows(cursor, frame, self._own_table_name, record_ids)
+            connection.commit()
+        except db.engine.dialect.dbapi.Error as e:
+            connection.rollback()
+            raise DataFrameMutableContentSaveError(
+                f"Failed to copy data frame content to database for data frame {self.id}."
+            ) from e
+        finally:
+            connection.close()
+
+
+    def _update_content_rows(self, frame: pd.DataFrame) -> None:
+        """Write the rows of `frame` over the content table rows with the same record ids."""
+        if frame.empty:
+            return
+        frame = self._prepare_rows_for_db(frame)
+        if self.uses_shared_layout:
+            self._update_shared_rows(frame)
+            return
+        if not _engine_supports_copy():
+            self._update_content_rows_with_executemany(frame)
+            return
+
+        quote = _quote_identifier
+        stage_table_name = quote(f"stage_{self.schema_table_name}")
+        assignments = ", ".join(f"{quote(c)} = stage.{quote(c)}" for c in frame.columns)
+        record_ids = quote(RECORD_IDS_HEADER)
+
+        connection = db.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                # stage the changed rows with COPY, then apply them in one set-based UPDATE
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE {stage_table_name} ON COMMIT DROP AS"
+                    f" SELECT {record_ids}, {', '.join(quote(c) for c in frame.columns)}"
+                    f" FROM {self._own_table_name} WITH NO DATA"
+                )
+                self._copy_rows(cursor, frame, stage_table_name)
+                cursor.execute(
+                    f"UPDATE {self._own_table_name} AS content SET {assignments}"
+                    f" FROM {stage_table_name} AS stage"
+                    f" WHERE content.{record_ids} = stage.{record_ids}"
+                )
+            connection.commit()
+        except db.engine.dialect.dbapi.Error as e:
+            connection.rollback()
+            raise DataFrameMutableContentSaveError(
+                f"Failed to update data frame content in database for data frame {self.id}."
+            ) from e
+        finally:
+            connection.close()
+
+
+    def _update_content_rows_with_executemany(self, frame: pd.DataFrame) -> None:
+        table = self._content_table
+        bind_names = {column: f"value_{i}" for i, column in enumerate(frame.columns)}
+        statement = (
+            table.update()
+            .where(table.c[RECORD_IDS_HEADER] == bindparam("record_id"))
+            .values({column: bindparam(name) for column, name in bind_names.items()})
+        )
+        with db.engine.begin() as connection:
+            for start in range(0, frame.shape[0], CHUNK_SIZE):
+                chunk = frame.iloc[start:start + CHUNK_SIZE]
+                connection.execute(statement, [
+                    {"record_id": record_id, **{bind_names[c]: v for c, v in row.items()}}
+                    for record_id, row in zip(chunk.index, chunk.to_dict("records"))
+                ])
+
+
+    def _refresh_shared_content(self):
+        if self._dirty_record_ids is None or list(self._content.columns) != self.content_headers:
+            self._delete_shared_rows()
+            self._widen_content_schema(self._content, alter_table=False)
+            if list(self._content.columns) != self.content_headers:
+                # the shared relation selects columns by header
+                self.content_headers = list(self._content.columns)
+                db.session.add(self)
+                db.session.commit()
+                self.invalidate_cached_reads()
+            self._loaded_row_count = 0
+            self._record_content_load(self._load_content_rows(self._content))
+        else:
+            self._update_content_rows(self._content.loc[sorted(self._dirty_record_ids)])
+
+
+    def _ensure_shared_partition(self) -> None:
+        month = self._upload_month
+        if month in _shared_content_partitions:
+            return
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        partition = f"{SHARED_CONTENT_TABLE}_{month:%Y%m}"
+        partition_name = f'{DATA_FRAME_CONTENT_SCHEMA}."{partition}"'
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF {SHARED_CONTENT_TABLE_NAME}"
+                f" FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+            ))
+            connection.execute(text(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS "{partition}_record_ids"'
+                f' ON {partition_name} (file_content_id, "{RECORD_IDS_HEADER}")'
+            ))
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS "{partition}_index"'
+                f' ON {partition_name} (file_content_id, "{DATA_FRAME_CONTENT_INDEX_HEADER}")'
+            ))
+            for position, column in enumerate(KEY_COLUMNS):
+                key = column.replace("'", "''")
+                connection.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS "{partition}_key_{position}"'
+                    f" ON {partition_name} (file_content_id, ({SHARED_PAYLOAD_HEADER} ->> '{key}'))"
+                ))
+        _shared_content_partitions.add(month)
+
+
+    def _shared_rows(self, frame: pd.DataFrame, first_position: int = None) -> pd.DataFrame:
+        """`frame` as rows of the shared table: its values become a json payload per row."""
+        payloads = (
+            frame.to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+            .rstrip("\n")
+            .split("\n")
+            if not frame.empty else []
+        )
+        rows = pd.DataFrame({SHARED_PAYLOAD_HEADER: payloads}, index=frame.index)
+        if first_position is not None:
+            rows.insert(0, "file_content_id", str(self.id))
+            rows.insert(1, "upload_month", self._upload_month.isoformat())
+            # 1-based like the serial __index__ of content tables
+            rows.insert(2, DATA_FRAME_CONTENT_INDEX_HEADER, range(
+                first_position + 1, first_position + 1 + frame.shape[0]
+            ))
+        return rows
+
+
+    def _insert_shared_rows(self, frame: pd.DataFrame, use_copy: bool, record_ids: np.ndarray = None) -> None:
+        self._ensure_shared_partition()
+        rows = self._shared_rows(frame, first_position=self._loaded_row_count)
+        if use_copy:
+            connection = db.engine.raw_connection()
+            try:
+                with connection.cursor() as cursor:
+                    self._copy_rows(cursor, rows, SHARED_CONTENT_TABLE_NAME, record_ids)
+                connection.commit()
+            except db.engine.dialect.dbapi.Error as e:
+                connection.rollback()
+                raise DataFrameMutableContentSaveError(
+                    f"Failed to copy data frame content to database for data frame {self.id}."
+                ) from e
+            finally:
+                connection.close()
+            return
+
+        statement = text(
+            f'INSERT INTO {SHARED_CONTENT_TABLE_NAME} (file_content_id, upload_month,'
+            f' "{DATA_FRAME_CONTENT_INDEX_HEADER}", "{RECORD_IDS_HEADER}", {SHARED_PAYLOAD_HEADER})'
+            f" VALUES (:file_content_id, :upload_month, :position, :record_id, CAST(:payload AS jsonb))"
+        )
+        with db.engine.begin() as connection:
+            for start in range(0, rows.shape[0], CHUNK_SIZE):
+                chunk = rows.iloc[start:start + CHUNK_SIZE]
+                connection.execute(statement, [
+                    {
+                        "file_content_id": row["file_content_id"],
+                        "upload_month": row["upload_month"],
+                        "position": row[DATA_FRAME_CONTENT_INDEX_HEADER],
+                        "record_id": record_id,
+                        "payload": row[SHARED_PAYLOAD_HEADER],
+                    }
+                    for record_id, row in zip(chunk.index, chunk.to_dict("records"))
+                ])
+
+
+    def _update_shared_rows(self, frame: pd.DataFrame) -> None:
+        """Merge the values of `frame` into the payloads of the shared rows with the same record ids."""
+        rows = self._shared_rows(frame)
+        record_ids = f'"{RECORD_IDS_HEADER}"'
+        update_sql = (
+            f"UPDATE {SHARED_CONTENT_TABLE_NAME} AS content"
+            f" SET {SHARED_PAYLOAD_HEADER} = content.{SHARED_PAYLOAD_HEADER} || stage.{SHARED_PAYLOAD_HEADER}"
+            f" FROM {{stage}} AS stage"
+            f" WHERE content.upload_month = '{self._upload_month.isoformat()}'"
+            f" AND content.file_content_id = '{self.id}'"
+            f" AND content.{record_ids} = stage.{record_ids}"
+        )
+        if not _engine_supports_copy():
+            stage = (
+                f"(SELECT CAST(:record_id AS text) AS {record_ids},"
+                f" CAST(:payload AS jsonb) AS {SHARED_PAYLOAD_HEADER})"
+            )
+            with db.engine.begin() as connection:
+                connection.execute(text(update_sql.format(stage=stage)), [
+                    {"record_id": record_id, "payload": payload}
+                    for record_id, payload in rows[SHARED_PAYLOAD_HEADER].items()
+                ])
+            return
+
+        stage_table_name = f'"stage_{self.schema_table_name}"'
+        connection = db.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE {stage_table_name}"
+                    f" ({record_ids} text, {SHARED_PAYLOAD_HEADER} jsonb) ON COMMIT DROP"
+                )
+                self._copy_rows(cursor, rows, stage_table_name)
+                cursor.execute(update_sql.format(stage=stage_table_name))
+            connection.commit()
+        except db.engine.dialect.dbapi.Error as e:
+            connection.rollback()
+            raise DataFrameMutableContentSaveError(
+                f"Failed to update data frame content in database for data frame {self.id}."
+            ) from e
+        finally:
+            connection.close()
+
+
+    def _delete_shared_rows(self) -> None:
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    f"DELETE FROM {SHARED_CONTENT_TABLE_NAME}"
+                    f" WHERE upload_month = :upload_month AND file_content_id = :file_content_id"
+                ),
+                upload_month=self._upload_month,
+                file_content_id=self.id,
+            )
+
+
+    def move_to_shared_layout(self) -> None:
+        """Move the rows of this FileContent's own content table into the shared table.
+
+        Done in one transaction inside the database; the own table is dropped after.
+        """
+        if self.uses_shared_layout or self.uses_delta_layout:
+            return
+        self._ensure_shared_partition()
+        bookkeeping_columns = " - ".join(
+            f"'{c}'" for c in (DATA_FRAME_CONTENT_INDEX_HEADER, RECORD_IDS_HEADER, METADATA_HEADER)
+        )
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    f"INSERT INTO {SHARED_CONTENT_TABLE_NAME} (file_content_id, upload_month,"
+                    f' "{DATA_FRAME_CONTENT_INDEX_HEADER}", "{RECORD_IDS_HEADER}",'
+                    f' "{METADATA_HEADER}", {SHARED_PAYLOAD_HEADER})'
+                    f' SELECT :file_content_id, :upload_month, content."{DATA_FRAME_CONTENT_INDEX_HEADER}",'
+                    f' content."{RECORD_IDS_HEADER}", content."{METADATA_HEADER}",'
+                    f" to_jsonb(content) - {bookkeeping_columns}"
+                    f" FROM {self._own_table_name} AS content"
+                ),
+                file_content_id=self.id,
+                upload_month=self._upload_month,
+            )
+            connection.execute(text(f"DROP TABLE {self._own_table_name}"))
+        self._forget_table_metadata()
+        self.storage_layout = STORAGE_LAYOUT_SHARED
+        self.save()
+
+
+    def previous_version(self, roster_key: str) -> Optional["FileContent"]:
+        """The latest earlier FileContent uploaded under `roster_key`, e.g. the roster of the last pay period.
+
+        Only content whose ingest finished is considered.
+        """
+        return (
+            FileContent.query
+            .join(UploadFile, UploadFile.id == FileContent.upload_file_id)
+            .filter(
+                UploadFile.roster_key == roster_key,
+                FileContent.ingested_utc.isnot(None),
+                FileContent.id != self.id,
+                FileContent.created_utc <= self.created_utc,
+            )
+            .order_by(FileContent.created_utc.desc())
+            .first()
+        )
+
+
+    def _keys_are_unique(self, connection, alias: str) -> bool:
+        key = f"{alias}.{quote_in_text(SNAPSHOT_KEY_COLUMN)}"
+        row_count, key_count, blank_key_count = connection.execute(text(
+            f"SELECT count(*), count(DISTINCT {key}), count(*) FILTER (WHERE {key} IS NULL OR {key} = '')"
+            f" FROM {self.content_relation(alias)}"
+        )).first()
+        return row_count == key_count and blank_key_count == 0
+
+
+    def store_as_delta(self, base: "FileContent", max_delta_ratio: float = DEFAULT_MAX_DELTA_RATIO) -> bool:
+        """Keep only the rows that differ from `base`, an earlier version of the same roster.
+
+        Rows are matched on SNAPSHOT_KEY_COLUMN and compared by an md5 of their
+        values, inside the database. Every row goes to content_delta with its
+        position and record id, added and changed ones with their values and
+        unchanged ones with the base row to read them from, and the keys of removed
+        rows too; in one transaction with dropping this content's own rows. The
+        version is rebuilt on read from the base and the delta, with the same
+        positions and record ids as before. Nothing is changed, and False returned,
+        unless both versions have the same columns and column types and unique,
+        non-blank keys, and at most `max_delta_ratio` of the rows differ.
+        """
+        if self.uses_delta_layout or base.id == self.id:
+            return False
+        if (
+            SNAPSHOT_KEY_COLUMN not in self.content_headers
+            or list(self.content_headers) != list(base.content_headers)
+            or self.content_schema != base.content_schema
+            or base.delta_depth >= MAX_DELTA_DEPTH
+        ):
+            return False
+        if self._should_update_db_content:
+            self._refresh_db_content()
+
+        quote = quote_in_text
+        key = quote(SNAPSHOT_KEY_COLUMN)
+        index_header, record_ids = quote(DATA_FRAME_CONTENT_INDEX_HEADER), quote(RECORD_IDS_HEADER)
+        bookkeeping_columns = " - ".join(
+            f"'{c}'" for c in (DATA_FRAME_CONTENT_INDEX_HEADER, RECORD_IDS_HEADER, METADATA_HEADER)
+        )
+
+        def row_hash(alias: str) -> str:
+            return f"md5(ROW({', '.join(f'{alias}.{quote(c)}' for c in self.content_headers)})::text)"
+
+        with db.engine.connect() as connection:
+            if not (self._keys_are_unique(connection, "new") and base._keys_are_unique(connection, "base")):
+                return False
+
+            transaction = connection.begin()
+            try:
+                connection.execute(
+                    text(
+                        f"INSERT INTO {CONTENT_DELTA_TABLE_NAME} (file_content_id, change, key_value,"
+                        f" position, record_id, base_record_id, row_metadata, payload)"
+                        f" SELECT :file_content_id, compared.change, new.{key}, new.{index_header}, new.{record_ids},"
+                        f" CASE WHEN compared.change = :unchanged THEN base.record_id END, new.{quote(METADATA_HEADER)},"
+                        f" CASE WHEN compared.change <> :unchanged THEN to_jsonb(new) - {bookkeeping_columns} END"
+                        f" FROM {self.content_relation('new')}"
+                        f" LEFT JOIN (SELECT base.{key} AS key_value, base.{record_ids} AS record_id,"
+                        f" {row_hash('base')} AS row_hash FROM {base.content_relation('base')}) AS base"
+                        f" ON base.key_value = new.{key}"
+                        f" CROSS JOIN LATERAL (SELECT CASE WHEN base.key_value IS NULL THEN :added"
+                        f" WHEN base.row_hash <> {row_hash('new')} THEN :changed ELSE :unchanged END AS change) AS compared"
+                    ),
+                    file_content_id=self.id,
+                    added=DELTA_ADDED,
+                    changed=DELTA_CHANGED,
+                    unchanged=DELTA_UNCHANGED,
+                )
+                connection.execute(
+                    text(
+                        f"INSERT INTO {CONTENT_DELTA_TABLE_NAME} (file_content_id, change, key_value, record_id)"
+                        f" SELECT :file_content_id, :removed, base.{key}, base.{record_ids}"
+                        f" FROM {base.content_relation('base')}"
+                        f" WHERE NOT EXISTS (SELECT 1 FROM {self.content_relation('new')} WHERE new.{key} = base.{key})"
+                    ),
+                    file_content_id=self.id,
+                    removed=DELTA_REMOVED,
+                )
+                change_counts = dict(connection.execute(
+                    text(
+                        f"SELECT change, count(*) FROM {CONTENT_DELTA_TABLE_NAME}"
+                        f" WHERE file_content_id = :file_content_id GROUP BY change"
+                    ),
+                    file_content_id=self.id,
+                ).fetchall())
+                changed = change_counts.get(DELTA_ADDED, 0) + change_counts.get(DELTA_CHANGED, 0)
+                removed = change_counts.get(DELTA_REMOVED, 0)
+                if changed + removed > max_delta_ratio * self.record_count:
+                    transaction.rollback()
+                    return False
+
+                connection.execute(
+                    text(
+                        "UPDATE file_content SET storage_layout = :storage_layout,"
+                        " base_file_content_id = :base_file_content_id WHERE id = :file_content_id"
+                    ),
+                    storage_layout=STORAGE_LAYOUT_DELTA,
+                    base_file_content_id=base.id,
+                    file_content_id=self.id,
+                )
+                if self.uses_shared_layout:
+                    connection.execute(
+                        text(
+                            f"DELETE FROM {SHARED_CONTENT_TABLE_NAME}"
+                            f" WHERE upload_month = :upload_month AND file_content_id = :file_content_id"
+                        ),
+                        upload_month=self._upload_month,
+                        file_content_id=self.id,
+                    )
+                else:
+                    connection.execute(text(f"DROP TABLE {self._own_table_name}"))
+                transaction.commit()
+            except Exception:
+                transaction.rollback()
+                raise
+
+        logger.info(
+            "Stored %s as a delta of %s: %d rows added or changed, %d removed", self.id, base.id, changed, removed
+        )
+        self._forget_table_metadata()
+        self.storage_layout = STORAGE_LAYOUT_DELTA
+        self.base_file_content_id = base.id
+        self.save()
+        return True
+
+
+    def _store_in_full(self) -> None:
+        """Copy the rows of this delta version into a content table of its own, detaching it from its base.
+
+        Positions and record ids stay as they are.
+        """
+        if not self.uses_delta_layout:
+            return
+        quote = quote_in_text
+        columns = ", ".join(
+            quote(c) for c in
+            (DATA_FRAME_CONTENT_INDEX_HEADER, RECORD_IDS_HEADER, METADATA_HEADER, *self.content_headers)
+        )
+        # column types come from the schema, as for the table the content was first stored in
+        table = self._build_content_table(pd.DataFrame(columns=self.content_headers, dtype=object)).table
+        with db.engine.begin() as connection:
+            table.create(bind=connection)
+            connection.execute(text(
+                f"INSERT INTO {self._own_table_name} ({columns})"
+                f" SELECT {columns} FROM {self.content_relation('version')}"
+            ))
+            # rows inserted later are numbered after the copied ones
+            connection.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence(:table_name, :column),"
+                    f" (SELECT coalesce(max({quote(DATA_FRAME_CONTENT_INDEX_HEADER)}), 0) + 1"
+                    f" FROM {self._own_table_name}), false)"
+                ),
+                table_name=self._own_table_name,
+                column=DATA_FRAME_CONTENT_INDEX_HEADER,
+            )
+            connection.execute(
+                text(f"DELETE FROM {CONTENT_DELTA_TABLE_NAME} WHERE file_content_id = :file_content_id"),
+                file_content_id=self.id,
+            )
+            connection.execute(
+                text(
+                    "UPDATE file_content SET storage_layout = :storage_layout,"
+                    " base_file_content_id = NULL WHERE id = :file_content_id"
+                ),
+                storage_layout=STORAGE_LAYOUT_TABLE,
+                file_content_id=self.id,
+            )
+        logger.info("Stored %s in full, no longer as a delta of %s", self.id, self.base_file_content_id)
+        self._forget_table_metadata()
+        self.storage_layout = STORAGE_LAYOUT_TABLE
+        self.base_file_content_id = None
+        # not save(), which may be what's writing this content
+        db.session.add(self)
+        db.session.commit()
+        self.invalidate_cached_reads()
+        self._create_content_indexes()
+
+
+    def _store_versions_in_full(self) -> None:
+        """Store the versions stored as deltas of this content in full, before it changes under them."""
+        for version in FileContent.query.filter(FileContent.base_file_content_id == self.id).all():
+            version._store_in_full()
+
+
+    def _prepare_write(self) -> None:
+        """Make sure changing this content changes nothing else.
+
+        Versions stored as deltas of it read their unchanged rows from it, and a
+        delta reads from its base, so each is stored in full first.
+        """
+        self._store_versions_in_full()
+        self._store_in_full()
 
 
     def save(self):
+        written = self._written_values()
         try:
             db.session.add(self)
             db.session.commit()
@@ -177,6 +1386,8 @@ class FileContent(db.Model, BasicCrudMixin):
                 f"Failed to write metadata to 'file_content' table;"
                 f" upload_file_id: {self.upload_file_id}."
             ) from e
+        finally:
+            self.invalidate_cached_reads(written)
 
         if self._should_update_db_content:
             try:
@@ -188,36 +1399,171 @@ class FileContent(db.Model, BasicCrudMixin):
 
 
     def delete(self):
+        self._store_versions_in_full()
         super().delete()
-        self._sql_engine.drop_table(
-            table_name=self.schema_table_name, schema=DATA_FRAME_CONTENT_SCHEMA
-        )
+        if self.uses_shared_layout:
+            self._delete_shared_rows()
+        elif not self.uses_delta_layout:
+            # delta rows go with the file_content row
+            self._drop_content_table()
+        self._forget_table_metadata()
+        remove_sidecar(self.sidecar_path)
 
 
     @property
     def content(self):
         if self._content is None:
-            # refresh _content cache from db content
-            chunks = pd.read_sql(
-                sql=f"""
-                    select * from {self.content_table_name}
-                    {
-                        f"where not {IGNORE_ROW_HEADER}"
-                        if IGNORE_ROW_HEADER in self._db_content_columns.columns
-                        else ""
-                    }
-                """,
-                con=db.engine,
-                chunksize=CHUNK_SIZE,
-            )
-            db_content = next(chunks)
-            for chunk in chunks:
-                db_content = db_content.append(chunk)
-            self._content = self._content_from_db_content(db_content)
-            
+            self._content = self.read_columns()
+            self._dirty_record_ids = set()
+
         return self._content
 
 
+    def read_columns(self, columns: List[str] = None) -> pd.DataFrame:
+        """Read `columns` (all when None) of the whole content, indexed by record id.
+
+        Reads come from the sidecar through a memory map when there is one, and
+        otherwise from the content table. The `_content` cache is neither used nor filled.
+        """
+        if self.sidecar_path is not None and not self._should_update_db_content:
+            if not os.path.exists(self.sidecar_path):
+                self.rebuild_sidecar()
+            if os.path.exists(self.sidecar_path):
+                return read_sidecar(self.sidecar_path, RECORD_IDS_HEADER, columns)
+
+        return self._read_db_columns(columns)
+
+
+    def _read_db_columns(self, columns: List[str] = None) -> pd.DataFrame:
+        # pages are collected and concatenated once so a full load is linear in the table size
+        pages = list(self.iter_content(columns=columns))
+        if pages:
+            return pd.concat(pages, copy=False)
+        return self._analytics_frame(pd.DataFrame(
+            columns=self.content_headers if columns is None else columns,
+            index=pd.Index([], name=RECORD_IDS_HEADER),
+        ))
+
+
+    def iter_content(
+        self,
+        page_size: int = CHUNK_SIZE,
+        columns: List[str] = None,
+        where: Union[ClauseElement, str] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """Lazily read the content table in pages of at most `page_size` rows, in file order.
+
+        Rows are fetched through a server-side cursor, so only one page is held in
+        memory at a time. `columns` limits which content columns are read and `where`
+        filters rows, e.g. text('"Job Code" = :job_code').bindparams(job_code="41111").
+        Pages are indexed by record id and typed like `content`. The `_content`
+        cache is neither used nor filled.
+        """
+        if self._should_update_db_content:
+            # handle the case where file_content.content is updated, but a call to
+            # file_content.save() hasn't occurred yet
+            self._refresh_db_content()
+
+        query = self.content_query(columns, where)
+
+        with db.engine.connect() as connection:
+            connection = connection.execution_options(stream_results=True)
+            for page in pd.read_sql(sql=query, con=connection, chunksize=page_size):
+                yield self._analytics_frame(self._content_from_db_content(page))
+
+
+    def content_query(
+        self,
+        columns: List[str] = None,
+        where: Union[ClauseElement, str] = None,
+        after_index: int = None,
+        limit: int = None,
+    ) -> Select:
+        """Select of content rows in file order, starting after the row at `after_index`.
+
+        Selects every column of the content table when `columns` is None, and
+        __index__, the record ids and `columns` otherwise. Paging on __index__ (the
+        position of a row in the file, from 1) reads only the rows of the page.
+        """
+        content = self.content_selectable(self.schema_table_name)
+        if columns is None:
+            selected_columns = [literal_column("*")]
+        else:
+            selected_columns = [content.c[c] for c in [DATA_FRAME_CONTENT_INDEX_HEADER, RECORD_IDS_HEADER, *columns]]
+        index_column = content.c[DATA_FRAME_CONTENT_INDEX_HEADER]
+
+        query = select(selected_columns).select_from(content)
+        if where is not None:
+            query = query.where(text(where) if isinstance(where, str) else where)
+        if after_index is not None:
+            query = query.where(index_column > after_index)
+        query = query.order_by(index_column)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+
+    def iter_rows(
+        self,
+        columns: List[str] = None,
+        where: Union[ClauseElement, str] = None,
+        after_index: int = None,
+        limit: int = None,
+    ) -> Iterator[tuple]:
+        """Rows of `content_query` as (__index__, record id, *values) tuples, streamed.
+
+        Unlike iter_content no data frames are built, for callers that pass rows
+        straight on, e.g. into an http response.
+        """
+        if self._should_update_db_content:
+            self._refresh_db_content()
+        columns = self.content_headers if columns is None else columns
+        with db.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(
+                self.content_query(columns, where, after_index, limit)
+            )
+            for row in result:
+                yield tuple(row)
+
+
+    def next_index(
+        self,
+        where: Union[ClauseElement, str] = None,
+        after_index: int = None,
+        limit: int = 1,
+    ) -> Optional[int]:
+        """__index__ to page from after the `limit` rows following `after_index`; None if they're the last."""
+        if self._should_update_db_content:
+            self._refresh_db_content()
+        query = self.content_query([], where, after_index, limit=2).offset(limit - 1)
+        with db.engine.connect() as connection:
+            indexes = [row[0] for row in connection.execute(query)]
+        return indexes[0] if len(indexes) == 2 else None
+
+
+    def export_columns(self, columns: List[str] = None, bookkeeping: bool = False) -> List[str]:
+        """Columns of `export_select`, in order."""
+        columns = self.content_headers if columns is None else columns
+        if bookkeeping:
+            return [DATA_FRAME_CONTENT_INDEX_HEADER, RECORD_IDS_HEADER, *columns, METADATA_HEADER]
+        return [RECORD_IDS_HEADER, *columns]
+
+
+    def export_select(self, columns: List[str] = None, bookkeeping: bool = False) -> str:
+        """sql selecting the record ids and `columns` of every row in file order, for exports.
+
+        A plain string, since it's run by COPY and server-side cursors outside of
+        sqlalchemy. __index__ and __metadata__ are left out unless `bookkeeping`.
+        """
+        if self._should_update_db_content:
+            self._refresh_db_content()
+        content = self.content_selectable("content")
+        return _compile_sql(
+            select([content.c[c] for c in self.export_columns(columns, bookkeeping)])
+            .order_by(content.c[DATA_FRAME_CONTENT_INDEX_HEADER])
+        )
+
+
     def _content_from_db_content(
         self,
         db_content,
@@ -227,15 +1573,15 @@ class FileContent(db.Model, BasicCrudMixin):
         content = db_content
 
         if not include_metadata_column:
-            columns_to_drop.append(METADATA_HEADER)
+            content = content.drop([METADATA_HEADER], axis=1, errors="ignore")
 
         if index_by_record_ids:
-            content = content.drop([INDEX_HEADER], axis=1, errors="ignore")
+            content = content.drop([DATA_FRAME_CONTENT_INDEX_HEADER], axis=1, errors="ignore")
             if RECORD_IDS_HEADER in content.columns:
                 # Move record IDs from column to index.
                 content.set_index(RECORD_IDS_HEADER, inplace=True)
-        elif INDEX_HEADER in content.columns:
-            content.set_index(INDEX_HEADER, inplace=True)
+        elif DATA_FRAME_CONTENT_INDEX_HEADER in content.columns:
+            content.set_index(DATA_FRAME_CONTENT_INDEX_HEADER, inplace=True)
             content.index = content.index - 1
 
         return content
@@ -247,12 +1593,32 @@ class FileContent(db.Model, BasicCrudMixin):
                 raise ValueError("Expected other data frame to have record ids, none found.")
             other = other.set_index(RECORD_IDS_HEADER)
 
-        self.content.update(other)
+        content = self.content
+        rows = other.index.intersection(content.index)
+        columns = other.columns.intersection(content.columns)
+        before = content.loc[rows, columns].copy()
 
-        self._should_update_db_content = True
+        content.update(other)
+
+        after = content.loc[rows, columns]
+        # missing values compare unequal to themselves, but a value staying missing isn't a change
+        unchanged = (after == before).fillna(False) | (after.isna() & before.isna())
+        changed = (~unchanged).to_numpy(dtype=bool)
+        changed_rows = rows[changed.any(axis=1)]
+        if self._dirty_record_ids is not None:
+            self._dirty_record_ids.update(changed_rows)
+        if len(changed_rows) > 0:
+            self._should_update_db_content = True
+            self._forget_column_profiles(columns[changed.any(axis=0)])
 
 
     def exec_sql_update(self, sql: TextClause) -> None:
+        if self.uses_shared_layout:
+            raise DataFrameStorageLayoutError(
+                "exec_sql_update needs a content table of its own; FileContent"
+                f" {self.id} uses the shared storage layout, use update_content instead."
+            )
+        self._prepare_write()
         if self._should_update_db_content:
             # handle the case where file_content.content is updated, but a call to
             # file_content.save() hasn't occurred yet
@@ -260,6 +1626,111 @@ class FileContent(db.Model, BasicCrudMixin):
         with db.engine.connect() as connection:
             connection.execute(sql)
         self._content = None
+        # the sql may have changed the table itself
+        self._forget_table_metadata()
+        # stale now; rebuilt from the content table on the next columnar read
+        remove_sidecar(self.sidecar_path)
+        self._forget_column_profiles()
+        self.save()
+
+
+    def is_text_column(self, column: str) -> bool:
+        if self.content_schema is None:
+            return True
+        return self.content_schema.get(column, {"type": TEXT})["type"] == TEXT
+
+
+    def prepare_sql_update(self) -> None:
+        """Write what sql_column_update needs in place: pending content, and this content and its versions in full."""
+        self._prepare_write()
+        if self._should_update_db_content:
+            # handle the case where file_content.content is updated, but a call to
+            # file_content.save() hasn't occurred yet
+            self._refresh_db_content()
+
+
+    def sql_column_update(self, expressions: Dict[str, str]) -> TextClause:
+        """One UPDATE of the content setting each column of `expressions` to its expression.
+
+        An expression is sql over the column's current value, written {value}, e.g.
+        "upper({value})", and may use bind parameters, which the caller binds. Only
+        rows where some value changes are written, so the rowcount is the number of
+        rows changed. Afterwards refresh_cached_columns brings cached copies up to date.
+        To run the UPDATE inside a transaction of your own, call prepare_sql_update
+        before it starts, since that commits what it writes.
+        """
+        self.prepare_sql_update()
+        quote = quote_in_text
+        keys = {column: _escape_for_text(column.replace("'", "''")) for column in expressions}
+        if self.uses_shared_layout:
+            values = {column: f"(content.{SHARED_PAYLOAD_HEADER} ->> '{keys[column]}')" for column in expressions}
+        else:
+            values = {column: f"content.{quote(column)}" for column in expressions}
+        new_values = {column: expression.format(value=values[column]) for column, expression in expressions.items()}
+        changed = " OR ".join(f"({new_values[c]}) IS DISTINCT FROM {values[c]}" for c in expressions)
+
+        if self.uses_shared_layout:
+            fields = ", ".join(f"'{keys[c]}', {new_values[c]}" for c in expressions)
+            return text(
+                f"UPDATE {SHARED_CONTENT_TABLE_NAME} AS content"
+                f" SET {SHARED_PAYLOAD_HEADER} = content.{SHARED_PAYLOAD_HEADER} || jsonb_build_object({fields})"
+                f" WHERE content.upload_month = '{self._upload_month.isoformat()}'"
+                f" AND content.file_content_id = '{self.id}' AND ({changed})"
+            )
+        assignments = ", ".join(f"{quote(c)} = {new_values[c]}" for c in expressions)
+        return text(f"UPDATE {self._own_table_name} AS content SET {assignments} WHERE {changed}")
+
+
+    def refresh_cached_columns(self, columns: List[str]) -> None:
+        """Re-read `columns` into the cached content and the sidecar, after they were changed in the database.
+
+        The other columns of the cache and sidecar are kept, so only `columns` are read back.
+        """
+        columns = [c for c in columns if c in self.content_headers]
+        if columns:
+            self._forget_column_profiles(columns)
+            self.save()
+        has_sidecar = self.sidecar_path is not None and os.path.exists(self.sidecar_path)
+        if not columns or (self._content is None and not has_sidecar):
+            return
+        changed = self._read_db_columns(columns)
+        if self._content is not None:
+            for column in columns:
+                self._content[column] = changed[column].reindex(self._content.index)
+        if has_sidecar:
+            sidecar = read_sidecar(self.sidecar_path, RECORD_IDS_HEADER)
+            for column in columns:
+                sidecar[column] = changed[column].reindex(sidecar.index)
+            write_sidecar(self.sidecar_path, sidecar)
+
+
+    def _forget_column_profiles(self, columns: Iterable[str] = None) -> None:
+        """Drop the profiles of `columns` (all when None), which no longer describe the content."""
+        if self.column_profile is None:
+            return
+        if columns is None:
+            self.column_profile = None
+        else:
+            forgotten = set(columns)
+            self.column_profile = {c: p for c, p in self.column_profile.items() if c not in forgotten}
+
+
+    def profile_columns(self, columns: List[str] = None) -> dict:
+        """Profiles of `columns` (all when None), computing and saving the ones not known.
+
+        Profiles are kept from ingest until the content of their column changes; a
+        recomputed profile reads only its column, and describes the values as stored,
+        e.g. blanks of typed columns are NULL there.
+        """
+        columns = self.content_headers if columns is None else columns
+        known = self.column_profile or {}
+        missing = [c for c in columns if c not in known]
+        if missing:
+            profiler = ContentProfiler()
+            profiler.update(self.read_columns(missing))
+            self.column_profile = {**known, **profiler.to_dict()}
+            self.save()
+        return {c: self.column_profile[c] for c in columns}
 
 
     def exec_sql_read(self, sql: TextClause, index_by_record_ids=True) -> pd.DataFrame:
@@ -268,4 +1739,58 @@ class FileContent(db.Model, BasicCrudMixin):
             # file_content.save() hasn't occurred yet
             self._refresh_db_content()
         db_content = pd.read_sql(sql=sql, con=db.engine)
-        return self._content_from_db_content(db_content, index_by_record_ids=index_by_record_ids)
\ No newline at end of file
+        return self._content_from_db_content(db_content, index_by_record_ids=index_by_record_ids)
+
+
+def _unused_null_marker(frame: pd.DataFrame) -> str:
+    """COPY_NULL_MARKER, lengthened until no text value of `frame` equals it, so only missing values load as NULL."""
+    marker = COPY_NULL_MARKER
+    values = frame.select_dtypes(include=object).to_numpy()
+    index = frame.index.to_numpy() if frame.index.dtype == object else np.array([])
+    while (values == marker).any() or (index == marker).any():
+        marker += "N"
+    return marker
+
+
+@lru_cache(maxsize=None)
+def _unformatted_dialect(dialect_class: type) -> Dialect:
+    return dialect_class(paramstyle="named")
+
+
+def _quote_identifier(identifier: str) -> str:
+    """`identifier` quoted for sql that psycopg2 doesn't format, e.g. a COPY or a raw execute without parameters.
+
+    db.engine's dialect doubles the % of an identifier for psycopg2's formatting,
+    which only undoes it when there are parameters.
+    """
+    return _unformatted_dialect(type(db.engine.dialect)).identifier_preparer.quote(identifier)
+
+
+def _index_by_record_ids(frame: pd.DataFrame, record_ids: np.ndarray) -> pd.DataFrame:
+    """`frame` indexed by the text of `record_ids`, bytes as made by generate_record_ids."""
+    index = pd.Index(record_ids_to_text(record_ids), name=RECORD_IDS_HEADER)
+    return frame.set_axis(index, axis=0, copy=False)
+
+
+def _compile_sql(element: ClauseElement, **kwargs) -> str:
+    """`element` as postgres sql with its values inlined, to run outside of sqlalchemy or embed in text().
+
+    Neither psycopg2 without parameters nor text() undo a doubled %, so none is.
+    """
+    dialect = _unformatted_dialect(type(db.engine.dialect))
+    compiler = dialect.statement_compiler(dialect, None)
+    return compiler.process(element, literal_binds=True, **kwargs)
+
+
+def _escape_for_text(sql: str) -> str:
+    """`sql` with its colons escaped, since text() takes e.g. the ":hourly" of a header "Rate :hourly" for a bind parameter."""
+    return sql.replace(":", "\\:")
+
+
+def quote_in_text(identifier: str) -> str:
+    """`identifier` quoted for sql run through text(), which doubles its % itself."""
+    return _escape_for_text(_quote_identifier(identifier))
+
+
+def _engine_supports_copy() -> bool:
+    return db.engine.dialect.driver == "psycopg2"
@@ -0,0 +1,40 @@
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from sqlalchemy import BigInteger, ForeignKey, String, TIMESTAMP
+
+
+from extensions import db
+from db.mixins.basic_crud_mixin import BasicCrudMixin
+
+
+class KeyViolation(db.Model, BasicCrudMixin):
+    """A content row whose key value has no match in the key's reference.
+
+    Rows are written in bulk by cleaning.key_validation.validate_keys, one
+    INSERT ... SELECT per check, so ids are generated by the database.
+    """
+    __tablename__ = "key_violation"
+
+    id = db.Column("id", BigInteger, primary_key=True, autoincrement=True)
+    file_content_id = db.Column(
+        "file_content_id",
+        UUID(as_uuid=True),
+        ForeignKey("file_content.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    created_utc = db.Column(
+        "created_utc", TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    check_name = db.Column("check_name", String, nullable=False)
+    column_name = db.Column("column_name", String, nullable=False)
+    record_id = db.Column("record_id", String, nullable=False)
+    value = db.Column("value", String, nullable=False)
+
+    def to_dict(self):
+        return {
+            "check": self.check_name,
+            "column": self.column_name,
+            "record_id": self.record_id,
+            "value": self.value,
+        }
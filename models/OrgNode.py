@@ -0,0 +1,62 @@
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import BigInteger, ForeignKey, INTEGER, String
+
+
+from extensions import db
+from db.mixins.basic_crud_mixin import BasicCrudMixin
+
+# why an employee's place in the hierarchy isn't simply under their manager
+ISSUE_ORPHAN = "orphan"  # the manager isn't an employee of the roster; placed as a root
+ISSUE_CYCLE = "cycle"  # managers lead back to the employee; the cycle's first employee is placed as a root
+ISSUE_DUPLICATE = "duplicate"  # a later row of an Employee ID; left out of the hierarchy
+
+
+class OrgNode(db.Model, BasicCrudMixin):
+    """An employee of a roster in the manager hierarchy built by query.org_hierarchy.
+
+    Employees are numbered in pre-order, with every root's tree in file order and
+    reports in file order under their manager, so the reports of an employee,
+    direct or not, are the rows numbered from `preorder` + 1 through `subtree_end`.
+    `path` holds the Employee IDs of the managers above the employee, from the root
+    down. Rows are written in bulk, so ids are generated by the database.
+    """
+    __tablename__ = "org_node"
+
+    id = db.Column("id", BigInteger, primary_key=True, autoincrement=True)
+    file_content_id = db.Column(
+        "file_content_id",
+        UUID(as_uuid=True),
+        ForeignKey("file_content.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    employee_id = db.Column("employee_id", String, nullable=False)
+    manager_employee_id = db.Column("manager_employee_id", String, nullable=True)
+    record_id = db.Column("record_id", String, nullable=False)
+    # None for duplicates, which are left out of the hierarchy
+    preorder = db.Column("preorder", INTEGER, nullable=True)
+    subtree_end = db.Column("subtree_end", INTEGER, nullable=True)
+    depth = db.Column("depth", INTEGER, nullable=True)
+    path = db.Column("path", JSONB, nullable=True)
+    issue = db.Column("issue", String, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_org_node_file_content_id_employee_id", "file_content_id", "employee_id"),
+        db.Index("ix_org_node_file_content_id_preorder", "file_content_id", "preorder"),
+    )
+
+    @property
+    def report_count(self) -> int:
+        """Employees under this one, directly or not."""
+        if self.preorder is None:
+            return 0
+        return self.subtree_end - self.preorder
+
+    def to_dict(self):
+        return {
+            "employee_id": self.employee_id,
+            "manager_employee_id": self.manager_employee_id,
+            "record_id": self.record_id,
+            "depth": self.depth,
+            "report_count": self.report_count,
+            "issue": self.issue,
+        }
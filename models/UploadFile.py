@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.sql import func
 from sqlalchemy import Boolean, ForeignKey, INTEGER, String, TIMESTAMP
 from sqlalchemy.exc import DataError
@@ -13,6 +13,7 @@ from db.mixins.basic_crud_mixin import BasicCrudMixin
 
 class UploadFile(db.Model, BasicCrudMixin):
     __tablename__ = "upload_file"
+    cache_reads = True
 
     id = db.Column("id", UUID(as_uuid=True), primary_key=True)
     created_utc = db.Column(
@@ -31,6 +32,14 @@ class UploadFile(db.Model, BasicCrudMixin):
     mime_type = db.Column("mime_type", String, nullable=True)
     name = db.Column("name", String, nullable=False)
     storage_path = db.Column("storage_path", String, nullable=False)
+    # sha256 hex digest of the uploaded bytes; also the file's name in storage, so
+    # unique: identical uploads share one UploadFile
+    content_hash = db.Column("content_hash", String, nullable=True, index=True, unique=True)
+    # seconds per ingest phase and sql totals, see instrumentation.timing.UploadTimings
+    phase_timings = db.Column("phase_timings", JSONB, nullable=True)
+    # the roster the upload is a version of, e.g. a customer's id, as given by the uploader;
+    # later uploads with the same key can be stored as deltas of it
+    roster_key = db.Column("roster_key", String, nullable=True, index=True)
 
 
 
@@ -55,16 +64,36 @@ class UploadFile(db.Model, BasicCrudMixin):
         self.mime_type = kwargs.get("mime_type")
         self.name = kwargs.get("name")
         self.storage_path = kwargs.get("storage_path")
-        self.move_file_to_storage()
-
-    def move_file_to_storage(self):
-        file_dir = os.path.dirname(self.name)
-        file_path_relative = os.path.join(file_dir, 'data', self.name)
-        file_path_abs = os.path.abspath(file_path_relative)
-        file_new_path = os.path.join(self.storage_path, self.name)
-
-        # move file to storage path
-        os.replace(file_path_abs, file_new_path)
+        self.content_hash = kwargs.get("content_hash")
+        self.roster_key = kwargs.get("roster_key")
+
+    @property
+    def storage_file_name(self):
+        if self.content_hash is None:
+            return self.name
+        _, extension = os.path.splitext(self.name)
+        return f"{self.content_hash}{extension}"
+
+    @property
+    def stored_file_path(self):
+        return os.path.join(self.storage_path, self.storage_file_name)
+
+    @classmethod
+    def get_by_content_hash(cls, content_hash):
+        return cls.get_one(content_hash=content_hash)
+
+    def record_phase_timings(self, timings: dict):
+        """Add `timings` (UploadTimings.to_dict()) to those already recorded, and save."""
+        recorded = self.phase_timings or {"phases": {}, "sql_queries": 0, "sql_seconds": 0.0}
+        phases = dict(recorded["phases"])
+        for phase, seconds in timings["phases"].items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        self.phase_timings = {
+            "phases": phases,
+            "sql_queries": recorded["sql_queries"] + timings["sql_queries"],
+            "sql_seconds": recorded["sql_seconds"] + timings["sql_seconds"],
+        }
+        self.save()
 
     def recursive_delete(self):
         try:
@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import and_, func, or_
+from sqlalchemy import ForeignKey, INTEGER, String, TIMESTAMP
+from uuid import uuid4
+import logging
+
+
+from extensions import db
+from db.mixins.basic_crud_mixin import BasicCrudMixin
+
+# upload job states, in the order a job moves through them
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# a running job whose worker hasn't renewed its lease for this long is taken to
+# have lost the worker, e.g. to a crashed process, and is claimed again
+DEFAULT_JOB_LEASE_SECONDS = 300
+# claims of a job before it's failed rather than run again
+MAX_JOB_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJob(db.Model, BasicCrudMixin):
+    """A stored upload waiting for, or going through, ingest by a background worker.
+
+    The upload_job table doubles as the work queue: workers claim the oldest queued
+    job with SELECT ... FOR UPDATE SKIP LOCKED, so any number of worker threads or
+    processes can share it without an external broker. A running job's worker
+    renews its lease by touching modified_utc; once the lease runs out the job is
+    claimed again, up to MAX_JOB_ATTEMPTS times.
+    """
+    __tablename__ = "upload_job"
+
+    id = db.Column("id", UUID(as_uuid=True), primary_key=True)
+    upload_file_id = db.Column(
+        "upload_file_id", UUID(as_uuid=True), ForeignKey("upload_file.id"), nullable=False
+    )
+    file_content_id = db.Column(
+        "file_content_id", UUID(as_uuid=True), ForeignKey("file_content.id"), nullable=True
+    )
+    created_utc = db.Column(
+        "created_utc", TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    modified_utc = db.Column(
+        "modified_utc",
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        onupdate=func.now(),
+    )
+    started_utc = db.Column("started_utc", TIMESTAMP(timezone=True), nullable=True)
+    finished_utc = db.Column("finished_utc", TIMESTAMP(timezone=True), nullable=True)
+
+    state = db.Column("state", String, nullable=False, index=True)
+    rows_processed = db.Column("rows_processed", INTEGER, nullable=False)
+    error = db.Column("error", String, nullable=True)
+    attempts = db.Column("attempts", INTEGER, nullable=False, server_default="0")
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.get("id", uuid4())
+        self.upload_file_id = kwargs.get("upload_file_id")
+        self.created_utc = kwargs.get("created_utc", datetime.utcnow())
+        self.modified_utc = kwargs.get("modified_utc", datetime.utcnow())
+        self.state = kwargs.get("state", JOB_QUEUED)
+        self.rows_processed = kwargs.get("rows_processed", 0)
+        self.attempts = kwargs.get("attempts", 0)
+
+    @classmethod
+    def claim_next(cls, lease_seconds: float = DEFAULT_JOB_LEASE_SECONDS):
+        """Mark the oldest queued job, or running job with an expired lease, as running and return it.
+
+        Returns None if there are none. A job claimed MAX_JOB_ATTEMPTS times already
+        is failed instead, and the next one claimed.
+        """
+        while True:
+            lease_expired = and_(
+                cls.state == JOB_RUNNING,
+                cls.modified_utc < func.now() - timedelta(seconds=lease_seconds),
+            )
+            job = (
+                cls.query
+                .filter(or_(cls.state == JOB_QUEUED, lease_expired))
+                .order_by(cls.created_utc)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if job is None:
+                db.session.rollback()
+                return None
+            if job.state == JOB_RUNNING:
+                logger.warning("Upload job %s lost its worker after attempt %d", job.id, job.attempts)
+            if job.attempts >= MAX_JOB_ATTEMPTS:
+                job.state = JOB_FAILED
+                job.error = f"Gave up after {job.attempts} attempts"
+                job.finished_utc = datetime.utcnow()
+                job.save()
+                continue
+            job.state = JOB_RUNNING
+            job.attempts += 1
+            job.started_utc = datetime.utcnow()
+            job.save()
+            return job
+
+    @classmethod
+    def renew_lease(cls, job_id):
+        """Tell other workers the job is still being run; see claim_next."""
+        db.session.query(cls).filter(cls.id == job_id, cls.state == JOB_RUNNING).update(
+            {cls.modified_utc: func.now()}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def report_progress(self, rows_processed: int):
+        self.rows_processed = rows_processed
+        self.save()
+
+    def succeed(self, file_content_id):
+        self.state = JOB_SUCCEEDED
+        self.file_content_id = file_content_id
+        self.finished_utc = datetime.utcnow()
+        self.save()
+
+    def fail(self, error: Exception):
+        db.session.rollback()
+        self.state = JOB_FAILED
+        self.error = f"{type(error).__name__}: {error}"
+        self.finished_utc = datetime.utcnow()
+        self.save()
+
+    def to_dict(self):
+        return {
+            "job_id": str(self.id),
+            "state": self.state,
+            "rows_processed": self.rows_processed,
+            "error": self.error,
+            "attempts": self.attempts,
+            "upload_file_id": str(self.upload_file_id),
+            "file_content_id": str(self.file_content_id) if self.file_content_id else None,
+            "started_utc": self.started_utc.isoformat() if self.started_utc else None,
+            "finished_utc": self.finished_utc.isoformat() if self.finished_utc else None,
+        }
@@ -0,0 +1,90 @@
+"""Columnar copies of FileContent content, stored as Arrow IPC (Feather v2) files.
+
+A sidecar sits next to the stored upload and holds the same rows as the content
+table, so whole-column reads can memory-map the file instead of decoding rows out
+of postgres. Postgres stays the source of truth; a missing sidecar just means reads
+go to the content table. pyarrow is optional: without it sidecars are never written.
+"""
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+
+SIDECAR_EXTENSION = ".arrow"
+
+
+class SidecarSchemaError(Exception):
+    """A frame written to a sidecar doesn't fit the column types of the frames before it."""
+    pass
+
+
+def sidecars_supported() -> bool:
+    return pa is not None
+
+
+class ContentSidecarWriter:
+    """Writes frames to a sidecar as consecutive record batches.
+
+    The file is written under a temporary name and moved into place on close, so
+    readers never see a partial sidecar.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._temp_path = f"{path}.partial"
+        self._writer = None
+        self._schema = None
+
+    def write(self, frame: pd.DataFrame) -> None:
+        # the index (record ids) is stored as an ordinary column so it can be projected
+        table = pa.Table.from_pandas(frame.reset_index(), preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = ipc.new_file(self._temp_path, self._schema)
+        elif not table.schema.equals(self._schema, check_metadata=False):
+            try:
+                table = table.cast(self._schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise SidecarSchemaError(f"Frame doesn't fit the schema of {self._path}") from e
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        os.replace(self._temp_path, self._path)
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+def write_sidecar(path: str, frame: pd.DataFrame) -> None:
+    writer = ContentSidecarWriter(path)
+    try:
+        writer.write(frame)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def read_sidecar(path: str, index_column: str, columns=None) -> pd.DataFrame:
+    """Read `columns` (all when None) of a sidecar through a memory map, indexed by `index_column`."""
+    if columns is not None:
+        columns = [index_column, *columns]
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas().set_index(index_column)
+
+
+def remove_sidecar(path: str) -> None:
+    if path is not None and os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,181 @@
+"""Column type inference for FileContent content tables.
+
+Uploaded values arrive as text. A content schema maps each content column to the
+narrowest type every non-blank value of the column parses as, so content tables can
+use native INTEGER/NUMERIC/DATE/BOOLEAN columns instead of TEXT. Blank values are
+stored as NULL in typed columns. Checks and conversions are vectorized per column.
+
+Schemas are plain dicts, stored as JSON on file_content, e.g.
+    {"Base Salary": {"type": "numeric"}, "Date of Hire": {"type": "date", "format": "%m/%d/%y"}}
+"""
+from datetime import date
+from typing import Dict, Iterable
+
+import pandas as pd
+from pandas.api.types import infer_dtype, is_float_dtype
+from sqlalchemy import BigInteger, Boolean, Date, Numeric, Text
+
+TEXT = "text"
+INTEGER = "integer"
+NUMERIC = "numeric"
+DATE = "date"
+BOOLEAN = "boolean"
+
+SQL_TYPES = {
+    TEXT: Text,
+    INTEGER: BigInteger,
+    NUMERIC: Numeric,
+    DATE: Date,
+    BOOLEAN: Boolean,
+}
+
+# date formats tried, in order, when inferring a date column
+DATE_FORMATS = ("%m/%d/%y", "%m/%d/%Y", "%Y-%m-%d")
+# two-digit years are the latest year ending in them at most this many years from now;
+# strptime alone makes 1/1/68 a date in 2068, while hire and birth dates are in the past
+TWO_DIGIT_YEAR_MAX_YEARS_AHEAD = 10
+TRUE_VALUES = frozenset(["y", "yes", "true", "t"])
+FALSE_VALUES = frozenset(["n", "no", "false", "f"])
+
+# at most 18 digits so every value fits a BIGINT. A leading zero, as in 007 or a
+# zip code, makes a value text: stored as a number it would lose the zero.
+_INTEGER_PATTERN = r"[+-]?(?:0|[1-9]\d{0,17})"
+_NUMERIC_PATTERN = r"[+-]?(?:(?:0|[1-9]\d*)(?:\.\d*)?|\.\d+)"
+
+ContentSchema = Dict[str, dict]
+
+
+def _is_text(values: pd.Series) -> bool:
+    return infer_dtype(values, skipna=True) in ("string", "empty")
+
+
+def _present_values(values: pd.Series) -> pd.Series:
+    stripped = values.str.strip()
+    return stripped[stripped.notna() & (stripped != "")]
+
+
+def _parse_dates(values: pd.Series, date_format: str) -> pd.Series:
+    dates = pd.to_datetime(values, format=date_format, errors="coerce")
+    if "%y" in date_format:
+        latest_year = date.today().year + TWO_DIGIT_YEAR_MAX_YEARS_AHEAD
+        dates = dates.mask(dates.dt.year > latest_year, dates - pd.DateOffset(years=100))
+    return dates
+
+
+def _accepts(present: pd.Series, column_type: dict) -> bool:
+    """Whether every value in `present` (stripped, non-blank text) parses as `column_type`."""
+    type_name = column_type["type"]
+    if type_name == TEXT or present.empty:
+        return True
+    if type_name == INTEGER:
+        return bool(present.str.fullmatch(_INTEGER_PATTERN).all())
+    if type_name == NUMERIC:
+        return bool(present.str.fullmatch(_NUMERIC_PATTERN).all())
+    if type_name == BOOLEAN:
+        return bool(present.str.lower().isin(TRUE_VALUES | FALSE_VALUES).all())
+    if type_name == DATE:
+        return bool(_parse_dates(present, column_type["format"]).notna().all())
+    raise ValueError(f"Unknown content column type: {type_name}")
+
+
+def infer_column_type(values: pd.Series) -> dict:
+    if not _is_text(values):
+        return {"type": TEXT}
+    present = _present_values(values)
+    if present.empty:
+        return {"type": TEXT}
+
+    candidates = [{"type": INTEGER}, {"type": NUMERIC}, {"type": BOOLEAN}]
+    candidates += [{"type": DATE, "format": date_format} for date_format in DATE_FORMATS]
+    for candidate in candidates:
+        if _accepts(present, candidate):
+            return candidate
+    return {"type": TEXT}
+
+
+def infer_content_schema(frame: pd.DataFrame, text_columns: Iterable[str] = ()) -> ContentSchema:
+    """Infer the type of every column of `frame`; `text_columns` are always TEXT."""
+    text_columns = set(text_columns)
+    return {
+        column: {"type": TEXT} if column in text_columns else infer_column_type(frame[column])
+        for column in frame.columns
+    }
+
+
+def widen_content_schema(schema: ContentSchema, frame: pd.DataFrame) -> ContentSchema:
+    """The narrowest schema at least as wide as `schema` that also accepts the values of `frame`.
+
+    Integer columns widen to numeric when they can; anything else that no longer
+    parses widens to text.
+    """
+    widened = dict(schema)
+    for column, column_type in schema.items():
+        if column not in frame.columns or not _is_text(frame[column]):
+            continue
+        present = _present_values(frame[column])
+        if _accepts(present, column_type):
+            continue
+        if column_type["type"] == INTEGER and _accepts(present, {"type": NUMERIC}):
+            widened[column] = {"type": NUMERIC}
+        else:
+            widened[column] = {"type": TEXT}
+    return widened
+
+
+def to_db_values(frame: pd.DataFrame, schema: ContentSchema) -> pd.DataFrame:
+    """Copy of `frame` with typed columns rewritten as text postgres parses, blanks as NULL."""
+    converted = {}
+    for column, column_type in schema.items():
+        type_name = column_type["type"]
+        if type_name == TEXT or column not in frame.columns:
+            continue
+        values = frame[column]
+        if not _is_text(values):
+            # already typed, e.g. content read back from the content table
+            if type_name == INTEGER and is_float_dtype(values):
+                converted[column] = values.astype("Int64")
+            continue
+
+        stripped = values.str.strip()
+        blank = stripped.isna() | (stripped == "")
+        if type_name == BOOLEAN:
+            stripped = stripped.str.lower().isin(TRUE_VALUES).map({True: "true", False: "false"})
+        elif type_name == DATE:
+            stripped = _parse_dates(stripped, column_type["format"]).dt.strftime("%Y-%m-%d")
+        converted[column] = stripped.mask(blank, None)
+
+    if not converted:
+        return frame
+    return frame.assign(**converted)
+
+
+def sql_types(schema: ContentSchema) -> dict:
+    return {column: SQL_TYPES[column_type["type"]]() for column, column_type in schema.items()}
+
+
+def to_analytics_dtypes(frame: pd.DataFrame, schema: ContentSchema) -> pd.DataFrame:
+    """Copy of `frame`, as returned by to_db_values, with typed columns as pandas dtypes.
+
+    Used for columnar copies of content, where numbers and dates should be stored
+    as such rather than as text.
+    """
+    converted = {}
+    for column, column_type in schema.items():
+        type_name = column_type["type"]
+        if type_name == TEXT or column not in frame.columns:
+            continue
+        values = frame[column]
+        if type_name == INTEGER:
+            converted[column] = pd.to_numeric(values).astype("Int64")
+        elif type_name == NUMERIC:
+            converted[column] = pd.to_numeric(values).astype("float64")
+        elif type_name == DATE:
+            converted[column] = pd.to_datetime(values)
+        elif type_name == BOOLEAN:
+            if _is_text(values):
+                values = values.map({"true": True, "false": False})
+            converted[column] = values.astype("boolean")
+
+    if not converted:
+        return frame
+    return frame.assign(**converted)
@@ -0,0 +1,111 @@
+"""Bulk generation of FileContent record ids.
+
+A record id is uuid.uuid5(file_content_id, str(row_position)). Rather than building
+one uuid.UUID per row, the SHA-1 behind uuid5 is computed for a whole batch of row
+positions at once with numpy: the namespace plus the longest row position still fits
+in a single 64-byte SHA-1 block, so every row is one compression over uint32 columns.
+Ids are kept as 16-byte rows of a uint8 array and only formatted as text on request.
+"""
+import uuid
+
+import numpy as np
+
+# rows hashed per numpy pass; bounds the (80, batch) message schedule to ~20MB
+RECORD_ID_BATCH_SIZE = 65536
+
+_SHA1_INITIAL_STATE = (0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476, 0xC3D2E1F0)
+_SHA1_ROUND_CONSTANTS = (0x5A827999, 0x6ED9EBA1, 0x8F1BBCDC, 0xCA62C1D6)
+_SHA1_BLOCK_BYTES = 64
+# namespace bytes + 0x80 terminator + 8-byte message length
+_MAX_NAME_BYTES = _SHA1_BLOCK_BYTES - 16 - 1 - 8
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+# where the 32 hex digits go in the 36-character canonical uuid text
+_HEX_POSITIONS = np.array(
+    [i for i in range(36) if i not in (8, 13, 18, 23)], dtype=np.intp
+)
+
+
+def _rotate_left(words: np.ndarray, bits: int) -> np.ndarray:
+    return (words << np.uint32(bits)) | (words >> np.uint32(32 - bits))
+
+
+def _sha1_single_block(blocks: np.ndarray) -> np.ndarray:
+    """SHA-1 of messages already padded to one block each; (n, 64) uint8 -> (n, 20) uint8."""
+    words = blocks.view(">u4").astype(np.uint32)
+    schedule = np.empty((80, blocks.shape[0]), dtype=np.uint32)
+    schedule[:16] = words.T
+    for t in range(16, 80):
+        schedule[t] = _rotate_left(
+            schedule[t - 3] ^ schedule[t - 8] ^ schedule[t - 14] ^ schedule[t - 16], 1
+        )
+
+    a, b, c, d, e = (np.full(blocks.shape[0], h, dtype=np.uint32) for h in _SHA1_INITIAL_STATE)
+    for t in range(80):
+        if t < 20:
+            f = (b & c) | (~b & d)
+        elif t < 40 or t >= 60:
+            f = b ^ c ^ d
+        else:
+            f = (b & c) | (b & d) | (c & d)
+        k = np.uint32(_SHA1_ROUND_CONSTANTS[t // 20])
+        a, b, c, d, e = _rotate_left(a, 5) + f + e + k + schedule[t], a, _rotate_left(b, 30), c, d
+
+    digest = np.stack([
+        a + np.uint32(_SHA1_INITIAL_STATE[0]),
+        b + np.uint32(_SHA1_INITIAL_STATE[1]),
+        c + np.uint32(_SHA1_INITIAL_STATE[2]),
+        d + np.uint32(_SHA1_INITIAL_STATE[3]),
+        e + np.uint32(_SHA1_INITIAL_STATE[4]),
+    ], axis=1)
+    return digest.astype(">u4").view(np.uint8)
+
+
+def _position_blocks(namespace: uuid.UUID, positions: np.ndarray, digits: int) -> np.ndarray:
+    """Padded SHA-1 blocks for namespace + str(position), for positions with `digits` digits."""
+    blocks = np.zeros((positions.shape[0], _SHA1_BLOCK_BYTES), dtype=np.uint8)
+    blocks[:, :16] = np.frombuffer(namespace.bytes, dtype=np.uint8)
+    remaining = positions.copy()
+    for i in range(digits - 1, -1, -1):
+        blocks[:, 16 + i] = ord("0") + remaining % 10
+        remaining //= 10
+    blocks[:, 16 + digits] = 0x80
+    message_bits = (16 + digits) * 8
+    blocks[:, -8:] = np.frombuffer(np.array(message_bits, dtype=">u8").tobytes(), dtype=np.uint8)
+    return blocks
+
+
+def generate_record_ids(namespace: uuid.UUID, start: int, count: int) -> np.ndarray:
+    """Record ids of rows `start` to `start + count - 1`, as a (count, 16) uint8 array.
+
+    Row i of the result holds the bytes of uuid.uuid5(namespace, str(start + i)).
+    """
+    record_ids = np.empty((count, 16), dtype=np.uint8)
+    for batch_start in range(0, count, RECORD_ID_BATCH_SIZE):
+        batch_count = min(RECORD_ID_BATCH_SIZE, count - batch_start)
+        positions = np.arange(start + batch_start, start + batch_start + batch_count, dtype=np.int64)
+        digit_counts = np.ones(batch_count, dtype=np.int64)
+        for power in range(1, len(str(positions[-1]))):
+            digit_counts += positions >= 10 ** power
+        for digits in np.unique(digit_counts):
+            if digits > _MAX_NAME_BYTES:
+                raise ValueError(f"Row position too large for a record id: {positions[-1]}")
+            rows = digit_counts == digits
+            digest = _sha1_single_block(_position_blocks(namespace, positions[rows], int(digits)))
+            record_ids[batch_start:batch_start + batch_count][rows] = digest[:, :16]
+
+    # uuid version 5 and RFC 4122 variant bits, as uuid.UUID(bytes=..., version=5) sets them
+    record_ids[:, 6] = (record_ids[:, 6] & 0x0F) | 0x50
+    record_ids[:, 8] = (record_ids[:, 8] & 0x3F) | 0x80
+    return record_ids
+
+
+def record_ids_to_text(record_ids: np.ndarray) -> np.ndarray:
+    """Canonical 36-character uuid text for each row of a (n, 16) uint8 record id array."""
+    hex_digits = np.empty((record_ids.shape[0], 32), dtype=np.uint8)
+    hex_digits[:, 0::2] = _HEX_DIGITS[record_ids >> 4]
+    hex_digits[:, 1::2] = _HEX_DIGITS[record_ids & 0x0F]
+
+    text = np.full((record_ids.shape[0], 36), ord("-"), dtype=np.uint8)
+    text[:, _HEX_POSITIONS] = hex_digits
+    return text.view("S36").ravel().astype(str)
@@ -0,0 +1,240 @@
+"""Whole-content exports of FileContent, streamed as csv or parquet.
+
+Exports never hold more than a few blocks of the content in memory, whatever its
+size, and start sending as soon as postgres produces the first rows:
+
+- csv comes straight out of COPY (...) TO STDOUT. psycopg2 runs the COPY to
+  completion in a single call, so it runs on a thread of its own and hands the
+  data over in blocks through a bounded queue, which also holds the COPY back
+  while the client is slow to read.
+- parquet is written a row group at a time from batches of a server-side cursor.
+
+Either can be gzipped on the way out with `gzip_blocks`.
+"""
+import json
+import queue
+import threading
+import uuid
+import zlib
+from decimal import Decimal
+from typing import Iterable, Iterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+
+from models.content_types import BOOLEAN, DATE, INTEGER, NUMERIC
+from models.FileContent import DATA_FRAME_CONTENT_INDEX_HEADER, METADATA_HEADER
+
+# bytes handed over per block, and blocks buffered between the COPY and the response
+EXPORT_BLOCK_SIZE = 64 * 1024
+EXPORT_QUEUE_BLOCKS = 16
+# rows per parquet row group, fetched from the server-side cursor at a time
+PARQUET_BATCH_ROWS = 65536
+
+_END = object()
+
+
+class _ExportCancelled(Exception):
+    """The client went away; raised from the COPY's writes to abort it."""
+    pass
+
+
+def parquet_supported() -> bool:
+    return pa is not None
+
+
+class _BlockWriter:
+    """Target of copy_expert that passes what it's given on to the queue in blocks."""
+
+    def __init__(self, blocks: queue.Queue, cancelled: threading.Event, block_size: int):
+        self._blocks = blocks
+        self._cancelled = cancelled
+        self._block_size = block_size
+        self._buffer = []
+        self._buffered = 0
+        # the first rows go out on their own, so the response starts right away
+        self._sent_first = False
+
+    def put(self, item) -> None:
+        while True:
+            if self._cancelled.is_set():
+                raise _ExportCancelled()
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data: bytes) -> None:
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._block_size or not self._sent_first:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            self.put(b"".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+            self._sent_first = True
+
+
+def _run_copy(engine, copy_sql: str, writer: _BlockWriter) -> None:
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(copy_sql, writer)
+        connection.commit()
+        writer.flush()
+        writer.put(_END)
+    except _ExportCancelled:
+        # the COPY was abandoned mid-stream; don't hand the connection back to the pool
+        connection.invalidate()
+    except Exception as e:
+        connection.invalidate()
+        try:
+            writer.put(e)
+        except _ExportCancelled:
+            pass
+    finally:
+        connection.close()
+
+
+def iter_csv_export(
+    engine,
+    select_sql: str,
+    block_size: int = EXPORT_BLOCK_SIZE,
+    queue_blocks: int = EXPORT_QUEUE_BLOCKS,
+) -> Iterator[bytes]:
+    """The rows of `select_sql` as csv with a header row, from COPY (...) TO STDOUT."""
+    copy_sql = f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    blocks = queue.Queue(maxsize=queue_blocks)
+    cancelled = threading.Event()
+    writer = _BlockWriter(blocks, cancelled, block_size)
+    threading.Thread(target=_run_copy, args=(engine, copy_sql, writer), daemon=True).start()
+    try:
+        while True:
+            block = blocks.get()
+            if block is _END:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield block
+    finally:
+        # stops the COPY when the response is closed before the end
+        cancelled.set()
+
+
+def arrow_schema(columns: List[str], content_schema: dict) -> "pa.Schema":
+    """Arrow types of exported `columns`, per the content schema; numeric is float64 as in sidecars."""
+    arrow_types = {
+        INTEGER: pa.int64(),
+        NUMERIC: pa.float64(),
+        DATE: pa.date32(),
+        BOOLEAN: pa.bool_(),
+    }
+    fields = []
+    for column in columns:
+        if column == DATA_FRAME_CONTENT_INDEX_HEADER:
+            fields.append(pa.field(column, pa.int64()))
+            continue
+        column_type = (content_schema or {}).get(column, {}).get("type")
+        fields.append(pa.field(column, arrow_types.get(column_type, pa.string())))
+    return pa.schema(fields)
+
+
+def _arrow_values(values: Iterable, field: "pa.Field") -> list:
+    if field.name == METADATA_HEADER:
+        # jsonb comes back from psycopg2 parsed
+        return [None if v is None else json.dumps(v) for v in values]
+    if field.type == pa.float64():
+        return [float(v) if isinstance(v, Decimal) else v for v in values]
+    return list(values)
+
+
+class _DrainableBuffer:
+    """Output of a ParquetWriter whose written bytes can be taken out as they come.
+
+    Positions keep counting across drains, since the writer records offsets.
+    """
+
+    def __init__(self):
+        self._blocks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._blocks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._blocks)
+        self._blocks = []
+        return data
+
+
+def iter_parquet_export(
+    engine,
+    select_sql: str,
+    schema: "pa.Schema",
+    compression: str = "snappy",
+    batch_rows: int = PARQUET_BATCH_ROWS,
+) -> Iterator[bytes]:
+    """The rows of `select_sql` as a parquet file, a row group per batch of `batch_rows`."""
+    sink = _DrainableBuffer()
+    connection = engine.raw_connection()
+    try:
+        # a named cursor is a server-side one: rows are fetched a batch at a time
+        with connection.cursor(name=f"export_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = batch_rows
+            cursor.execute(select_sql)
+            with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+                # "PAR1", so the response starts before the first batch is fetched
+                header = sink.drain()
+                if header:
+                    yield header
+                while True:
+                    rows = cursor.fetchmany(batch_rows)
+                    if not rows:
+                        break
+                    arrays = [
+                        pa.array(_arrow_values(values, field), type=field.type)
+                        for values, field in zip(zip(*rows), schema)
+                    ]
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                    data = sink.drain()
+                    if data:
+                        yield data
+        connection.commit()
+        # the footer, written when the writer closed
+        yield sink.drain()
+    finally:
+        connection.close()
+
+
+def gzip_blocks(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """`blocks` compressed on the fly as one gzip stream."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    first = True
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if first:
+            # zlib holds on to its input; let the first block through at once
+            compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if compressed:
+            yield compressed
+    yield compressor.flush()
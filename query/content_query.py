@@ -0,0 +1,225 @@
+"""Filters and paging for HTTP reads of FileContent content.
+
+Filters are small boolean expressions over content columns, e.g.
+    "Job Code" = 'ENG1' AND ("Base Salary" >= 50000 OR "Manager Employee ID" IS NULL)
+
+They compile to SQLAlchemy clauses in which every value is a bound parameter and
+every column is checked against the content's headers, so nothing from the request
+is spliced into the sql. Supported: = != <> < <= > >= [NOT] LIKE [NOT] IN (...)
+IS [NOT] NULL, combined with AND, OR, NOT and parentheses. Columns are double
+quoted, or bare when they're a single word; values are single quoted strings or
+numbers. Values are bound as text so postgres parses them as the column's type.
+"""
+import csv
+import io
+import json
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import and_, literal, not_, or_
+from sqlalchemy.sql import column
+from sqlalchemy.sql.expression import ClauseElement
+
+# bounds the work (and recursion) a single filter can ask for
+MAX_FILTER_TOKENS = 256
+
+_TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+        (?P<string>'(?:[^']|'')*')
+        |(?P<identifier>"(?:[^"]|"")+")
+        |(?P<number>[+-]?(?:\d+\.?\d*|\.\d+))
+        |(?P<operator><=|>=|!=|<>|=|<|>)
+        |(?P<punctuation>[(),])
+        |(?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""",
+    re.VERBOSE,
+)
+_KEYWORDS = frozenset(["AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE"])
+_COMPARISONS = {
+    "=": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    "<>": lambda column, value: column != value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+}
+
+
+class FilterSyntaxError(ValueError):
+    pass
+
+
+def _tokenize(expression: str) -> List[tuple]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN_PATTERN.match(expression, position)
+        if match is None or match.end() == position:
+            raise FilterSyntaxError(f"Unexpected character at {position}: {expression[position:position + 10]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "word" and value.upper() in _KEYWORDS:
+            kind, value = "keyword", value.upper()
+        tokens.append((kind, value))
+        position = match.end()
+        if len(tokens) > MAX_FILTER_TOKENS:
+            raise FilterSyntaxError(f"Filter is longer than {MAX_FILTER_TOKENS} tokens.")
+    return tokens
+
+
+class _FilterParser:
+    def __init__(self, tokens: List[tuple], columns: Iterable[str]):
+        self._tokens = tokens
+        self._position = 0
+        self._columns = set(columns)
+
+    def parse(self) -> ClauseElement:
+        clause = self._or()
+        if self._peek() is not None:
+            raise FilterSyntaxError(f"Unexpected {self._peek()[1]!r}")
+        return clause
+
+    def _peek(self) -> Optional[tuple]:
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _next(self) -> tuple:
+        token = self._peek()
+        if token is None:
+            raise FilterSyntaxError("Unexpected end of filter")
+        self._position += 1
+        return token
+
+    def _accept(self, kind: str, value: str = None) -> bool:
+        token = self._peek()
+        if token is not None and token[0] == kind and (value is None or token[1] == value):
+            self._position += 1
+            return True
+        return False
+
+    def _expect(self, kind: str, value: str) -> None:
+        if not self._accept(kind, value):
+            token = self._peek()
+            found = "end of filter" if token is None else repr(token[1])
+            raise FilterSyntaxError(f"Expected {value!r}, found {found}")
+
+    def _or(self) -> ClauseElement:
+        clauses = [self._and()]
+        while self._accept("keyword", "OR"):
+            clauses.append(self._and())
+        return clauses[0] if len(clauses) == 1 else or_(*clauses)
+
+    def _and(self) -> ClauseElement:
+        clauses = [self._not()]
+        while self._accept("keyword", "AND"):
+            clauses.append(self._not())
+        return clauses[0] if len(clauses) == 1 else and_(*clauses)
+
+    def _not(self) -> ClauseElement:
+        if self._accept("keyword", "NOT"):
+            return not_(self._not())
+        if self._accept("punctuation", "("):
+            clause = self._or()
+            self._expect("punctuation", ")")
+            return clause
+        return self._comparison()
+
+    def _column(self):
+        kind, value = self._next()
+        if kind == "identifier":
+            name = value[1:-1].replace('""', '"')
+        elif kind == "word":
+            name = value
+        else:
+            raise FilterSyntaxError(f"Expected a column, found {value!r}")
+        if name not in self._columns:
+            raise FilterSyntaxError(f"Unknown column: {name!r}")
+        return column(name)
+
+    def _value(self):
+        kind, value = self._next()
+        if kind == "string":
+            return literal(value[1:-1].replace("''", "'"))
+        if kind == "number":
+            return literal(value)
+        raise FilterSyntaxError(f"Expected a value, found {value!r}")
+
+    def _comparison(self) -> ClauseElement:
+        column = self._column()
+        if self._accept("keyword", "IS"):
+            negated = self._accept("keyword", "NOT")
+            self._expect("keyword", "NULL")
+            return column.isnot(None) if negated else column.is_(None)
+
+        negated = self._accept("keyword", "NOT")
+        if self._accept("keyword", "LIKE"):
+            clause = column.like(self._value())
+        elif self._accept("keyword", "IN"):
+            self._expect("punctuation", "(")
+            values = [self._value()]
+            while self._accept("punctuation", ","):
+                values.append(self._value())
+            self._expect("punctuation", ")")
+            clause = column.in_(values)
+        elif negated:
+            raise FilterSyntaxError("Expected LIKE or IN after NOT")
+        else:
+            kind, operator = self._next()
+            if kind != "operator":
+                raise FilterSyntaxError(f"Expected a comparison, found {operator!r}")
+            clause = _COMPARISONS[operator](column, self._value())
+        return not_(clause) if negated else clause
+
+
+def parse_filter(expression: str, columns: Iterable[str]) -> Optional[ClauseElement]:
+    """Compile a filter expression over `columns` to a where clause; None for a blank filter.
+
+    Columns are left unqualified and quoted by the dialect when the clause compiles.
+    """
+    if expression is None or expression.strip() == "":
+        return None
+    tokens = _tokenize(expression)
+    return _FilterParser(tokens, columns).parse()
+
+
+def json_value(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def iter_json_page(columns: Sequence[str], rows: Iterable[tuple], limit: int) -> Iterator[str]:
+    """A page of content rows as a json document, produced a row at a time.
+
+    `rows` are (__index__, *values) tuples in file order; reading one more than
+    `limit` of them tells whether there's a next page, whose cursor comes last.
+    """
+    yield f'{{"columns": {json.dumps(list(columns))}, "rows": ['
+    last_index = None
+    next_cursor = None
+    for count, (index, *values) in enumerate(rows):
+        if count == limit:
+            next_cursor = last_index
+            break
+        separator = "," if count else ""
+        yield separator + json.dumps({c: json_value(v) for c, v in zip(columns, values)})
+        last_index = index
+    yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+
+def iter_csv_page(columns: Sequence[str], rows: Iterable[tuple]) -> Iterator[str]:
+    """A page of content rows as csv, with a header row, produced a row at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for _, *values in rows:
+        writer.writerow(["" if v is None else json_value(v) for v in values])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
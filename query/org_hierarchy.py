@@ -0,0 +1,281 @@
+"""The manager hierarchy of a roster, indexed at ingest for org-tree lookups.
+
+Every roster row links an Employee ID to a Manager Employee ID. Rather than walk
+those links with a recursive query for every question, `index_org_hierarchy`
+numbers the employees of an upload once, in pre-order, and stores the numbering
+in org_node (see models.OrgNode). Then
+
+- everyone under an employee, directly or not, is the range of rows numbered
+  from the employee's number + 1 to their `subtree_end`, and their direct
+  reports are the rows of that range one level deeper;
+- the managers above an employee are listed in their `path`, and looked up by
+  Employee ID.
+
+Both are index scans on org_node, however deep or wide the hierarchy. Links that
+don't form a tree are flagged rather than rejected: an employee whose manager
+isn't on the roster is an orphan, and placed as a root; employees whose managers
+lead back to themselves are a cycle, which is broken at its first employee in
+file order, who is placed as a root. Later rows of a duplicated Employee ID are
+left out of the hierarchy, and rows without an Employee ID aren't stored at all.
+"""
+import logging
+from json.encoder import encode_basestring
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from extensions import db
+from instrumentation.timing import time_phase
+from models.FileContent import DataFrameCsvStream, FileContent
+from models.OrgNode import ISSUE_CYCLE, ISSUE_DUPLICATE, ISSUE_ORPHAN, OrgNode
+
+logger = logging.getLogger(__name__)
+
+EMPLOYEE_ID_COLUMN = "Employee ID"
+MANAGER_ID_COLUMN = "Manager Employee ID"
+RECORD_ID_HEADER = "record_id"
+
+
+class _Forest:
+    """Children of every node of a parent array, as contiguous runs in file order."""
+
+    def __init__(self, parent: np.ndarray):
+        self.parent = parent
+        # a stable sort keeps the children of a node in file order; roots (-1) sort first
+        self._order = np.argsort(parent, kind="stable")
+        sorted_parent = parent[self._order]
+        nodes = np.arange(len(parent))
+        self._starts = np.searchsorted(sorted_parent, nodes, side="left")
+        self._counts = np.searchsorted(sorted_parent, nodes, side="right") - self._starts
+
+    @property
+    def roots(self) -> np.ndarray:
+        return np.flatnonzero(self.parent < 0)
+
+    def children(self, nodes: np.ndarray) -> np.ndarray:
+        """The children of `nodes`, grouped by node in the order of `nodes`."""
+        counts = self._counts[nodes]
+        if not counts.any():
+            return nodes[:0]
+        # offset of every child in _order: its node's start plus its rank among the node's children
+        group_starts = np.cumsum(counts) - counts
+        offsets = np.repeat(self._starts[nodes] - group_starts, counts) + np.arange(counts.sum())
+        return self._order[offsets]
+
+    def levels(self) -> List[np.ndarray]:
+        """Nodes reachable from the roots, a level at a time; each level grouped by parent."""
+        levels = []
+        level = self.roots
+        while level.size:
+            levels.append(level)
+            level = self.children(level)
+        return levels
+
+
+def _cycle_members(parent: np.ndarray, unplaced: np.ndarray) -> np.ndarray:
+    """Which of the `unplaced` nodes (not under any root) lie on a cycle rather than lead into one."""
+    remaining = np.zeros(len(parent), dtype=bool)
+    remaining[unplaced] = True
+    # the parents of nodes that aren't under a root aren't under a root either
+    in_degree = np.bincount(parent[unplaced], minlength=len(parent))
+    leaves = unplaced[in_degree[unplaced] == 0]
+    while leaves.size:
+        remaining[leaves] = False
+        parents = parent[leaves]
+        np.subtract.at(in_degree, parents, 1)
+        parents = np.unique(parents)
+        leaves = parents[(in_degree[parents] == 0) & remaining[parents]]
+    return np.flatnonzero(remaining)
+
+
+def _cycle_roots(parent: np.ndarray, members: np.ndarray) -> np.ndarray:
+    """The first node in file order of every cycle among `members`."""
+    # pointer jumping: after k rounds a node knows the least of the 2 ** k nodes from it on
+    first = np.arange(len(parent))
+    successor = parent.copy()
+    while True:
+        least = np.minimum(first[members], first[successor[members]])
+        if np.array_equal(least, first[members]):
+            break
+        first[members] = least
+        successor[members] = successor[successor[members]]
+    return members[first[members] == members]
+
+
+def build_hierarchy(employee_ids: pd.Series, manager_ids: pd.Series) -> pd.DataFrame:
+    """Place the employees of a roster in its manager hierarchy, in pre-order.
+
+    Returns a frame with a row per row of the roster that has an Employee ID, with
+    the index of `employee_ids`, and employee_id, manager_employee_id, preorder,
+    subtree_end, depth, path (as JSON) and issue columns, as stored in org_node.
+    """
+    employee_ids = employee_ids.where(employee_ids.notna(), "").astype(str)
+    manager_ids = manager_ids.where(manager_ids.notna(), "").astype(str)
+    has_id = (employee_ids != "").to_numpy()
+    employee_ids, manager_ids = employee_ids[has_id], manager_ids[has_id]
+    duplicate = employee_ids.duplicated(keep="first").to_numpy()
+
+    # nodes are the first row of every Employee ID, in file order
+    employees = employee_ids[~duplicate].to_numpy(dtype=object)
+    managers = manager_ids[~duplicate].to_numpy(dtype=object)
+    parent = pd.Index(employees).get_indexer(managers)
+    issues = np.full(len(employees), None, dtype=object)
+    issues[(parent < 0) & (managers != "")] = ISSUE_ORPHAN
+
+    placed = np.zeros(len(employees), dtype=bool)
+    for level in _Forest(parent).levels():
+        placed[level] = True
+    unplaced = np.flatnonzero(~placed)
+    if unplaced.size:
+        members = _cycle_members(parent, unplaced)
+        issues[members] = ISSUE_CYCLE
+        parent[_cycle_roots(parent, members)] = -1
+
+    forest = _Forest(parent)
+    levels = forest.levels()
+    sizes = np.ones(len(employees), dtype=np.int64)
+    for level in reversed(levels[1:]):
+        np.add.at(sizes, parent[level], sizes[level])
+
+    preorder = np.zeros(len(employees), dtype=np.int64)
+    depth = np.zeros(len(employees), dtype=np.int64)
+    # the JSON of every path without its brackets, built from the parent's
+    quoted = np.full(len(employees), None, dtype=object)
+    with_reports = np.unique(parent[parent >= 0])
+    quoted[with_reports] = [encode_basestring(employees[i]) for i in with_reports]
+    path_items = np.full(len(employees), "", dtype=object)
+    for level_depth, level in enumerate(levels):
+        # a node comes after its parent and the subtrees of the siblings before it
+        before = np.cumsum(sizes[level]) - sizes[level]
+        depth[level] = level_depth
+        if level_depth == 0:
+            preorder[level] = 1 + before
+            continue
+        level_parents = parent[level]
+        group_start = np.flatnonzero(np.r_[True, level_parents[1:] != level_parents[:-1]])
+        before -= np.repeat(before[group_start], np.diff(np.r_[group_start, len(level)]))
+        preorder[level] = preorder[level_parents] + 1 + before
+        path_items[level] = [
+            f"{path_items[up]}, {quoted[up]}" if level_depth > 1 else quoted[up]
+            for up in level_parents.tolist()
+        ]
+
+    rows = np.flatnonzero(~duplicate)
+
+    def spread(values, dtype=object):
+        # values of the nodes at their roster rows; duplicates get none
+        column = np.full(len(duplicate), None if dtype is object else 0, dtype=dtype)
+        column[rows] = values
+        return column if dtype is object else pd.arrays.IntegerArray(column, duplicate.copy())
+
+    issue_column = spread(issues)
+    issue_column[duplicate] = ISSUE_DUPLICATE
+    return pd.DataFrame(
+        {
+            "employee_id": employee_ids.to_numpy(dtype=object),
+            "manager_employee_id": manager_ids.where(manager_ids != "", None).to_numpy(dtype=object),
+            "preorder": spread(preorder, np.int64),
+            "subtree_end": spread(preorder + sizes - 1, np.int64),
+            "depth": spread(depth, np.int64),
+            "path": spread([f"[{items}]" for items in path_items]),
+            "issue": issue_column,
+        },
+        index=employee_ids.index.rename(RECORD_ID_HEADER),
+    )
+
+
+def index_org_hierarchy(file_content: FileContent) -> Dict[str, int]:
+    """Build the hierarchy of `file_content` and store it in org_node, replacing an earlier one.
+
+    Skipped for content without both Employee ID and Manager Employee ID columns.
+    Returns the number of employees per issue.
+    """
+    if not {EMPLOYEE_ID_COLUMN, MANAGER_ID_COLUMN} <= set(file_content.content_headers):
+        return {}
+    with time_phase("org_hierarchy"):
+        roster = file_content.read_columns([EMPLOYEE_ID_COLUMN, MANAGER_ID_COLUMN])
+        nodes = build_hierarchy(roster[EMPLOYEE_ID_COLUMN], roster[MANAGER_ID_COLUMN])
+        nodes.insert(0, "file_content_id", str(file_content.id))
+
+        connection = db.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {OrgNode.__tablename__} WHERE file_content_id = %s", (str(file_content.id),)
+                )
+                column_names = [RECORD_ID_HEADER, *nodes.columns]
+                stream = DataFrameCsvStream(nodes)
+                cursor.copy_expert(
+                    f"COPY {OrgNode.__tablename__} ({', '.join(column_names)})"
+                    f" FROM STDIN WITH (FORMAT csv, NULL '{stream.null_marker}')",
+                    stream,
+                )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    issue_counts = nodes["issue"].value_counts().to_dict()
+    for issue, count in issue_counts.items():
+        logger.info("%d employees of %s placed as %s", count, file_content.id, issue)
+    return issue_counts
+
+
+def hierarchy_summary(file_content_id) -> dict:
+    """Size and shape of an upload's hierarchy, and its employees per issue."""
+    placed = OrgNode.preorder.isnot(None)
+    employee_count, root_count, max_depth = db.session.query(
+        func.count(OrgNode.id).filter(placed),
+        func.count(OrgNode.id).filter(OrgNode.depth == 0),
+        func.max(OrgNode.depth),
+    ).filter(OrgNode.file_content_id == file_content_id).one()
+    issue_counts = dict(
+        db.session.query(OrgNode.issue, func.count())
+        .filter(OrgNode.file_content_id == file_content_id, OrgNode.issue.isnot(None))
+        .group_by(OrgNode.issue)
+    )
+    return {
+        "employee_count": employee_count,
+        "root_count": root_count,
+        "max_depth": max_depth,
+        "issues": {issue: issue_counts.get(issue, 0) for issue in (ISSUE_ORPHAN, ISSUE_CYCLE, ISSUE_DUPLICATE)},
+    }
+
+
+def find_employee(file_content_id, employee_id: str) -> Optional[OrgNode]:
+    return OrgNode.query.filter(
+        OrgNode.file_content_id == file_content_id,
+        OrgNode.employee_id == employee_id,
+        OrgNode.preorder.isnot(None),
+    ).first()
+
+
+def managers_of(node: OrgNode) -> List[OrgNode]:
+    """The managers above `node`, from its root down."""
+    if not node.path:
+        return []
+    return (
+        OrgNode.query.filter(
+            OrgNode.file_content_id == node.file_content_id,
+            OrgNode.employee_id.in_(node.path),
+            OrgNode.preorder.isnot(None),
+        )
+        .order_by(OrgNode.depth)
+        .all()
+    )
+
+
+def reports_query(node: OrgNode, direct: bool = False):
+    """Query of the employees under `node` in pre-order; only its direct reports when `direct`."""
+    query = OrgNode.query.filter(
+        OrgNode.file_content_id == node.file_content_id,
+        OrgNode.preorder > node.preorder,
+        OrgNode.preorder <= node.subtree_end,
+    )
+    if direct:
+        query = query.filter(OrgNode.depth == node.depth + 1)
+    return query.order_by(OrgNode.preorder)
@@ -1,9 +1,139 @@
 from app import (
+    _remove_upload_file,
+    _run_upload_job,
+    app,
+    upload_worker_pool,
     get_storage_path,
     get_file_size_in_bytes,
-    get_file_mime_type
+    get_file_mime_type,
 )
+from extensions import db
+from models.FileContent import (
+    DataFrameCsvStream, DataFrameStorageLayoutError, FileContent, STORAGE_LAYOUT_SHARED, STORAGE_LAYOUT_TABLE,
+)
+from models.UploadFile import UploadFile
+from models.UploadJob import JOB_FAILED, JOB_RUNNING, JOB_SUCCEEDED, UploadJob
+from jobs.upload_worker import UploadWorkerPool
+from db.read_cache import MISS, ReadCache, read_cache
+from models.content_profile import EXACT_DISTINCT_LIMIT, ContentProfiler
+from models.record_ids import generate_record_ids, record_ids_to_text
+from models.content_types import (
+    DATE,
+    NUMERIC,
+    infer_content_schema,
+    to_db_values,
+    widen_content_schema,
+)
+from ingest.spreadsheet import read_xlsx_chunks
+from ingest.upload_stream import UploadStream
+from ingest.batch import BATCH_FAILED, BATCH_ROLLED_BACK, BatchFile, parse_and_normalize
+from bench.roster import generate_roster, read_template_roster
+from instrumentation.metrics import MetricsRegistry
+from instrumentation.timing import INGEST_PHASE_SECONDS, collect_upload_timings, time_phase, timed_iter
+from query.content_query import FilterSyntaxError, iter_json_page, parse_filter
+from query.content_export import _DrainableBuffer, arrow_schema, gzip_blocks, iter_csv_export, iter_parquet_export
+from query.org_hierarchy import build_hierarchy
+from cleaning.key_normalization import (
+    KeyNormalizer,
+    KeyRule,
+    MAP,
+    STRIP,
+    UPPER,
+    ZERO_PAD,
+)
+from cleaning.key_validation import KeyCheck, validate_keys
+from cleaning.sql_transform import compile_rules, transform_contents
+import datetime
+import gc
+import gzip
+import hashlib
+import io
+import json
 import os
+import uuid
+import weakref
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+
+@pytest.fixture
+def database():
+    """An app context on the migrated database at TEST_DATABASE_URL; skipped without one."""
+    database_url = os.environ.get("TEST_DATABASE_URL")
+    if not database_url:
+        pytest.skip("TEST_DATABASE_URL isn't set")
+    default_url = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    try:
+        with app.app_context():
+            yield db
+            db.session.remove()
+    finally:
+        app.config['SQLALCHEMY_DATABASE_URI'] = default_url
+
+
+@pytest.fixture
+def save_content(database):
+    """Saves FileContents of frames, each with an UploadFile of its own; deleted after the test."""
+    saved = []
+
+    def save(frame, roster_key=None, **kwargs):
+        upload_file = UploadFile(
+            name="roster.csv", storage_path="", file_size_bytes=0, content_hash=uuid.uuid4().hex,
+            roster_key=roster_key,
+        )
+        upload_file.save()
+        file_content = FileContent(upload_file_id=upload_file.id, name="roster.csv", content=frame, **kwargs)
+        file_content.save()
+        saved.append((upload_file.id, file_content.id))
+        return file_content
+
+    yield save
+    for upload_file_id, file_content_id in reversed(saved):
+        file_content = FileContent.get_one(id=file_content_id)
+        if file_content is not None:
+            file_content.delete()
+        UploadFile.get_one(id=upload_file_id).delete()
+
+
+@pytest.fixture
+def queue_upload_job(database, tmp_path):
+    """Queues UploadJobs of csv texts stored under tmp_path; deleted after the test with what they ingested.
+
+    The app's workers are stopped meanwhile, and jobs are dated in 2000 so they're
+    claimed ahead of any others in the database.
+    """
+    upload_worker_pool.stop()
+    queued = []
+
+    def queue(csv_text, created_utc, **kwargs):
+        upload_file = UploadFile(
+            name="roster.csv",
+            storage_path=str(tmp_path),
+            file_size_bytes=len(csv_text),
+            mime_type="text/csv",
+            content_hash=uuid.uuid4().hex,
+        )
+        with open(upload_file.stored_file_path, "w") as stored_file:
+            stored_file.write(csv_text)
+        upload_file.save()
+        job = UploadJob(upload_file_id=upload_file.id, created_utc=created_utc, **kwargs)
+        job.modified_utc = created_utc
+        job.save()
+        queued.append(job.id)
+        return job
+
+    yield queue
+    db.session.rollback()
+    for job_id in queued:
+        job = UploadJob.get_one(id=job_id)
+        upload_file = UploadFile.get_one(id=job.upload_file_id)
+        job.delete()
+        _remove_upload_file(upload_file)
 
 
 def test_get_storage_path():
@@ -27,3 +157,854 @@ def test_get_file_mime_type():
        'application/xlsx',
        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     ]
+
+
+def test_read_xlsx_chunks_matches_csv():
+    data_dir = os.path.join(os.path.dirname(__file__), 'data')
+    chunks = list(read_xlsx_chunks(os.path.join(data_dir, 'employee-test.xlsx'), 40))
+    assert [chunk.shape[0] for chunk in chunks] == [40, 40, 13]
+
+    from_xlsx = pd.concat(chunks, ignore_index=True)
+    from_csv = pd.read_csv(
+        os.path.join(data_dir, 'processed/employee-test.csv'), dtype=str, keep_default_na=False)
+    pd.testing.assert_frame_equal(from_xlsx, from_csv)
+
+
+def test_read_xlsx_chunks_of_a_header_only_sheet(tmp_path):
+    workbook = Workbook()
+    workbook.active.append(["Employee ID", "Job Code"])
+    workbook.save(str(tmp_path / "header.xlsx"))
+
+    chunks = list(read_xlsx_chunks(str(tmp_path / "header.xlsx"), 40))
+    assert len(chunks) == 1
+    assert list(chunks[0].columns) == ["Employee ID", "Job Code"] and chunks[0].empty
+    assert list(pd.concat(chunks, ignore_index=True).columns) == ["Employee ID", "Job Code"]
+
+    Workbook().save(str(tmp_path / "empty.xlsx"))
+    with pytest.raises(pd.errors.EmptyDataError):
+        list(read_xlsx_chunks(str(tmp_path / "empty.xlsx"), 40))
+
+
+def test_upload_stream_stores_and_hashes_what_it_reads(tmp_path):
+    data = b"Employee ID,Job Code\n" + b"".join(b"E%07d,%d\n" % (i, i % 7) for i in range(1000))
+    upload = UploadStream(io.BytesIO(data), str(tmp_path), block_size=64)
+    assert upload.peek(11) == b"Employee ID"
+    assert upload.peek(100) == data[:100]
+
+    upload.finish()
+    assert upload.size == len(data)
+    assert upload.content_hash == hashlib.sha256(data).hexdigest()
+
+    stored_path = os.path.join(str(tmp_path), "stored.csv")
+    upload.store(stored_path)
+    with open(stored_path, "rb") as stored_file:
+        assert stored_file.read() == data
+    assert os.listdir(str(tmp_path)) == ["stored.csv"]
+
+
+def test_upload_stream_discard_removes_partial_copy(tmp_path):
+    upload = UploadStream(io.BytesIO(b"x" * 1000), str(tmp_path), block_size=100)
+    upload.peek(150)
+    upload.discard()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_data_frame_csv_stream_reads_in_chunks():
+    frame = pd.DataFrame(
+        {"Employee ID": ["1", "2", None], "Job Code": ["a", "", "c"]},
+        index=pd.Index(["r1", "r2", "r3"], name="__record_ids__"),
+    )
+    stream = DataFrameCsvStream(frame, chunk_size=2)
+    data = ""
+    while True:
+        block = stream.read(5)
+        if not block:
+            break
+        data += block
+    assert data == "r1,1,a\nr2,2,\nr3,\\N,c\n"
+
+    # reads of any size, and the rest at once
+    stream = DataFrameCsvStream(frame, chunk_size=1)
+    assert [stream.read(3), stream.read(11), stream.read(), stream.read()] == [
+        "r1,", "1,a\nr2,2,\nr", "3,\\N,c\n", ""
+    ]
+
+
+def test_data_frame_csv_stream_keeps_null_marker_values_apart_from_missing_ones():
+    frame = pd.DataFrame(
+        {"Employee ID": ["1", "\\N", None], "Job Code": ["\\NN", "", "c"]},
+        index=pd.Index(["r1", "r2", "r3"], name="__record_ids__"),
+    )
+    stream = DataFrameCsvStream(frame)
+    assert stream.null_marker == "\\NNN"
+    assert stream.read() == "r1,1,\\NN\nr2,\\N,\nr3,\\NNN,c\n"
+
+
+def test_key_normalizer_cleans_keys_and_counts_changes():
+    frame = pd.DataFrame({
+        "Employee ID": [" e10 ", "E11", "e12", " e10 "],
+        "Job Code": ["41111", "7", "", "41111"],
+        "First Name": [" Angie ", "Barry", "Cal", " Angie "],
+    })
+    normalizer = KeyNormalizer([
+        KeyRule("Employee ID", STRIP),
+        KeyRule("Employee ID", UPPER),
+        KeyRule("Job Code", ZERO_PAD, width=6),
+    ])
+
+    cleaned = normalizer(frame)
+
+    assert list(cleaned["Employee ID"]) == ["E10", "E11", "E12", "E10"]
+    assert list(cleaned["Job Code"]) == ["041111", "000007", "", "041111"]
+    assert list(cleaned["First Name"]) == list(frame["First Name"])
+    assert normalizer.change_counts == {
+        "Employee ID:strip": 2,
+        "Employee ID:upper": 3,
+        "Job Code:zero_pad": 3,
+    }
+
+
+def test_key_normalizer_maps_values():
+    frame = pd.DataFrame({"Job Code": ["OLD1", "41111", "OLD2", ""]})
+    normalizer = KeyNormalizer([KeyRule("Job Code", MAP, mapping={"OLD1": "41111", "OLD2": "41112"})])
+
+    assert list(normalizer(frame)["Job Code"]) == ["41111", "41111", "41112", ""]
+    assert normalizer.change_counts == {"Job Code:map": 2}
+
+
+def test_compile_rules_nests_a_columns_rules_in_order():
+    expressions, parameters = compile_rules([
+        KeyRule("Employee ID", STRIP),
+        KeyRule("Job Code", MAP, mapping={"OLD1": "41111"}),
+        KeyRule("Employee ID", UPPER),
+        KeyRule("Job Code", ZERO_PAD, width=6),
+    ])
+
+    assert expressions["Employee ID"] == "upper(btrim({value}, :whitespace))"
+    assert expressions["Job Code"] == (
+        "CASE WHEN coalesce(CAST(:mapping_1 AS jsonb) ->> {value}, {value}) = ''"
+        " OR length(coalesce(CAST(:mapping_1 AS jsonb) ->> {value}, {value})) >= 6"
+        " THEN coalesce(CAST(:mapping_1 AS jsonb) ->> {value}, {value})"
+        " ELSE lpad(coalesce(CAST(:mapping_1 AS jsonb) ->> {value}, {value}), 6, '0') END"
+    )
+    assert json.loads(parameters["mapping_1"]) == {"OLD1": "41111"}
+    assert parameters["whitespace"].strip() == ""
+
+
+def test_content_profiler_counts_across_chunks():
+    frame = pd.DataFrame({
+        "Job Code": ["41111", "41111", "", None, "  ", "7", "41111", "7"],
+        "Employee ID": [f"E{i:07d}" for i in range(8)],
+    })
+    profiler = ContentProfiler()
+    profiler.update(frame.iloc[:5])
+    profiler.update(frame.iloc[5:])
+
+    job_codes = profiler.to_dict()["Job Code"]
+    assert job_codes["count"] == 8
+    assert job_codes["null_count"] == 1
+    assert job_codes["blank_count"] == 2
+    assert (job_codes["min_length"], job_codes["max_length"]) == (0, 5)
+    assert job_codes["distinct_count"] == 4
+    assert not job_codes["distinct_approximate"]
+    assert job_codes["top_values"][:2] == [{"value": "41111", "count": 3}, {"value": "7", "count": 2}]
+
+
+def test_content_profiler_estimates_many_distinct_values():
+    rows = EXACT_DISTINCT_LIMIT * 20
+    frame = pd.DataFrame({"Employee ID": [f"E{i:07d}" for i in range(rows)], "Job Code": ["41111"] * rows})
+    profiler = ContentProfiler()
+    for start in range(0, rows, 8192):
+        profiler.update(frame.iloc[start:start + 8192])
+
+    profile = profiler.to_dict()
+    assert profile["Employee ID"]["distinct_approximate"]
+    assert abs(profile["Employee ID"]["distinct_count"] - rows) < rows * 0.03
+    assert profile["Job Code"]["top_values"] == [{"value": "41111", "count": rows}]
+
+
+def test_iter_content_reads_pages_in_file_order_and_content_loads_them_at_once(save_content, monkeypatch):
+    frame = pd.DataFrame({
+        "Employee ID": [f"E{i}" for i in range(25)],
+        "Job Code": ["41111" if i % 3 == 0 else "7" for i in range(25)],
+    })
+    file_content = FileContent.get_one(id=save_content(frame).id)
+    namespace = uuid.UUID(str(file_content.id))
+    record_ids = [str(uuid.uuid5(namespace, str(position))) for position in range(25)]
+
+    pages = file_content.iter_content(page_size=10)
+    assert next(pages).index.tolist() == record_ids[:10]
+    assert [page.shape[0] for page in pages] == [10, 5]
+
+    job_codes = list(file_content.iter_content(
+        page_size=4, columns=["Job Code"], where=text('"Job Code" = :job_code').bindparams(job_code="41111"),
+    ))
+    assert [list(page.columns) for page in job_codes] == [["Job Code"]] * 3
+    assert pd.concat(job_codes).index.tolist() == record_ids[::3]
+
+    iter_content, concat, concatenated = FileContent.iter_content, pd.concat, []
+    monkeypatch.setattr(
+        FileContent, "iter_content", lambda self, page_size=10, **kwargs: iter_content(self, page_size, **kwargs)
+    )
+    monkeypatch.setattr(pd, "concat", lambda objs, **kwargs: concatenated.append(len(objs)) or concat(objs, **kwargs))
+    content = file_content.content
+    assert concatenated == [3]
+    assert content.index.tolist() == record_ids
+    assert content["Employee ID"].tolist() == frame["Employee ID"].tolist()
+
+
+def test_delta_version_keeps_its_rows_positions_and_record_ids(save_content):
+    base = save_content(pd.DataFrame({
+        "Employee ID": ["E1", "E2", "E3", "E4", "E5", "E6"],
+        "Base Salary": ["10", "20", "30", "40", "50", "60"],
+    }))
+    # E3 changed and moved to the top, E7 added, E6 removed
+    version = save_content(pd.DataFrame({
+        "Employee ID": ["E3", "E1", "E7", "E2", "E4", "E5"],
+        "Base Salary": ["35", "10", "70", "20", "40", "50"],
+    }))
+
+    def rows(file_content):
+        with db.engine.connect() as connection:
+            return connection.execute(text(
+                f'SELECT "__index__", "__record_ids__", "Employee ID", "Base Salary"'
+                f' FROM {file_content.content_table_name} ORDER BY "__index__"'
+            )).fetchall()
+
+    stored_in_full, content = rows(version), version.read_columns()
+    assert version.store_as_delta(base)
+    version = FileContent.get_one(id=version.id)
+    assert version.uses_delta_layout
+    assert rows(version) == stored_in_full
+    pd.testing.assert_frame_equal(version.read_columns(), content)
+
+    # changing the base first stores the version in full, which then keeps its rows
+    base.update_content(pd.DataFrame({"Base Salary": ["11"]}, index=base.content.index[:1]))
+    base.save()
+    version = FileContent.get_one(id=version.id)
+    assert not version.uses_delta_layout and version.base_file_content_id is None
+    assert rows(version) == stored_in_full
+
+
+def test_transform_contents_stores_deltas_in_full_before_its_transaction(save_content):
+    employee_ids = [" e1", "e2 ", "E3", "E4", "E5"]
+    base = save_content(pd.DataFrame({"Employee ID": employee_ids, "Base Salary": ["10", "20", "30", "40", "50"]}))
+    version = save_content(pd.DataFrame({"Employee ID": employee_ids, "Base Salary": ["10", "25", "30", "40", "50"]}))
+    assert version.store_as_delta(base)
+
+    rules = [KeyRule("Employee ID", STRIP), KeyRule("Employee ID", UPPER)]
+    row_counts = transform_contents([base, FileContent.get_one(id=version.id)], rules)
+
+    assert row_counts == {str(base.id): 2, str(version.id): 2}
+    version = FileContent.get_one(id=version.id)
+    assert not version.uses_delta_layout
+    for file_content in (FileContent.get_one(id=base.id), version):
+        assert list(file_content.read_columns()["Employee ID"]) == ["E1", "E2", "E3", "E4", "E5"]
+
+
+def test_previous_version_is_the_latest_finished_upload_of_the_same_roster(save_content):
+    roster_key, other_roster_key = uuid.uuid4().hex, uuid.uuid4().hex
+    frame = pd.DataFrame({"Employee ID": ["E1", "E2"], "Base Salary": ["10", "20"]})
+    base = save_content(frame, roster_key=roster_key)
+    other = save_content(frame, roster_key=other_roster_key)
+    for file_content in (base, other):
+        file_content.ingested_utc = datetime.datetime.utcnow()
+        file_content.save()
+    # still loading
+    save_content(frame, roster_key=roster_key)
+    version = save_content(frame, roster_key=roster_key)
+
+    assert version.previous_version(roster_key).id == base.id
+    assert version.previous_version(other_roster_key).id == other.id
+    assert version.previous_version(uuid.uuid4().hex) is None
+
+
+def test_uploads_are_stored_as_deltas_of_their_own_roster(database, monkeypatch):
+    monkeypatch.setitem(app.config, "ROSTER_DELTAS", True)
+    tag = uuid.uuid4().hex
+    rows = [f"E{i}{tag},{i}0" for i in range(4)]
+    uploaded = []
+
+    def upload(rows, roster_key):
+        response = app.test_client().post(
+            f"/processUpload?roster_key={roster_key}",
+            data={"file": (io.BytesIO("\n".join(["Employee ID,Base Salary", *rows]).encode()), "roster.csv")},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 200
+        uploaded.append(response.get_json()["upload_file_id"])
+        return FileContent.get_one(id=uuid.UUID(response.get_json()["file_content_id"]))
+
+    try:
+        first = upload(rows, f"acme-{tag}")
+        second = upload(rows[:3] + [f"E3{tag},35"], f"acme-{tag}")
+        other = upload(rows[:3] + [f"E3{tag},36"], f"globex-{tag}")
+        assert first.ingested_utc is not None and not first.uses_delta_layout
+        assert second.uses_delta_layout and second.base_file_content_id == first.id
+        assert not other.uses_delta_layout
+    finally:
+        for upload_file_id in reversed(uploaded):
+            _remove_upload_file(UploadFile.get_one(id=uuid.UUID(upload_file_id)))
+
+
+def test_null_marker_values_load_as_text(save_content):
+    file_content = save_content(pd.DataFrame({"Employee ID": ["E1", "E2", "E3"], "Note": ["\\N", "", None]}))
+    notes = FileContent.get_one(id=file_content.id)._read_db_columns(["Note"])["Note"]
+    assert notes.tolist() == ["\\N", "", None]
+
+
+def test_percent_headers_load_and_update(save_content):
+    file_content = save_content(pd.DataFrame({"Employee ID": ["E1", "E2"], "Bonus %": ["5", "10"]}))
+    file_content = FileContent.get_one(id=file_content.id)
+    file_content.update_content(pd.DataFrame({"Bonus %": ["7"]}, index=file_content.content.index[:1]))
+    file_content.save()
+    assert FileContent.get_one(id=file_content.id)._read_db_columns(["Bonus %"])["Bonus %"].tolist() == [7, 10]
+
+
+@pytest.mark.parametrize("storage_layout", [STORAGE_LAYOUT_TABLE, STORAGE_LAYOUT_SHARED])
+def test_columns_widened_to_text_mid_load_keep_their_text(database, tmp_path, storage_layout):
+    chunks = [
+        pd.DataFrame({"Employee ID": ["E1", "E2"], "Overtime Eligible": ["Y", "n"], "Date of Hire": ["1/2/20", ""]}),
+        pd.DataFrame({"Employee ID": ["E3", "E4"], "Overtime Eligible": ["N", "maybe"], "Date of Hire": ["TBD", "3/4/21"]}),
+        pd.DataFrame({"Employee ID": ["E5"], "Overtime Eligible": ["yes"], "Date of Hire": ["5/6/22"]}),
+    ]
+    upload_file = UploadFile(name="roster.csv", storage_path="", file_size_bytes=0, content_hash=uuid.uuid4().hex)
+    upload_file.save()
+    try:
+        file_content = FileContent.from_chunks(
+            iter(chunks),
+            upload_file_id=upload_file.id,
+            name="roster.csv",
+            reread=lambda: iter(chunks),
+            sidecar_dir=str(tmp_path),
+            storage_layout=storage_layout,
+        )
+        file_content = FileContent.get_one(id=file_content.id)
+        assert file_content.content_schema["Overtime Eligible"] == {"type": "text"}
+        assert file_content.content_schema["Date of Hire"] == {"type": "text"}
+        content = file_content._read_db_columns()
+        assert content["Overtime Eligible"].tolist() == ["Y", "n", "N", "maybe", "yes"]
+        assert content["Date of Hire"].tolist() == ["1/2/20", "", "TBD", "3/4/21", "5/6/22"]
+        pd.testing.assert_frame_equal(file_content.read_columns(), content)
+    finally:
+        db.session.rollback()
+        file_content = FileContent.get_one(upload_file_id=upload_file.id)
+        if file_content is not None:
+            file_content.delete()
+        upload_file.delete()
+
+
+def test_widened_content_schema_is_not_read_from_the_cache(save_content):
+    file_content = save_content(pd.DataFrame({"Employee ID": ["E1", "E2"], "Std Hours": ["40", "20"]}))
+    file_content_id = file_content.id
+    assert read_cache.enabled
+    assert FileContent.get_one(id=file_content_id).content_schema["Std Hours"]["type"] == "integer"
+
+    file_content._widen_content_schema(pd.DataFrame({"Std Hours": ["about 40"]}))
+    # a hit is only taken from the cache by a session that doesn't hold the row already
+    db.session.expunge_all()
+    assert FileContent.get_one(id=file_content_id).content_schema["Std Hours"]["type"] == "text"
+
+
+def test_saving_a_row_only_drops_the_cached_reads_it_is_in_or_matches(save_content):
+    roster_key = uuid.uuid4().hex
+    saved = save_content(pd.DataFrame({"Employee ID": ["E1"]}), roster_key=roster_key)
+    other = save_content(pd.DataFrame({"Employee ID": ["E1"]}))
+    saved_id, other_id = saved.id, other.id
+    other_upload_file_id = other.upload_file_id
+    for file_content_id in (saved_id, other_id):
+        FileContent.get_one(id=file_content_id)
+    UploadFile.get_many(roster_key=roster_key)
+    db.session.expunge_all()
+
+    def cached(model, kind, **filter):
+        return read_cache.get((model.__name__, kind, frozenset(filter.items()))) is not MISS
+
+    saved = FileContent.get_one(id=saved_id)
+    saved.ingested_utc = datetime.datetime.utcnow()
+    saved.save()
+    assert not cached(FileContent, "one", id=saved_id)
+    assert cached(FileContent, "one", id=other_id)
+
+    # a row that now matches a cached filter drops it; the rows cached by id stay
+    assert cached(UploadFile, "many", roster_key=roster_key)
+    upload_file = UploadFile.get_one(id=other_upload_file_id)
+    upload_file.roster_key = roster_key
+    upload_file.save()
+    assert not cached(UploadFile, "many", roster_key=roster_key)
+    assert len(UploadFile.get_many(roster_key=roster_key)) == 2
+
+    FileContent.get_one(id=other_id).delete()
+    assert not cached(FileContent, "one", id=other_id)
+
+
+def test_content_reads_the_same_from_the_sidecar_and_the_database(save_content, tmp_path):
+    file_content = save_content(pd.DataFrame({
+        "Employee ID": ["E1", "E2", "E3"],
+        "Std Hours Worked per Week": ["40", "", "20"],
+        "Base Salary": ["57720", "40314.2", ""],
+        "Date of Hire": ["1/1/1999", "", "3/15/2005"],
+        "Overtime Eligible": ["Y", "N", ""],
+        "Division": ["FIN", "", None],
+    }), sidecar_dir=str(tmp_path))
+    file_content = FileContent.get_one(id=file_content.id)
+    assert os.path.exists(file_content.sidecar_path)
+
+    from_sidecar = file_content.read_columns()
+    from_database = file_content._read_db_columns()
+    pd.testing.assert_frame_equal(from_sidecar, from_database)
+    assert from_database["Std Hours Worked per Week"].dtype == "Int64"
+    assert from_database["Date of Hire"].dtype == "datetime64[ns]"
+
+    # empty reads are typed the same way
+    empty = file_content._analytics_frame(from_database.iloc[:0].astype(object))
+    pd.testing.assert_series_equal(empty.dtypes, from_sidecar.dtypes)
+
+
+def test_shared_layout_reads_and_updates_headers_with_colons_and_percents(save_content):
+    frame = pd.DataFrame({
+        "Employee ID": ["E1", "E2", "E3"],
+        "Rate :hourly": ["10", "20", None],
+        "Note's :text": ["a", "b:c", ""],
+        "Bonus %": ["5", "10", "15"],
+        "Manager %": ["", "E1", "E9"],
+    })
+    shared = save_content(frame, storage_layout=STORAGE_LAYOUT_SHARED)
+    own = save_content(frame)
+
+    for file_content in (shared, own):
+        file_content = FileContent.get_one(id=file_content.id)
+        content = file_content.read_columns()
+        assert content["Rate :hourly"].iloc[:2].tolist() == [10, 20] and pd.isna(content["Rate :hourly"].iloc[2])
+        assert content["Note's :text"].tolist() == ["a", "b:c", ""]
+        assert content["Bonus %"].tolist() == [5, 10, 15]
+        with db.engine.connect() as connection:
+            page = connection.execute(file_content.content_query(["Rate :hourly"], after_index=1)).fetchall()
+            assert [row[-1] for row in page] == [20, None]
+            assert connection.execute(text(
+                f'SELECT count(*) FROM {file_content.content_relation("content")} WHERE content."Rate \\:hourly" > 10'
+            )).scalar() == 1
+            assert connection.execute(text(
+                f'SELECT count(*) FROM {file_content.content_relation("content")} WHERE content."Bonus %" > 5'
+            )).scalar() == 2
+            cursor = connection.connection.cursor()
+            cursor.execute(file_content.export_select(["Note's :text"]))
+            assert [row[1] for row in cursor.fetchall()] == ["a", "b:c", ""]
+        assert validate_keys(file_content, [KeyCheck("Manager %", "Employee ID")]) == {
+            "Manager %->content.Employee ID": 1
+        }
+
+        with db.engine.begin() as connection:
+            result = connection.execute(file_content.sql_column_update({"Note's :text": "upper({value})"}))
+        assert result.rowcount == 2
+        file_content.refresh_cached_columns(["Note's :text"])
+        assert file_content.read_columns(["Note's :text"])["Note's :text"].tolist() == ["A", "B:C", ""]
+
+    with pytest.raises(DataFrameStorageLayoutError):
+        shared.exec_sql_update(text("SELECT 1"))
+
+    # the notes as updated above, and one bonus changed
+    version = save_content(frame.assign(**{"Note's :text": ["A", "B:C", ""], "Bonus %": ["5", "12", "15"]}))
+    assert version.store_as_delta(FileContent.get_one(id=own.id))
+    version = FileContent.get_one(id=version.id)
+    assert version.uses_delta_layout
+    assert version.read_columns(["Bonus %"])["Bonus %"].tolist() == [5, 12, 15]
+
+
+def test_build_hierarchy_numbers_subtrees_and_flags_orphans_and_cycles():
+    roster = pd.DataFrame(
+        [
+            ("A", ""), ("B", "A"), ("C", "A"), ("D", "B"), ("E", "Z"),
+            ("F", "G"), ("G", "H"), ("H", "F"), ("B", "C"), ("", "A"), ("I", "I"), ("J", "I"),
+        ],
+        columns=["Employee ID", "Manager Employee ID"],
+        index=[f"record-{i}" for i in range(12)],
+    )
+    nodes = build_hierarchy(roster["Employee ID"], roster["Manager Employee ID"])
+    # rows without an Employee ID aren't placed
+    assert "record-9" not in nodes.index
+    placed = nodes[nodes["preorder"].notna()].set_index("employee_id")
+    assert placed.loc["A", ["preorder", "subtree_end", "depth"]].tolist() == [1, 4, 0]
+    # everyone under A, and only them, is numbered within A's range
+    under_a = placed[(placed["preorder"] > 1) & (placed["preorder"] <= 4)].index
+    assert sorted(under_a) == ["B", "C", "D"]
+    assert json.loads(placed.loc["D", "path"]) == ["A", "B"]
+
+    assert placed.loc["E", "issue"] == "orphan" and placed.loc["E", "depth"] == 0
+    # a cycle is broken at its first employee in file order
+    assert placed.loc[["F", "G", "H"], "issue"].tolist() == ["cycle"] * 3
+    assert placed.loc["F", "depth"] == 0 and json.loads(placed.loc["G", "path"]) == ["F", "H"]
+    assert placed.loc["I", "issue"] == "cycle" and placed.loc["J", "issue"] is None
+    assert nodes.loc["record-8", "issue"] == "duplicate"
+    assert sorted(placed["preorder"]) == list(range(1, 11))
+
+
+def test_generate_record_ids_matches_uuid5():
+    namespace = uuid.UUID("7d444840-9dc0-11d1-b245-5ffdce74fad2")
+    # crosses the 1 -> 2 and 2 -> 3 digit boundaries of the row positions
+    record_ids = record_ids_to_text(generate_record_ids(namespace, 5, 100))
+    assert list(record_ids) == [
+        str(uuid.uuid5(namespace, str(position))) for position in range(5, 105)
+    ]
+
+
+def test_generate_record_ids_matches_uuid5_for_random_namespaces():
+    random = np.random.default_rng(8)
+    for _ in range(20):
+        namespace = uuid.UUID(bytes=random.bytes(16))
+        start = int(random.integers(0, 10 ** 12))
+        record_ids = generate_record_ids(namespace, start, 50)
+        assert record_ids.dtype == np.uint8 and record_ids.shape == (50, 16)
+        assert [bytes(row) for row in record_ids] == [
+            uuid.uuid5(namespace, str(position)).bytes for position in range(start, start + 50)
+        ]
+
+
+def test_data_frame_csv_stream_formats_record_ids_as_it_writes():
+    namespace = uuid.uuid4()
+    frame = pd.DataFrame({"Employee ID": ["1", "2", "3"]})
+    stream = DataFrameCsvStream(frame, chunk_size=2, record_ids=generate_record_ids(namespace, 0, 3))
+    assert stream.read() == "".join(
+        f"{uuid.uuid5(namespace, str(position))},{position + 1}\n" for position in range(3)
+    )
+
+
+def test_infer_content_schema_and_widen():
+    frame = pd.DataFrame({
+        "Employee ID": ["10029", "10010"],
+        "Base Salary": ["57720", "40314.2"],
+        "Std Hours Worked per Week": ["20", ""],
+        "Date of Hire": ["1/1/99", "1/1/05"],
+        "Overtime Eligible": ["Y", "N"],
+        "Division": ["FIN", "SLS"],
+    })
+    schema = infer_content_schema(frame, text_columns=["Employee ID"])
+    assert {column: column_type["type"] for column, column_type in schema.items()} == {
+        "Employee ID": "text",
+        "Base Salary": "numeric",
+        "Std Hours Worked per Week": "integer",
+        "Date of Hire": "date",
+        "Overtime Eligible": "boolean",
+        "Division": "text",
+    }
+
+    db_values = to_db_values(frame, schema)
+    assert list(db_values["Date of Hire"]) == ["1999-01-01", "2005-01-01"]
+    assert list(db_values["Overtime Eligible"]) == ["true", "false"]
+    assert list(db_values["Std Hours Worked per Week"]) == ["20", None]
+
+    later_chunk = pd.DataFrame({"Std Hours Worked per Week": ["37.5"], "Date of Hire": ["TBD"]})
+    widened = widen_content_schema(schema, later_chunk)
+    assert widened["Std Hours Worked per Week"] == {"type": "numeric"}
+    assert widened["Date of Hire"] == {"type": "text"}
+
+
+def test_values_with_leading_zeros_stay_text():
+    frame = pd.DataFrame({
+        "Zip": ["02139", "10010"],
+        "Agent": ["007", "12"],
+        "Rate": ["00.5", "1.5"],
+        "Bonus": ["0", "5"],
+        "Ratio": ["0.5", "-0.25"],
+    })
+    schema = infer_content_schema(frame)
+    assert {column: column_type["type"] for column, column_type in schema.items()} == {
+        "Zip": "text", "Agent": "text", "Rate": "text", "Bonus": "integer", "Ratio": "numeric",
+    }
+    assert widen_content_schema(schema, pd.DataFrame({"Bonus": ["05"]}))["Bonus"] == {"type": "text"}
+
+
+def test_two_digit_years_are_not_placed_far_in_the_future():
+    this_year = datetime.date.today().year
+    frame = pd.DataFrame({"Date of Birth": ["1/1/68", "12/31/99", "2/29/00", f"6/1/{(this_year + 1) % 100:02d}"]})
+    schema = infer_content_schema(frame)
+    assert schema["Date of Birth"] == {"type": "date", "format": "%m/%d/%y"}
+    assert list(to_db_values(frame, schema)["Date of Birth"]) == [
+        "1968-01-01", "1999-12-31", "2000-02-29", f"{this_year + 1}-06-01",
+    ]
+
+
+def test_parse_filter_binds_values():
+    where = parse_filter(
+        """"Job Code" = 'O''NEIL' AND NOT ("Base Salary" >= 50000 OR Region IN ('A', 'B'))""",
+        ["Job Code", "Base Salary", "Region"],
+    )
+    compiled = where.compile(dialect=postgresql.dialect())
+    assert str(compiled) == (
+        '"Job Code" = %(param_1)s AND NOT ("Base Salary" >= %(param_2)s'
+        ' OR "Region" IN (%(param_3)s, %(param_4)s))'
+    )
+    assert compiled.params == {
+        "param_1": "O'NEIL", "param_2": "50000", "param_3": "A", "param_4": "B"
+    }
+
+
+def test_parse_filter_rejects_unknown_columns_and_syntax():
+    for expression in ['"Salary" = 1', "\"Job Code\" = 1; DROP TABLE x", '"Job Code" =', "Job Code = 'x'"]:
+        try:
+            parse_filter(expression, ["Job Code"])
+        except FilterSyntaxError:
+            continue
+        raise AssertionError(f"accepted {expression!r}")
+
+
+def test_parse_filter_on_a_percent_header(save_content):
+    file_content = save_content(pd.DataFrame({"Employee ID": ["E1", "E2", "E3"], "Bonus %": ["5", "10", "15"]}))
+    where = parse_filter('"Bonus %" >= 10', file_content.content_headers)
+    assert str(where.compile(dialect=postgresql.dialect())) == '"Bonus %%" >= %(param_1)s'
+    rows = list(FileContent.get_one(id=file_content.id).iter_rows(["Bonus %"], where))
+    assert [row[-1] for row in rows] == [10, 15]
+
+
+def test_iter_json_page_reports_next_cursor():
+    rows = [(1, "a", "x"), (2, "b", None), (5, "c", "z")]
+    page = json.loads("".join(iter_json_page(["__record_ids__", "Job Code"], iter(rows), 2)))
+    assert page["rows"] == [
+        {"__record_ids__": "a", "Job Code": "x"}, {"__record_ids__": "b", "Job Code": None}
+    ]
+    assert page["next_cursor"] == 2
+    page = json.loads("".join(iter_json_page(["__record_ids__", "Job Code"], iter(rows), 3)))
+    assert page["next_cursor"] is None
+
+
+def test_gzip_blocks_is_one_gzip_stream():
+    blocks = [b"__record_ids__,Job Code\n", b"a,41111\n" * 1000, b"b,41112\n"]
+    compressed = list(gzip_blocks(iter(blocks)))
+    # the first block isn't held back by the compressor
+    assert compressed[0]
+    assert gzip.decompress(b"".join(compressed)) == b"".join(blocks)
+
+
+def test_parquet_export_writes_row_groups_as_they_come():
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(
+        ["__index__", "__record_ids__", "Employee ID", "Hire Date", "Salary"],
+        {"Hire Date": {"type": DATE}, "Salary": {"type": NUMERIC}},
+    )
+    assert schema.field("__index__").type == pa.int64()
+    assert schema.field("Employee ID").type == pa.string()
+    assert schema.field("Hire Date").type == pa.date32()
+    assert schema.field("Salary").type == pa.float64()
+
+    sink = _DrainableBuffer()
+    drained = []
+    with pq.ParquetWriter(sink, schema) as writer:
+        for start in (1, 3):
+            writer.write_table(pa.table({
+                "__index__": [start, start + 1],
+                "__record_ids__": ["a", "b"],
+                "Employee ID": ["0001", None],
+                "Hire Date": [datetime.date(2020, 1, start), None],
+                "Salary": [1.5, 2.0],
+            }, schema=schema))
+            drained.append(sink.drain())
+    drained.append(sink.drain())
+    assert all(drained)
+
+    parquet_file = pq.ParquetFile(pa.BufferReader(b"".join(drained)))
+    assert parquet_file.num_row_groups == 2
+    row_group = parquet_file.read_row_group(1, use_threads=False)
+    assert row_group.column("__index__").to_pylist() == [3, 4]
+    assert row_group.column("Employee ID").to_pylist() == ["0001", None]
+
+
+def test_exports_of_percent_headers(save_content):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    file_content = save_content(pd.DataFrame({"Employee ID": ["E1", "E2"], "Bonus %": ["5", "10"]}))
+    file_content = FileContent.get_one(id=file_content.id)
+    select_sql = file_content.export_select(["Bonus %"])
+    assert '"Bonus %"' in select_sql
+
+    exported = b"".join(iter_csv_export(db.engine, select_sql)).decode()
+    assert [line.split(",")[1] for line in exported.splitlines()] == ["Bonus %", "5", "10"]
+    schema = arrow_schema(file_content.export_columns(["Bonus %"]), file_content.content_schema)
+    parquet = pq.read_table(pa.BufferReader(b"".join(iter_parquet_export(db.engine, select_sql, schema))))
+    assert parquet.column("Bonus %").to_pylist() == [5, 10]
+
+
+def test_generate_roster_matches_template_schema_and_dirties_keys():
+    template = read_template_roster()
+    roster = generate_roster(1000, start=500, dirty_key_rate=0.2, seed=3, template=template)
+    assert list(roster.columns) == list(template.columns)
+    assert roster.shape == (1000, 62)
+
+    clean = KeyNormalizer()(roster)
+    assert clean["Employee ID"].tolist() == [f"E{i:07d}" for i in range(500, 1500)]
+    assert (clean["Manager Employee ID"] < clean["Employee ID"]).all()
+    assert 0.1 < (roster["Employee ID"] != clean["Employee ID"]).mean() < 0.3
+    pd.testing.assert_frame_equal(
+        roster, generate_roster(1000, start=500, dirty_key_rate=0.2, seed=3, template=template)
+    )
+
+
+def test_time_phase_collects_upload_timings_and_renders_metrics():
+    samples = INGEST_PHASE_SECONDS.count(phase="parse")
+    with collect_upload_timings() as timings:
+        with time_phase("parse"):
+            pass
+        chunks = list(timed_iter(iter([1, 2]), "parse"))
+        assert INGEST_PHASE_SECONDS.count(phase="parse") == samples
+    assert chunks == [1, 2]
+    assert set(timings.to_dict()["phases"]) == {"parse"}
+    # one sample per upload, however many chunks it was parsed in
+    assert INGEST_PHASE_SECONDS.count(phase="parse") == samples + 1
+
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ["route"])
+    requests.inc(route="/metrics")
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    latency.observe(0.5)
+    rendered = registry.render()
+    assert 'requests_total{route="/metrics"} 1' in rendered
+    assert 'latency_seconds_bucket{le="0.1"} 0' in rendered
+    assert 'latency_seconds_bucket{le="1"} 1' in rendered
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in rendered
+    assert "latency_seconds_count 1" in rendered
+
+
+def test_parse_and_normalize_matches_key_normalizer():
+    csv_path = os.path.join(os.path.dirname(__file__), 'data/processed/employee-test.csv')
+    data_frame, change_counts, phases = parse_and_normalize(csv_path, 'text/csv', 40)
+
+    key_normalizer = KeyNormalizer()
+    expected = key_normalizer(pd.read_csv(csv_path, dtype=str, keep_default_na=False))
+    pd.testing.assert_frame_equal(data_frame, expected)
+    assert change_counts == key_normalizer.change_counts
+    assert set(phases) == {"parse", "normalize_keys"}
+
+
+def test_batch_file_roll_back_keeps_failures():
+    ingested, failed = BatchFile("a.csv"), BatchFile("b.csv")
+    ingested.upload_file_id = uuid.uuid4()
+    failed.fail(BATCH_FAILED, "Failed to parse")
+    for batch_file in (ingested, failed):
+        batch_file.roll_back()
+    assert ingested.to_dict()["status"] == BATCH_ROLLED_BACK
+    assert ingested.to_dict()["upload_file_id"] is None
+    assert failed.to_dict()["status"] == BATCH_FAILED
+
+
+def test_read_cache_evicts_least_recently_used_and_expires():
+    now = [0.0]
+    cache = ReadCache(max_size=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.put(("UploadFile", "one", 1), "a")
+    cache.put(("UploadFile", "one", 2), "b")
+    assert cache.get(("UploadFile", "one", 1)) == "a"
+    cache.put(("FileContent", "one", 3), "c")
+    assert cache.get(("UploadFile", "one", 2)) is MISS
+    assert cache.get(("UploadFile", "one", 1)) == "a"
+
+    cache.invalidate("UploadFile")
+    assert cache.get(("UploadFile", "one", 1)) is MISS
+    assert cache.get(("FileContent", "one", 3)) == "c"
+    now[0] = 10.0
+    assert cache.get(("FileContent", "one", 3)) is MISS
+
+
+def test_get_many_by_primary_keys_compares_uuids_natively():
+    primary_key = uuid.uuid4()
+    compiled = UploadFile._primary_keys_clause([primary_key]).compile(dialect=postgresql.dialect())
+    assert str(compiled) == "upload_file.id = ANY (%(primary_keys)s::UUID[])"
+    assert compiled.params == {"primary_keys": [primary_key]}
+
+
+def test_content_table_definition_does_not_keep_the_content():
+    frame = pd.DataFrame({"Employee ID": ["E1", "E2"], "Base Salary": ["10", "20"]})
+    with app.app_context():
+        file_content = FileContent(upload_file_id=uuid.uuid4(), name="roster.csv", content=frame)
+        table = file_content._content_table
+        content = weakref.ref(file_content._content)
+        del frame
+        file_content._content = None
+        gc.collect()
+
+    assert content() is None
+    assert {"Employee ID", "Base Salary"} <= set(table.columns.keys())
+
+
+def test_update_content_marks_only_changed_rows():
+    frame = pd.DataFrame({
+        "Employee ID": ["E1", "E2", "E3"],
+        "Hourly Rate": [None, "20.5", None],
+        "Base Salary": [None, "100", "200"],
+    })
+    with app.app_context():
+        file_content = FileContent(upload_file_id=uuid.uuid4(), name="roster.csv", content=frame)
+        file_content._dirty_record_ids = set()
+        record_ids = file_content.content.index
+        update = pd.DataFrame(
+            {"Employee ID": ["E1", "X2", "E3"], "Base Salary": [None, "100", "250"]},
+            index=record_ids,
+        )
+        file_content.update_content(update)
+
+    # rows whose missing values stay missing aren't changed
+    assert file_content._dirty_record_ids == {record_ids[1], record_ids[2]}
+    assert file_content._should_update_db_content
+
+
+def test_upload_of_the_same_bytes_is_a_duplicate_before_parsing(database, monkeypatch):
+    data = f"Employee ID,Base Salary\nE{uuid.uuid4().hex},10\n".encode()
+
+    def upload():
+        response = app.test_client().post(
+            "/processUpload",
+            data={"file": (io.BytesIO(data), "roster.csv")},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 200
+        return response.get_json()
+
+    first = upload()
+    try:
+        def parse(*args, **kwargs):
+            raise AssertionError("a duplicate upload was parsed")
+
+        monkeypatch.setattr("app._save_file_contents", parse)
+        second = upload()
+        assert second["duplicate"] and not first["duplicate"]
+        assert (second["upload_file_id"], second["file_content_id"]) == (
+            first["upload_file_id"], first["file_content_id"]
+        )
+    finally:
+        _remove_upload_file(UploadFile.get_one(id=uuid.UUID(first["upload_file_id"])))
+
+
+def test_upload_jobs_are_claimed_once_queued_or_after_their_lease_ran_out(queue_upload_job):
+    roster = "Employee ID,Base Salary\nE1,10\n"
+    fresh = queue_upload_job(roster, datetime.datetime(1999, 1, 1), state=JOB_RUNNING, attempts=1)
+    fresh.modified_utc = datetime.datetime.now(datetime.timezone.utc)
+    fresh.save()
+    queued = queue_upload_job(roster, datetime.datetime(2000, 1, 1))
+    stale = queue_upload_job(roster, datetime.datetime(2000, 1, 2), state=JOB_RUNNING, attempts=1)
+
+    claimed = UploadJob.claim_next(lease_seconds=60)
+    assert (claimed.id, claimed.state, claimed.attempts) == (queued.id, JOB_RUNNING, 1)
+    reclaimed = UploadJob.claim_next(lease_seconds=60)
+    assert (reclaimed.id, reclaimed.state, reclaimed.attempts) == (stale.id, JOB_RUNNING, 2)
+    assert UploadJob.get_one(id=fresh.id).attempts == 1
+
+
+def test_upload_worker_runs_jobs_and_cleans_up_after_failures(queue_upload_job, monkeypatch):
+    pool = UploadWorkerPool(app, _run_upload_job, lease_seconds=60)
+    succeeding = queue_upload_job("Employee ID,Base Salary\nE1,10\nE2,20\n", datetime.datetime(2000, 1, 1))
+    failing = queue_upload_job("Employee ID,Base Salary\nE3,30\n", datetime.datetime(2000, 1, 2))
+
+    assert pool.run_next_job()
+    succeeded = UploadJob.get_one(id=succeeding.id)
+    assert (succeeded.state, succeeded.rows_processed) == (JOB_SUCCEEDED, 2)
+    assert FileContent.get_one(id=succeeded.file_content_id).record_count == 2
+
+    def fail(file_content):
+        raise RuntimeError("hierarchy")
+
+    # fails once the content is stored, which is then deleted again
+    monkeypatch.setattr("app._index_org_hierarchy", fail)
+    assert pool.run_next_job()
+    failed = UploadJob.get_one(id=failing.id)
+    assert (failed.state, failed.error) == (JOB_FAILED, "RuntimeError: hierarchy")
+    assert FileContent.get_one(upload_file_id=failing.upload_file_id) is None